@@ -28,6 +28,16 @@ then
   exit 1
 fi
 
+psv=`python3 -c "import numpy"`
+ret=$?
+if 
+  [ $ret -ne 0 ]
+then
+  echo 'Error! Python numpy package not properly installed'
+  echo 'Aborted.'
+  exit 1
+fi
+
 psv=`python3 -c "import click"`
 ret=$?
 if 
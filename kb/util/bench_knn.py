@@ -0,0 +1,121 @@
+'''
+bench_knn: compares the linear scan and the ball tree for computing the
+k-nearest neighbours of a problem, on synthetic knowledge bases of increasing
+size.
+
+Usage: python bench_knn.py [OPTIONS]
+
+Options:
+
+  -h, --help
+    Print this message
+
+  -n <SIZES>
+    Comma-separated list of the knowledge base sizes to test.
+    By default, 1000,5000,20000,50000,100000,200000
+
+  -d <FEATURES>
+    Number of features of each instance. By default, 100.
+
+  -r <DIM>
+    Intrinsic dimension of the synthetic feature vectors, which are random
+    linear projections in [-1, 1] of <DIM>-dimensional points. Real feature
+    vectors are highly correlated, so their intrinsic dimension is much lower
+    than the number of features. By default, 8.
+
+  -k <SIZE>
+    Neighbourhood size. By default, it is the square root of the knowledge
+    base size (as in sunny-cp).
+
+  -q <QUERIES>
+    Number of queries for each knowledge base size. By default, 50.
+'''
+
+import sys
+import time
+import getopt
+import numpy
+from helper_kb import *
+from knowledge_base import KnowledgeBase
+from balltree import build_balltree
+
+
+def synthetic_features(n, d, r, rng):
+    """
+    Returns a n x d features matrix with intrinsic dimension r, scaled in
+    [-1, 1] as the features of a knowledge base.
+    """
+    points = rng.uniform(-1, 1, (n, r)).dot(rng.normal(size=(r, d)))
+    lb = points.min(axis=0)
+    ub = points.max(axis=0)
+    return numpy.ascontiguousarray(2 * (points - lb) / (ub - lb) - 1)
+
+
+def main(args):
+
+    try:
+        opts, args = getopt.getopt(args, 'hn:d:r:k:q:', ['help'])
+    except getopt.error as msg:
+        print(msg)
+        print('For help use --help', file=sys.stderr)
+        sys.exit(2)
+
+    sizes = [1000, 5000, 20000, 50000, 100000, 200000]
+    d = 100
+    r = 8
+    k = 0
+    queries = 50
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            print(__doc__)
+            return
+        elif o == '-n':
+            sizes = [int(n) for n in a.split(',')]
+        elif o == '-d':
+            d = int(a)
+        elif o == '-r':
+            r = int(a)
+        elif o == '-k':
+            k = int(a)
+        elif o == '-q':
+            queries = int(a)
+
+    rng = numpy.random.default_rng(0)
+    print('%10s %10s %12s %12s %10s' % (
+        'size', 'build (s)', 'scan (ms)', 'tree (ms)', 'speedup'
+    ))
+    crossover = None
+    for n in sizes:
+        features = synthetic_features(n + queries, d, r, rng)
+        kb = KnowledgeBase.__new__(KnowledgeBase)
+        kb.features = features[:n]
+        kb.insts = numpy.arange(n)
+        start = time.time()
+        tree = build_balltree(kb.features)
+        build_time = time.time() - start
+        nn = k if k > 0 else int(round(n ** 0.5))
+        scan_time = 0.0
+        tree_time = 0.0
+        for fv in features[n:]:
+            start = time.time()
+            a = kb.scan(fv, nn)
+            scan_time += time.time() - start
+            start = time.time()
+            b = tree.query(kb.features, fv, nn)
+            tree_time += time.time() - start
+            assert numpy.array_equal(a, b)
+        speedup = scan_time / tree_time
+        if speedup > 1 and crossover is None:
+            crossover = n
+        print('%10d %10.2f %12.3f %12.3f %10.2f' % (
+            n, build_time, 1000 * scan_time / queries,
+            1000 * tree_time / queries, speedup
+        ))
+    if crossover is None:
+        print('The ball tree is never faster than the linear scan.')
+    else:
+        print('The ball tree is faster from', crossover, 'instances on.')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
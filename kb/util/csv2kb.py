@@ -38,6 +38,9 @@ Options:
 
   --no-check
     Not performs consistency checks.
+
+  --no-bin
+    Not creates the binary form of the knowledge base (see kbconvert.py).
 '''
 
 import getopt
@@ -50,7 +53,8 @@ def main(args):
     # Getting arguments.
     try:
         opts, args = getopt.getopt(
-            args, 'ht:p:s:a:f:', ['help', 'no-scale', 'no-const', 'no-check']
+            args, 'ht:p:s:a:f:',
+            ['help', 'no-scale', 'no-const', 'no-check', 'no-bin']
         )
     except getopt.error as msg:
         print(msg)
@@ -81,6 +85,7 @@ def main(args):
     scale = True
     const = True
     check = True
+    binary = True
 
     # Arguments parsing.
     for o, a in opts:
@@ -129,6 +134,8 @@ def main(args):
             const = False
         elif o == '--no-check':
             check = False
+        elif o == '--no-bin':
+            binary = False
 
     kb_path = path + '/' + kb_name
     if os.path.exists(kb_path):
@@ -148,6 +155,8 @@ def main(args):
             kb_path, kb_name, feat_file, lb_feat, ub_feat,
             scale, const, kb_csp, kb_cop
         )
+        if binary:
+            make_bin_kb(kb_path, kb_name)
     except Exception as e:
         traceback.print_exc()
         if os.path.exists(kb_path):
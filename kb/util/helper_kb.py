@@ -7,6 +7,10 @@ import ast
 import csv
 import sys
 import json
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from knowledge_base import csv_to_bin
 
 
 def compute_infos(
@@ -189,12 +193,10 @@ def make_kb(kb_path, kb_name, feat_file, lb, ub, scale, const, kb_csp, kb_cop):
     reader = csv.reader(open(feat_file, 'r'), delimiter='|')
     os.mkdir(kb_path)
     print('Created the knowledge base folder:', kb_path)
-    csp_writer = csv.writer(
-        open(kb_path + '/' + kb_name + '_csp', 'w'), delimiter='|'
-    )
-    cop_writer = csv.writer(
-        open(kb_path + '/' + kb_name + '_cop', 'w'), delimiter='|'
-    )
+    csp_file = open(kb_path + '/' + kb_name + '_csp', 'w')
+    cop_file = open(kb_path + '/' + kb_name + '_cop', 'w')
+    csp_writer = csv.writer(csp_file, delimiter='|')
+    cop_writer = csv.writer(cop_file, delimiter='|')
     features = {}
     lims_csp = {}
     lims_cop = {}
@@ -261,7 +263,11 @@ def make_kb(kb_path, kb_name, feat_file, lb, ub, scale, const, kb_csp, kb_cop):
                 new_feat_vector.append(new_val)
             kb_row = [inst, new_feat_vector, info]
             writer.writerow(kb_row)
+        csp_file.close()
+        cop_file.close()
     else:
+        csp_file.close()
+        cop_file.close()
         print('Features processed!')
         return
 
@@ -276,3 +282,12 @@ def make_kb(kb_path, kb_name, feat_file, lb, ub, scale, const, kb_csp, kb_cop):
         print('and removed constant features!')
     else:
         print('and scaled all values!')
+
+
+def make_bin_kb(kb_path, kb_name):
+    """
+    Creates the binary form of the CSP/COP knowledge bases in kb_path.
+    """
+    print('Creating the binary knowledge base...')
+    for pb in ['csp', 'cop']:
+        csv_to_bin(kb_path + '/' + kb_name + '_' + pb)
@@ -0,0 +1,97 @@
+'''
+kbconvert: converts a knowledge base from the CSV form to the binary form, or
+vice versa (see the README file in the kb folder).
+
+Usage: python kbconvert.py [OPTIONS] <KB_PATH>
+
+where <KB_PATH> is the path of the folder containing the knowledge base.
+
+Options:
+
+  -h, --help
+    Print this message
+
+  -r, --reverse
+    Converts the binary form of the knowledge base into the CSV form. By
+    default, the CSV form is converted into the binary form.
+
+  -i <NLIST>,<NPROBE>
+    Also builds the approximate index of the binary knowledge base, used by
+    sunny-cp with the option -N approx. The instances are clustered in <NLIST>
+    clusters, and a query scans the <NPROBE> clusters closer to the problem.
+    By default (i.e., when a value is 0), <NLIST> is 4 times the square root
+    of the knowledge base size and <NPROBE> is <NLIST> / 16.
+    Use knn_recall.py for measuring the recall of the approximate index.
+'''
+
+import getopt
+import traceback
+from helper_kb import *
+from knowledge_base import bin_path, bin_to_csv, load_npy
+from ivf import build_ivf
+
+
+def main(args):
+
+    # Getting arguments.
+    try:
+        opts, args = getopt.getopt(args, 'hri:', ['help', 'reverse'])
+    except getopt.error as msg:
+        print(msg)
+        print('For help use --help', file=sys.stderr)
+        sys.exit(2)
+
+    if len(args) != 1:
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print(__doc__)
+                sys.exit(0)
+        print('Error! Wrong number of arguments.', file=sys.stderr)
+        print('For help use --help', file=sys.stderr)
+        sys.exit(2)
+
+    reverse = False
+    ivf = None
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            print(__doc__)
+            return
+        elif o in ('-r', '--reverse'):
+            reverse = True
+        elif o == '-i':
+            ivf = [int(x) for x in a.split(',')]
+            if len(ivf) != 2 or min(ivf) < 0:
+                print('Error! Wrong approximate index parameters', a,
+                      file=sys.stderr)
+                sys.exit(2)
+
+    path = args[0]
+    if not os.path.isdir(path):
+        print('Error! Folder', path, 'does not exists.', file=sys.stderr)
+        sys.exit(2)
+    name = [token for token in path.split('/') if token][-1]
+    kb = path.rstrip('/') + '/' + name
+
+    try:
+        for pb in ['csp', 'cop']:
+            if reverse and os.path.isdir(bin_path(kb + '_' + pb)):
+                print('Converting', bin_path(kb + '_' + pb), '...')
+                bin_to_csv(kb + '_' + pb)
+            elif not reverse and os.path.exists(kb + '_' + pb):
+                print('Converting', kb + '_' + pb, '...')
+                csv_to_bin(kb + '_' + pb)
+            if ivf and os.path.isdir(bin_path(kb + '_' + pb)):
+                path = bin_path(kb + '_' + pb)
+                print('Building the approximate index of', path, '...')
+                features = load_npy(path + '/features.npy')
+                build_ivf(features, ivf[0], ivf[1]).save(path)
+    except Exception as e:
+        traceback.print_exc()
+        print('Knowledge base', name, 'not converted')
+        sys.exit(1)
+
+    print('Knowledge base', name, 'converted')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
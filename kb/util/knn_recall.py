@@ -0,0 +1,131 @@
+'''
+knn_recall: measures the recall@k of the approximate k-NN index (see the -i
+option of kbconvert.py) with respect to the exact k-NN, on a held-out set of
+instances of a knowledge base.
+
+The approximate index is built on the knowledge base without the held-out
+instances, which are then used as queries. The recall@k of a query is the
+fraction of its exact k nearest neighbours also returned by the approximate
+index.
+
+Usage: python knn_recall.py [OPTIONS] <KB_PATH>
+
+where <KB_PATH> is the path of the folder containing the knowledge base.
+
+Options:
+
+  -h, --help
+    Print this message
+
+  -g <GOAL>
+    Either csp or cop, for using the CSP or the COP knowledge base.
+    By default, cop.
+
+  -i <NLIST>,<NPROBE>
+    Parameters of the approximate index, as in kbconvert.py. By default, 0,0.
+
+  -k <SIZE>
+    Neighbourhood size. By default, it is the square root of the knowledge
+    base size (as in sunny-cp).
+
+  -t <FRACTION>
+    Fraction of the instances held out as queries. By default, 0.1
+
+  -q <QUERIES>
+    Maximum number of queries. By default, 1000.
+
+  -n <SIZE>
+    Uses a synthetic knowledge base of <SIZE> instances (see bench_knn.py)
+    instead of the one in <KB_PATH>, which must be omitted.
+'''
+
+import sys
+import time
+import getopt
+import numpy
+from helper_kb import *
+from knowledge_base import KnowledgeBase, load_kb
+from bench_knn import synthetic_features
+from ivf import build_ivf
+
+
+def main(args):
+
+    try:
+        opts, args = getopt.getopt(args, 'hg:i:k:t:q:n:', ['help'])
+    except getopt.error as msg:
+        print(msg)
+        print('For help use --help', file=sys.stderr)
+        sys.exit(2)
+
+    goal = 'cop'
+    params = [0, 0]
+    k = 0
+    fraction = 0.1
+    queries = 1000
+    size = 0
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            print(__doc__)
+            return
+        elif o == '-g':
+            goal = a
+        elif o == '-i':
+            params = [int(x) for x in a.split(',')]
+        elif o == '-k':
+            k = int(a)
+        elif o == '-t':
+            fraction = float(a)
+        elif o == '-q':
+            queries = int(a)
+        elif o == '-n':
+            size = int(a)
+
+    rng = numpy.random.default_rng(0)
+    if size > 0 and not args:
+        features = synthetic_features(size, 100, 8, rng)
+    elif size == 0 and len(args) == 1:
+        name = [token for token in args[0].split('/') if token][-1]
+        path = args[0].rstrip('/') + '/' + name + '_' + goal
+        features = numpy.asarray(load_kb(path).features)
+    else:
+        print('Error! Wrong number of arguments.', file=sys.stderr)
+        print('For help use --help', file=sys.stderr)
+        sys.exit(2)
+
+    n = features.shape[0]
+    perm = rng.permutation(n)
+    held_out = perm[:min(int(n * fraction), queries)]
+    kb = KnowledgeBase.__new__(KnowledgeBase)
+    kb.features = numpy.ascontiguousarray(
+        features[numpy.sort(perm[len(held_out):])]
+    )
+    kb.insts = numpy.arange(kb.features.shape[0])
+    if k <= 0:
+        k = int(round(len(kb) ** 0.5))
+
+    start = time.time()
+    ivf = build_ivf(kb.features, params[0], params[1])
+    print('Approximate index built in', round(time.time() - start, 2), 's:',
+          ivf.params)
+    recall = 0.0
+    exact_time = 0.0
+    approx_time = 0.0
+    for fv in features[held_out]:
+        start = time.time()
+        exact = kb.scan(fv, k)
+        exact_time += time.time() - start
+        start = time.time()
+        approx = ivf.query(kb.features, fv, k)
+        approx_time += time.time() - start
+        recall += len(numpy.intersect1d(exact, approx)) / float(k)
+    q = len(held_out)
+    print('Knowledge base size:', len(kb), '- Queries:', q, '- k:', k)
+    print('recall@k: %.4f' % (recall / q))
+    print('Exact k-NN: %.3f ms/query - Approximate k-NN: %.3f ms/query' % (
+        1000 * exact_time / q, 1000 * approx_time / q
+    ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
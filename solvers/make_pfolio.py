@@ -2,6 +2,13 @@
 '''
 Module for creating a default portfolio by automatically generating the
 src/pfolio_solvers.py file from the files .solv in this folder
+
+The constraint used for injecting a bound in the FlatZinc models of a solver
+is found by compiling constraint.mzn with the solver. The solvers are probed
+in parallel, and their constraints are cached in pfolio_cache.db, keyed by the
+contents of constraint.mzn and by the signature of the MiniZinc library of the
+solver (see src/compilation.py): when the portfolio is generated again, only
+the new solvers and the solvers whose library has changed are probed.
 '''
 
 import os
@@ -9,50 +16,99 @@ import sys
 import json
 import psutil
 from subprocess import PIPE
+from concurrent.futures import ProcessPoolExecutor
 
 SUNNY_HOME = os.path.realpath(__file__).split('/')[:-2]
 SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from cache import Cache, make_key
+from compilation import lib_signature
+from features import file_digest
+
 pfolio_path = SUNNY_HOME + '/src/pfolio_solvers.py'
-pfolio_file = open(pfolio_path, 'w')
+solvers_path = SUNNY_HOME + '/solvers/'
 
-preamble = "'''\nThis module is automatically generated by make_pfolio.py. " \
-    + "Don't modify it!\n'''\n\n"
-pfolio_file.write(preamble)
+# Path and maximum size (in bytes) of the cache of the solvers constraints.
+CACHE_PATH = solvers_path + 'pfolio_cache.db'
+CACHE_SIZE = 1 << 20
 
-solvers_path = SUNNY_HOME + '/solvers/'
-solver_files = [
-    f for f in os.walk(solvers_path).__next__()[2] if f.endswith('.solv')
-]
-DEF_PFOLIO = {}
-for solver_file in solver_files:
-    versions = json.load(open(solvers_path + solver_file))['versions']
-    for solver in versions:
-        print('Adding solver', solver['name'])
-        solv = solver_file[:solver_file.index('.solv')]
-        DEF_PFOLIO[solver['id']] = {
-            'solver': solv,
-            'name': solver['name'],
-            'conv_opts': solver['conv_opts'],
-            'solv_opts': solver['solv_opts']
-        }
-        cmd = [
-            'minizinc', '-c', '--solver', solv, '--output-to-stdout',
-            '--no-output-ozn', solvers_path + 'constraint.mzn'
-        ]
-        proc = psutil.Popen(cmd, stdout=PIPE, stderr=PIPE)
-        out, err = proc.communicate()
-        if proc.returncode != 0:
-            print(err)
-            print('Error! Solver', solver, 'not installed')
-            sys.exit(1)
-        for line in out.decode().split(';\n'):
-            intro = 'X_INTRODUCED_0_ = '
-            idx = line.find(intro)
-            if idx >= 0:
-                val = line[idx + len(intro):]
-            elif 'constraint' in line:
-                line = line.replace('X_INTRODUCED_0_', val)
-                constraint = DEF_PFOLIO[solver['id']]['constraint'] = line
-                break
-pfolio_file.write('DEF_PFOLIO = ' + str(DEF_PFOLIO))
-pfolio_file.write('\n\n')
+
+def probe_constraint(solv):
+    """
+    Compiles constraint.mzn with the solver solv, and returns the pair
+    (constraint, error) where constraint is the solver-specific FlatZinc
+    constraint LHS < RHS (or None, if the compilation fails with error).
+    """
+    cmd = [
+        'minizinc', '-c', '--solver', solv, '--output-to-stdout',
+        '--no-output-ozn', solvers_path + 'constraint.mzn'
+    ]
+    proc = psutil.Popen(cmd, stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        return None, err
+    for line in out.decode().split(';\n'):
+        intro = 'X_INTRODUCED_0_ = '
+        idx = line.find(intro)
+        if idx >= 0:
+            val = line[idx + len(intro):]
+        elif 'constraint' in line:
+            return line.replace('X_INTRODUCED_0_', val), ''
+    return None, 'No constraint found in the FlatZinc model'
+
+
+def main():
+    solver_files = [
+        f for f in os.walk(solvers_path).__next__()[2] if f.endswith('.solv')
+    ]
+    DEF_PFOLIO = {}
+    for solver_file in solver_files:
+        versions = json.load(open(solvers_path + solver_file))['versions']
+        for solver in versions:
+            print('Adding solver', solver['name'])
+            solv = solver_file[:solver_file.index('.solv')]
+            DEF_PFOLIO[solver['id']] = {
+                'solver': solv,
+                'name': solver['name'],
+                'conv_opts': solver['conv_opts'],
+                'solv_opts': solver['solv_opts']
+            }
+
+    # The constraint of a solver does not depend on its version.
+    solvs = sorted(set(s['solver'] for s in DEF_PFOLIO.values()))
+    cache = Cache(CACHE_PATH, CACHE_SIZE)
+    digest = file_digest(solvers_path + 'constraint.mzn')
+    keys = {}
+    constraints = {}
+    for solv in solvs:
+        signature = lib_signature(solv)
+        if signature is not None:
+            keys[solv] = make_key('constraint', digest, signature)
+            constraints[solv] = cache.get(keys[solv])
+    probed = [s for s in solvs if constraints.get(s) is None]
+    with ProcessPoolExecutor() as pool:
+        for solv, (constraint, err) in zip(
+            probed, pool.map(probe_constraint, probed)
+        ):
+            if constraint is None:
+                print(err)
+                print('Error! Solver', solv, 'not installed')
+                sys.exit(1)
+            constraints[solv] = constraint
+            if solv in keys:
+                cache.put(keys[solv], constraint)
+    print('Probed', len(probed), 'solvers out of', len(solvs))
+    print('Constraints cache:', cache.stats())
+    for solver in DEF_PFOLIO.values():
+        solver['constraint'] = constraints[solver['solver']]
+
+    preamble = "'''\nThis module is automatically generated by " \
+        + "make_pfolio.py. Don't modify it!\n'''\n\n"
+    with open(pfolio_path, 'w') as pfolio_file:
+        pfolio_file.write(preamble)
+        pfolio_file.write('DEF_PFOLIO = ' + str(DEF_PFOLIO))
+        pfolio_file.write('\n\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+'''
+Module for pinning the processes of the running solvers to dedicated cores
+(see the --pin option of sunny-cp), so that a solver does not migrate across
+cores and NUMA nodes, and keeps its cache locality even when it is suspended
+and then resumed.
+
+Each running solver takes one of the cores on which sunny-cp is allowed to
+run: its process tree is then pinned either to that core ('core' mode) or to
+the cores of its NUMA node ('numa' mode), where the node of a core is read
+from /sys/devices/system/node. When a solver is suspended or terminated, its
+core is freed and given to the next solver. A resumed or restarted solver
+gets back its previous core, if it is still free.
+'''
+
+import os
+import glob
+import psutil
+
+# Folder of the NUMA nodes of the system.
+NODES_PATH = '/sys/devices/system/node'
+
+# Pinning modes.
+PIN_MODES = ['core', 'numa']
+
+
+def parse_cpulist(text):
+    """
+    Returns the list of the CPUs of a CPU list string, e.g., '0-3,8,10-11'.
+    """
+    cpus = []
+    for item in text.strip().split(','):
+        if '-' in item:
+            first, last = item.split('-')
+            cpus += list(range(int(first), int(last) + 1))
+        elif item:
+            cpus.append(int(item))
+    return cpus
+
+
+def numa_nodes(cores):
+    """
+    Returns the list of the NUMA nodes of the given cores, i.e., a partition
+    of cores where each set contains the cores of a node. If the NUMA
+    topology is unknown, all the cores are in a single node.
+    """
+    nodes = []
+    for path in sorted(glob.glob(NODES_PATH + '/node[0-9]*/cpulist')):
+        with open(path, 'r') as infile:
+            node = set(parse_cpulist(infile.read())) & set(cores)
+        if node:
+            nodes.append(node)
+    placed = set().union(*nodes)
+    if placed != set(cores):
+        nodes.append(set(cores) - placed)
+    return nodes
+
+
+def set_affinity(proc, cpus):
+    """
+    Pins the psutil process proc, and all its descendants, to the set of
+    CPUs cpus. The processes that are already terminated are ignored.
+    """
+    # The parent is pinned first, so that the children it forks from now on
+    # inherit its affinity. The children forked meanwhile are pinned by
+    # listing the descendants again, until no new process appears.
+    pinned = set()
+    procs = [proc]
+    while procs:
+        for p in procs:
+            try:
+                os.sched_setaffinity(p.pid, cpus)
+            except (OSError, psutil.NoSuchProcess):
+                pass
+            pinned.add(p.pid)
+        try:
+            procs = [
+                p for p in proc.children(recursive=True)
+                if p.pid not in pinned
+            ]
+        except psutil.NoSuchProcess:
+            return
+
+
+class CorePool:
+    """
+    CorePool assigns a dedicated core to each running solver.
+    """
+
+    # Pinning mode, i.e., 'core' or 'numa'.
+    mode = 'core'
+
+    # Sorted list of the cores on which sunny-cp is allowed to run.
+    cores = None
+
+    # Dictionary (core, node) mapping a core to the set of the cores of its
+    # NUMA node.
+    node_of = None
+
+    # Dictionary (core, owner) of the cores taken by the running solvers.
+    owners = None
+
+    # Dictionary (owner, core) of the last core taken by each solver.
+    last = None
+
+    def __init__(self, mode, cores=None):
+        """
+        Class Constructor. By default, the cores are all the cores on which
+        the current process is allowed to run.
+        """
+        assert mode in PIN_MODES
+        self.mode = mode
+        if cores is None:
+            cores = os.sched_getaffinity(0)
+        self.cores = sorted(cores)
+        self.node_of = {}
+        for node in numa_nodes(self.cores):
+            for core in node:
+                self.node_of[core] = node
+        self.owners = {}
+        self.last = {}
+
+    def acquire(self, owner):
+        """
+        Assigns a free core to owner, and returns the set of the CPUs owner
+        has to be pinned to, or None if no core is free. The previous core of
+        owner is preferred, then a core of its NUMA node, then a core of the
+        node with most free cores.
+        """
+        for core, o in self.owners.items():
+            if o is owner:
+                break
+        else:
+            free = [c for c in self.cores if c not in self.owners]
+            if not free:
+                return None
+            prev = self.last.get(owner)
+
+            def rank(c):
+                node = self.node_of[c]
+                return (
+                    c != prev, prev not in node,
+                    -sum(x not in self.owners for x in node), c
+                )
+
+            core = min(free, key=rank)
+            self.owners[core] = owner
+            self.last[owner] = core
+        if self.mode == 'numa':
+            return set(self.node_of[core])
+        return {core}
+
+    def release(self, owner):
+        """
+        Frees the core taken by owner (if any).
+        """
+        for core, o in list(self.owners.items()):
+            if o is owner:
+                del self.owners[core]
@@ -0,0 +1,180 @@
+'''
+BallTree is an exact spatial index over the feature vectors of a knowledge
+base, used for computing the k nearest neighbours of a problem in sublinear
+time.
+
+Each node of the tree is a ball enclosing its instances, so the distance from
+the ball is a lower bound of the distance from any of its instances. Unlike
+KD-trees, which split the instances along the feature axes, ball trees adapt
+to the (much lower) intrinsic dimension of correlated feature vectors.
+
+The tree is built once, when the binary knowledge base is created, and stored
+as the file balltree.npz in the knowledge base folder. A query returns exactly
+the neighbourhood of the linear scan of KnowledgeBase.nearest, ties included.
+'''
+
+import heapq
+import numpy
+
+# Maximum number of instances of a leaf.
+LEAF_SIZE = 128
+
+# Relative tolerance on the pruning bounds, avoiding to discard a node because
+# of the rounding errors of its lower bound distance.
+EPS = 1e-9
+
+
+def distances(features, feat_vector):
+    """
+    Returns the array of the Euclidean distances between feat_vector and each
+    row of the features matrix.
+    """
+    diff = features - feat_vector
+    return numpy.sqrt(numpy.einsum('ij,ij->i', diff, diff))
+
+
+class BallTree:
+    """
+    Binary tree of balls, whose leaves contain at most LEAF_SIZE instances.
+    Internal nodes split their instances at the median of the projections on
+    the line joining two far apart instances.
+    """
+
+    # Center and radius of the ball of each node.
+    centers = None
+    radii = None
+
+    # Left and right child of each node (-1 for the leaves).
+    lefts = None
+    rights = None
+
+    # Each node contains the instances perm[starts[i]:ends[i]].
+    starts = None
+    ends = None
+
+    # Permutation of the knowledge base positions.
+    perm = None
+
+    def __init__(self, arrays):
+        """
+        Class Constructor: arrays is a dictionary (name, array) of the tree
+        attributes, as returned by build_balltree or stored in balltree.npz.
+        """
+        for name in ['centers', 'radii', 'lefts', 'rights', 'starts', 'ends',
+                     'perm']:
+            setattr(self, name, arrays[name])
+
+    def save(self, path):
+        """
+        Stores the tree in the .npz file at the given path.
+        """
+        numpy.savez(
+            path, centers=self.centers, radii=self.radii, lefts=self.lefts,
+            rights=self.rights, starts=self.starts, ends=self.ends,
+            perm=self.perm
+        )
+
+    def query(self, features, feat_vector, k):
+        """
+        Returns the positions of the k rows of features closer to feat_vector,
+        sorted by increasing distance and then by position.
+        """
+        feat_vector = numpy.asarray(feat_vector, dtype=float)
+        best_d = numpy.empty(0)
+        best_i = numpy.empty(0, dtype=self.perm.dtype)
+        kth = float('+inf')
+        # The nodes are visited by increasing lower bound distance.
+        root = distances(self.centers[:1], feat_vector)[0] - self.radii[0]
+        heap = [(max(root, 0.0), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > kth * (1 + EPS):
+                break
+            left = self.lefts[node]
+            if left >= 0:
+                children = [left, self.rights[node]]
+                dist = distances(self.centers[children], feat_vector)
+                for child, d in zip(children, dist - self.radii[children]):
+                    if d <= kth * (1 + EPS):
+                        heapq.heappush(heap, (max(d, 0.0), child))
+                continue
+            idx = self.perm[self.starts[node]:self.ends[node]]
+            dist = distances(features[idx], feat_vector)
+            mask = dist <= kth
+            if not mask.any():
+                continue
+            best_d = numpy.concatenate((best_d, dist[mask]))
+            best_i = numpy.concatenate((best_i, idx[mask]))
+            if len(best_d) > k:
+                order = numpy.lexsort((best_i, best_d))[:k]
+                best_d = best_d[order]
+                best_i = best_i[order]
+            if len(best_d) == k:
+                kth = best_d.max()
+        return best_i[numpy.lexsort((best_i, best_d))]
+
+
+def build_balltree(features):
+    """
+    Builds the BallTree of the given features matrix.
+    """
+    n = features.shape[0]
+    perm = numpy.arange(n)
+    centers = []
+    radii = []
+    lefts = []
+    rights = []
+    starts = []
+    ends = []
+
+    def new_node(start, end):
+        points = features[perm[start:end]]
+        if end > start:
+            center = points.mean(axis=0)
+            radius = distances(points, center).max()
+        else:
+            center = numpy.zeros(features.shape[1])
+            radius = 0.0
+        centers.append(center)
+        radii.append(radius)
+        lefts.append(-1)
+        rights.append(-1)
+        starts.append(start)
+        ends.append(end)
+        return len(radii) - 1
+
+    stack = [new_node(0, n)]
+    while stack:
+        node = stack.pop()
+        start = starts[node]
+        end = ends[node]
+        if end - start <= LEAF_SIZE:
+            continue
+        points = features[perm[start:end]]
+        a = points[distances(points, centers[node]).argmax()]
+        b = points[distances(points, a).argmax()]
+        proj = points.dot(b - a)
+        if proj.min() == proj.max():
+            # All the instances of the node have the same features.
+            continue
+        mid = (end - start) // 2
+        order = numpy.argpartition(proj, mid)
+        perm[start:end] = perm[start:end][order]
+        lefts[node] = new_node(start, start + mid)
+        rights[node] = new_node(start + mid, end)
+        stack += [lefts[node], rights[node]]
+    centers = numpy.array(centers).reshape(len(radii), features.shape[1])
+    return BallTree({
+        'centers': centers,
+        'radii': numpy.array(radii), 'lefts': numpy.array(lefts),
+        'rights': numpy.array(rights), 'starts': numpy.array(starts),
+        'ends': numpy.array(ends), 'perm': perm
+    })
+
+
+def load_balltree(path):
+    """
+    Loads the BallTree stored in the .npz file at the given path.
+    """
+    with numpy.load(path) as arrays:
+        return BallTree(dict((name, arrays[name]) for name in arrays.files))
@@ -0,0 +1,346 @@
+'''
+Batch mode of sunny-cp: solves many problems in a single process, sharing a
+global budget of cores among them (see bin/sunny-cp-batch).
+
+Running an independent sunny-cp process per problem, each assuming to own all
+the cores of the machine, oversubscribes the machine when many problems are
+solved at the same time. Instead, the batch mode drives the Portfolio (see
+portfolio.py) of each problem in a single event loop, and assigns the cores
+of the budget as follows:
+
+  - a problem is started only when some core is free, and it takes an equal
+    share of the free cores among the waiting problems (at least one core,
+    and at most a given limit): its SUNNY schedule is computed for the cores
+    it takes;
+  - as soon as a problem is done, its cores are given to the waiting problems
+    or, if no problem is waiting, to the running portfolios, which start
+    ahead the solvers pending in their schedules.
+
+So, while many problems are waiting each problem runs on a single core, which
+maximizes the number of problems solved per unit of time, and the last
+problems of the batch get all the cores left. Each problem is solved within
+the timeout T of SUNNY algorithm, features extraction included.
+'''
+
+import os
+import sys
+import time
+import shutil
+import signal
+import asyncio
+import tempfile
+import traceback
+from contextlib import redirect_stdout
+from concurrent.futures import FIRST_COMPLETED
+from features import mzn2feat
+from knowledge_base import load_kb
+from parsing import get_solve
+from portfolio import Portfolio
+from problem import Problem
+from scheduling import get_neighbours, compute_schedule
+
+
+class Job:
+    """
+    Job is a problem of the batch, together with the state of its solving.
+    """
+
+    # Name of the job, i.e., the names of its model and data (if any).
+    name = ''
+
+    # Object of class Problem to be solved.
+    problem = None
+
+    # Number of cores taken by the job.
+    cores = 0
+
+    # Portfolio solving the problem (None before the solving phase).
+    portfolio = None
+
+    # Outcome of the job. It can be either 'OPTIMAL', 'UNSATISFIABLE',
+    # 'SATISFIED' (solution found, but search not complete), 'UNKNOWN' or
+    # 'ERROR'. For CSPs, 'OPTIMAL' means that the search is complete.
+    outcome = 'UNKNOWN'
+
+    # Best objective value found (for COPs only).
+    objective = None
+
+    # Time in seconds (since the epoch) when the job started, and time in
+    # seconds taken by the job.
+    start_time = -1
+    time = -1
+
+    # Path of the file where the solutions (and the comments) of the job are
+    # written, and its file object (opened when the job starts).
+    output_path = ''
+    output = None
+
+    def __init__(self, name, problem, output_path):
+        """
+        Class Constructor.
+        """
+        self.name = name
+        self.problem = problem
+        self.output_path = output_path
+
+    def solved(self):
+        """
+        Returns True iff the problem of the job is solved.
+        """
+        return self.outcome in ['OPTIMAL', 'UNSATISFIABLE'] or \
+            self.outcome == 'SATISFIED' and self.problem.isCSP()
+
+
+def neighbours_of(problem, kb, lims, k, timeout, approx=False):
+    """
+    Extracts the feature vector of the problem within timeout seconds and
+    returns its k-nearest neighbours in the knowledge base kb (an empty list,
+    if the extraction fails), possibly approximated (see -N option). This
+    function is run in a background thread.
+    """
+    feat_vector = mzn2feat.extract_features([problem, lims, timeout])
+    if not feat_vector:
+        return []
+    return get_neighbours(feat_vector, k, load_kb(kb), approx)
+
+
+class Batch:
+    """
+    Batch solves a list of jobs on a global budget of cores.
+    """
+
+    # List of the jobs waiting for some core.
+    waiting = None
+
+    # Dictionary (task, job) of the running jobs.
+    running = None
+
+    # Number of free cores of the budget.
+    free = 0
+
+    # Maximum number of cores initially taken by a job.
+    max_cores = 0
+
+    # List of the solvers of the portfolio, and the backup solver.
+    pfolio = None
+    backup = ''
+
+    # Dictionary (pb, (kb, lims)) of the knowledge bases and normalization
+    # limits, where pb is either 'csp' or 'cop'.
+    kbs = None
+
+    # Neighborhood size and timeout of SUNNY algorithm.
+    k = -1
+    timeout = -1
+
+    def __init__(
+        self, jobs, cores, max_cores, pfolio, backup, kbs, k, timeout
+    ):
+        """
+        Class Constructor.
+        """
+        self.waiting = list(jobs)
+        self.running = {}
+        self.free = cores
+        self.max_cores = max_cores
+        self.pfolio = pfolio
+        self.backup = backup
+        self.kbs = kbs
+        self.k = k
+        self.timeout = timeout
+
+    async def run(self, report):
+        """
+        Runs all the jobs, calling report(job) when a job is done.
+        """
+        try:
+            self.launch()
+            while self.running:
+                done, _ = await asyncio.wait(
+                    list(self.running), return_when=FIRST_COMPLETED
+                )
+                for task in done:
+                    job = self.running.pop(task)
+                    self.free += job.cores
+                    job.time = time.time() - job.start_time
+                    if not task.cancelled() and task.exception() and \
+                       not isinstance(task.exception(), asyncio.TimeoutError):
+                        job.outcome = 'ERROR'
+                        traceback.print_exception(
+                            None, task.exception(),
+                            task.exception().__traceback__
+                        )
+                    report(job)
+                self.launch()
+                self.grow()
+        finally:
+            for task in self.running:
+                task.cancel()
+            if self.running:
+                await asyncio.wait(list(self.running))
+
+    def launch(self):
+        """
+        Starts the waiting jobs on the free cores.
+        """
+        while self.waiting and self.free > 0:
+            job = self.waiting.pop(0)
+            job.cores = min(
+                self.max_cores, max(1, self.free // (len(self.waiting) + 1))
+            )
+            job.start_time = time.time()
+            job.output = open(job.output_path, 'w')
+            self.free -= job.cores
+            timeout = self.timeout
+            if timeout == float('+inf'):
+                timeout = None
+            task = asyncio.ensure_future(
+                asyncio.wait_for(self.solve(job), timeout)
+            )
+            self.running[task] = job
+
+    def grow(self):
+        """
+        Gives the free cores to the running portfolios, one at a time.
+        """
+        growing = [
+            job for job in self.running.values() if job.portfolio is not None
+        ]
+        while self.free > 0 and growing:
+            for job in list(growing):
+                if self.free > 0 and job.portfolio.grow(1):
+                    job.cores += 1
+                    self.free -= 1
+                else:
+                    growing.remove(job)
+
+    async def solve(self, job):
+        """
+        Computes the schedule of the job and runs its portfolio.
+        """
+        problem = job.problem
+        pfolio = self.pfolio
+        neighbours = []
+        timeout = self.timeout
+        if job.cores < len(pfolio):
+            # The features extraction takes one of the cores of the job.
+            kb, lims = self.kbs['cop' if problem.isCOP() else 'csp']
+            neighbours = await asyncio.get_event_loop().run_in_executor(
+                None, neighbours_of, problem, kb, lims, self.k,
+                None if timeout == float('+inf') else timeout
+            )
+            timeout -= round(time.time() - job.start_time)
+        if not neighbours or len(pfolio) <= job.cores:
+            print('% Switching to backup solver(s)', file=job.output)
+            schedule = [(s, float('+inf')) for s in pfolio[:job.cores]]
+        else:
+            backup = self.backup if self.backup in pfolio else pfolio[0]
+            k = self.k if self.k > 0 else len(neighbours)
+            with redirect_stdout(job.output):
+                schedule = compute_schedule(
+                    problem, neighbours, k, timeout, pfolio, backup, job.cores
+                )
+        schedule += [
+            (s, 0) for s in pfolio if s not in list(dict(schedule).keys())
+        ]
+        print('% SUNNY parallel schedule:', schedule, file=job.output)
+        job.portfolio = Portfolio(schedule, job.cores)
+        solutions = job.portfolio.solve(problem)
+        # The free cores are offered to the portfolio once it has started.
+        asyncio.get_event_loop().call_soon(self.grow)
+        async for solution in solutions:
+            job.output.write(solution.output())
+            job.output.flush()
+            if solution.status == 'unsat':
+                job.outcome = 'UNSATISFIABLE'
+            elif solution.status == 'opt':
+                job.outcome = 'OPTIMAL'
+            elif solution.status == 'sat':
+                job.outcome = 'SATISFIED'
+            if solution.objective is not None:
+                job.objective = solution.objective
+
+
+def read_jobs(path, out_dir, tmp_dir):
+    """
+    Returns the list of the jobs of the instances file at path, where each
+    line is of the form <MODEL.mzn> [DATA.dzn] (empty lines and lines starting
+    with % are ignored). The output of each job is written in out_dir (if not
+    None) in a file named after its model and data, while its temporary files
+    are written in tmp_dir.
+    """
+    jobs = []
+    names = set()
+    with open(path, 'r') as infile:
+        for line in infile:
+            args = line.split()
+            if not args or args[0].startswith('%'):
+                continue
+            mzn = os.path.abspath(args[0])
+            dzn = os.path.abspath(args[1]) if len(args) > 1 else ''
+            name = os.path.basename(mzn)[:-4]
+            if dzn:
+                name += '_' + os.path.splitext(os.path.basename(dzn))[0]
+            if name in names:
+                name += '_' + str(len(jobs) + 1)
+            names.add(name)
+            problem = Problem(
+                mzn, dzn, tmp_dir + '/' + str(len(jobs)) + '.ozn',
+                get_solve(mzn)
+            )
+            if out_dir is None:
+                output_path = os.devnull
+            else:
+                output_path = out_dir + '/' + name + '.out'
+            jobs.append(Job(name, problem, output_path))
+    return jobs
+
+
+def run_batch(path, out_dir, cores, max_cores, pfolio, backup, kbs, k,
+              timeout):
+    """
+    Solves the problems of the instances file at path (see read_jobs) on the
+    given number of cores, printing a line for each solved problem and a final
+    summary. The batch is interrupted by SIGINT and SIGTERM signals. Returns
+    the list of the jobs.
+    """
+    start_time = time.time()
+    tmp_dir = tempfile.mkdtemp(prefix='sunny-cp-batch-')
+    jobs = []
+
+    def report(job):
+        line = '%s: %s in %.2f s on %d cores' % (
+            job.name, job.outcome, job.time, job.cores
+        )
+        if job.objective is not None:
+            line += ' (objective ' + str(job.objective) + ')'
+        print(line)
+        sys.stdout.flush()
+        job.output.close()
+
+    try:
+        jobs = read_jobs(path, out_dir, tmp_dir)
+        # The knowledge bases are loaded once, before the jobs start.
+        for kb, _ in kbs.values():
+            load_kb(kb)
+        batch = Batch(jobs, cores, max_cores, pfolio, backup, kbs, k, timeout)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        task = loop.create_task(batch.run(report))
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            print('% Batch interrupted!')
+        finally:
+            loop.close()
+    finally:
+        for job in jobs:
+            if job.output:
+                job.output.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print('%% Solved %d problems out of %d in %.2f s' % (
+        sum(job.solved() for job in jobs), len(jobs), time.time() - start_time
+    ))
+    return jobs
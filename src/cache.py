@@ -0,0 +1,333 @@
+'''
+Caches of the results computed by sunny-cp (e.g., the solvers schedules), so
+that they are not recomputed for the same inputs.
+
+A Cache keeps the most recently used entries in memory and, optionally, in a
+DiskCache shared across different sunny-cp executions. A DiskCache is a SQLite
+database with a bounded size, where the least recently used entries are
+evicted first.
+
+A FileCache is instead a folder of files (e.g., the FlatZinc models compiled
+by the solvers), which are cloned in and out of the cache (see clone_file).
+Also a FileCache has a bounded size, and evicts the least recently used
+entries first.
+'''
+
+import os
+import sys
+import json
+import fcntl
+import time
+import sqlite3
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# Maximum number of entries kept in memory by a Cache.
+MEM_SIZE = 1024
+
+# Seconds to wait for the lock of a DiskCache held by another process.
+DB_TIMEOUT = 5
+
+# Request of the ioctl system call for cloning a file (Linux only).
+FICLONE = 0x40049409
+
+
+def make_key(*args):
+    """
+    Returns the hexadecimal digest identifying the JSON-serializable args.
+    """
+    data = json.dumps(args, sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def program_stamp(name):
+    """
+    Returns the pair (path, mtime) of the real path and the modification time
+    of the program name found in PATH, or None if name is not found. The stamp
+    changes when the program is updated, or PATH is changed.
+    """
+    path = shutil.which(name)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    return path, os.path.getmtime(path)
+
+
+def clone_file(src, dst):
+    """
+    Makes dst a copy of the file src (dst is replaced, if it exists). The copy
+    is a reflink of src, sharing its data, on file systems with copy-on-write
+    support, otherwise src is actually copied. Hard links are never used: the
+    compilers truncate and rewrite their output files in place, which would
+    also modify the linked files.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    with open(src, 'rb') as infile, open(dst, 'wb') as outfile:
+        try:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        except OSError:
+            shutil.copyfileobj(infile, outfile)
+
+
+class DiskCache:
+    """
+    Key-value store in a SQLite database, whose values are bytes objects.
+    """
+
+    # Path of the database file.
+    path = None
+
+    # Maximum total size (in bytes) of the stored values.
+    max_size = None
+
+    def __init__(self, path, max_size):
+        """
+        Class Constructor.
+        """
+        self.path = path
+        self.max_size = max_size
+        db = sqlite3.connect(path, timeout=DB_TIMEOUT)
+        try:
+            with db:
+                db.execute(
+                    'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY,'
+                    ' value BLOB, size INTEGER, atime REAL)'
+                )
+                db.execute(
+                    'CREATE INDEX IF NOT EXISTS atimes ON entries (atime)'
+                )
+        finally:
+            db.close()
+
+    def get(self, key):
+        """
+        Returns the value of key, or None if key is not stored.
+        """
+        db = sqlite3.connect(self.path, timeout=DB_TIMEOUT)
+        try:
+            with db:
+                row = db.execute(
+                    'SELECT value FROM entries WHERE key = ?', (key, )
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        'UPDATE entries SET atime = ? WHERE key = ?',
+                        (time.time(), key)
+                    )
+        finally:
+            db.close()
+        return None if row is None else bytes(row[0])
+
+    def put(self, key, value):
+        """
+        Stores the pair (key, value), and then evicts the least recently used
+        entries until the size of the store is at most max_size.
+        """
+        db = sqlite3.connect(self.path, timeout=DB_TIMEOUT)
+        try:
+            with db:
+                db.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                    (key, value, len(value), time.time())
+                )
+                size = db.execute(
+                    'SELECT TOTAL(size) FROM entries'
+                ).fetchone()[0]
+                evicted = []
+                rows = db.execute(
+                    'SELECT key, size FROM entries ORDER BY atime'
+                )
+                for old_key, old_size in rows:
+                    if size <= self.max_size:
+                        break
+                    evicted.append((old_key, ))
+                    size -= old_size
+                db.executemany('DELETE FROM entries WHERE key = ?', evicted)
+        finally:
+            db.close()
+
+
+class Cache:
+    """
+    Cache of JSON-serializable values. Since a Cache can be used by background
+    threads, its warnings are printed on standard error.
+    """
+
+    # OrderedDict (key, value) of the entries in memory, from the least to the
+    # most recently used.
+    memory = None
+
+    # DiskCache object (or None, if the cache is in memory only).
+    disk = None
+
+    # Number of cache hits and misses.
+    hits = 0
+    misses = 0
+
+    def __init__(self, path=None, max_size=0, memory=None):
+        """
+        Class Constructor: if path is not None, the entries are also stored in
+        a DiskCache of at most max_size bytes at the given path. The entries
+        in memory can be shared with another Cache, by passing its memory.
+        """
+        self.memory = OrderedDict() if memory is None else memory
+        if path:
+            try:
+                self.disk = DiskCache(path, max_size)
+            except sqlite3.Error as e:
+                print(
+                    '% Warning! Cannot open cache', path + ':', e,
+                    file=sys.stderr
+                )
+
+    def get(self, key):
+        """
+        Returns the value of key, or None if key is not cached.
+        """
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            try:
+                data = self.disk.get(key)
+            except sqlite3.Error as e:
+                print('% Warning! Cache error:', e, file=sys.stderr)
+                data = None
+            if data is not None:
+                value = json.loads(data.decode())
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches the pair (key, value).
+        """
+        self.remember(key, value)
+        if self.disk:
+            try:
+                self.disk.put(key, json.dumps(value).encode())
+            except sqlite3.Error as e:
+                print('% Warning! Cache error:', e, file=sys.stderr)
+
+    def remember(self, key, value):
+        """
+        Stores the pair (key, value) in memory, evicting the least recently
+        used entry if the memory contains more than MEM_SIZE entries.
+        """
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > MEM_SIZE:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns a string with the number of hits and misses.
+        """
+        return str(self.hits) + ' hits, ' + str(self.misses) + ' misses'
+
+
+class FileCache:
+    """
+    Cache of files in a folder. An entry of the cache is a set of files with
+    the same key (the file name) and different extensions.
+    """
+
+    # Path of the folder of the cache.
+    path = None
+
+    # Maximum total size (in bytes) of the cached files.
+    max_size = None
+
+    # Number of cache hits and misses.
+    hits = 0
+    misses = 0
+
+    def __init__(self, path, max_size):
+        """
+        Class Constructor.
+        """
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key, ext):
+        """
+        Returns the path of the cached file with the given key and extension.
+        """
+        return os.path.join(self.path, key + ext)
+
+    def get(self, key, files):
+        """
+        Clones the files of the entry key to the paths of files, a dictionary
+        (extension, path). Returns True iff all the files are cached.
+        """
+        try:
+            for ext, path in files.items():
+                clone_file(self.entry_path(key, ext), path)
+                # The modification time is the last access time of the entry.
+                os.utime(self.entry_path(key, ext))
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key, files):
+        """
+        Clones the files of files, a dictionary (extension, path), in the
+        entry key, and then evicts the least recently used entries until the
+        size of the cache is at most max_size.
+        """
+        try:
+            for ext, path in files.items():
+                # Files are atomically replaced, since the cache can be shared
+                # by concurrent executions.
+                fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.')
+                os.close(fd)
+                try:
+                    clone_file(path, tmp_path)
+                    os.replace(tmp_path, self.entry_path(key, ext))
+                except OSError:
+                    os.remove(tmp_path)
+                    raise
+            self.evict()
+        except OSError as e:
+            print('% Warning! Cache error:', e)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the size of the cache is
+        at most max_size.
+        """
+        paths = {}
+        sizes = {}
+        times = {}
+        for entry in os.scandir(self.path):
+            if entry.name.startswith('.'):
+                continue
+            key = entry.name.split('.')[0]
+            stat = entry.stat()
+            paths.setdefault(key, []).append(entry.path)
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            times[key] = max(times.get(key, 0), stat.st_mtime)
+        size = sum(sizes.values())
+        for key in sorted(sizes, key=lambda k: times[k]):
+            if size <= self.max_size:
+                break
+            for path in paths[key]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            size -= sizes[key]
+
+    def stats(self):
+        """
+        Returns a string with the number of hits and misses.
+        """
+        return str(self.hits) + ' hits, ' + str(self.misses) + ' misses'
@@ -0,0 +1,178 @@
+'''
+Module for identifying the compilations of a MiniZinc model into FlatZinc, so
+that the FlatZinc (and .ozn) files produced by a solver can be cached and
+reused across different sunny-cp executions.
+
+A compilation is identified by the contents of the model (including the
+models it includes) and of its data, by the solver and its conversion options,
+and by the MiniZinc library used for the compilation: the version of the
+MiniZinc compiler, the contents of its standard library, and the contents of
+the solver-specific library (see the mznlib field of minizinc --solvers-json).
+'''
+
+import os
+import json
+from subprocess import PIPE, Popen
+from cache import make_key, program_stamp
+from features import get_includes, file_digest
+
+# Dictionary (solver, (stamp, signature)) of the MiniZinc library signatures
+# computed so far, where stamp identifies the minizinc command and the files
+# of the library when the signature was computed (see lib_signature).
+LIB_SIGNATURES = {}
+
+# Dictionary (paths, digests) of the digests of the problems computed so far.
+PROBLEM_DIGESTS = {}
+
+# Dictionary ((stamp, args), output) of the outputs of the minizinc commands
+# run so far, where stamp is the minizinc_stamp() of the command.
+MINIZINC_OUTPUTS = {}
+
+# Environment variables changing the outputs of the minizinc commands.
+MINIZINC_ENV = ['MZN_SOLVER_PATH', 'MZN_STDLIB_DIR']
+
+
+def minizinc_stamp():
+    """
+    Returns a pair (program, env) identifying the minizinc command in the
+    current environment, where program is the pair (path, mtime) of the
+    minizinc executable in PATH and env is the tuple of the values of the
+    MINIZINC_ENV variables. Returns None if minizinc is not found.
+    """
+    program = program_stamp('minizinc')
+    if program is None:
+        return None
+    return program, tuple(os.environ.get(var) for var in MINIZINC_ENV)
+
+
+def minizinc_output(*args):
+    """
+    Returns the standard output of the minizinc command with the given
+    arguments, or None if it fails. Each command is run only once, unless the
+    minizinc command changes (e.g., in a job of the daemon).
+    """
+    stamp = minizinc_stamp()
+    if stamp is None:
+        return None
+    if (stamp, args) in MINIZINC_OUTPUTS:
+        return MINIZINC_OUTPUTS[stamp, args]
+    MINIZINC_OUTPUTS[stamp, args] = None
+    try:
+        proc = Popen([stamp[0][0]] + list(args), stdout=PIPE, stderr=PIPE)
+        out, _ = proc.communicate()
+    except OSError:
+        return None
+    if proc.returncode == 0:
+        MINIZINC_OUTPUTS[stamp, args] = out.decode()
+    return MINIZINC_OUTPUTS[stamp, args]
+
+
+def folder_digests(path):
+    """
+    Returns the sorted list of the pairs (relative path, digest) of the files
+    in the folder at path (and in its subfolders).
+    """
+    digests = []
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            digests.append(
+                (os.path.relpath(file_path, path), file_digest(file_path))
+            )
+    return sorted(digests)
+
+
+def folder_stamp(path):
+    """
+    Returns the sorted list of the triples (relative path, mtime, size) of the
+    files in the folder at path (and in its subfolders): unlike the digests,
+    the stamp is computed without reading the files.
+    """
+    stamp = []
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            stamp.append((
+                os.path.relpath(os.path.join(root, name), path),
+                st.st_mtime_ns, st.st_size
+            ))
+    return sorted(stamp)
+
+
+def lib_signature(solver):
+    """
+    Returns the signature of the MiniZinc library used by the solver with the
+    given id, or None if it cannot be retrieved. The signature is recomputed
+    only if the minizinc command, the solver configuration or the files of the
+    library change.
+    """
+    version = minizinc_output('--version')
+    dirs = minizinc_output('--config-dirs')
+    solvers = minizinc_output('--solvers-json')
+    if version is None or dirs is None or solvers is None:
+        return None
+    stdlib_dir = json.loads(dirs).get('mznStdlibDir', '')
+    for conf in json.loads(solvers):
+        if conf.get('id') == solver or \
+           conf.get('id', '').endswith('.' + solver) or \
+           solver in conf.get('tags', []):
+            break
+    else:
+        return None
+    mznlib = conf.get('mznlib', '')
+    if mznlib.startswith('-G'):
+        mznlib = os.path.join(stdlib_dir, mznlib[2:])
+    std_dir = os.path.join(stdlib_dir, 'std')
+    stamp = [
+        minizinc_stamp(), conf, folder_stamp(std_dir),
+        folder_stamp(mznlib) if mznlib else []
+    ]
+    if solver in LIB_SIGNATURES and LIB_SIGNATURES[solver][0] == stamp:
+        return LIB_SIGNATURES[solver][1]
+    signature = [
+        version, conf.get('id'), conf.get('version', ''),
+        folder_digests(std_dir), folder_digests(mznlib) if mznlib else []
+    ]
+    LIB_SIGNATURES[solver] = (stamp, signature)
+    return signature
+
+
+def problem_digest(problem):
+    """
+    Returns the digest of the contents of the model and the data of problem.
+    """
+    paths = (problem.mzn_path, problem.dzn_path)
+    if paths not in PROBLEM_DIGESTS:
+        # Included models are identified by their relative paths.
+        mzn_dir = os.path.dirname(problem.mzn_path)
+        models = [file_digest(problem.mzn_path)] + [
+            (os.path.relpath(path, mzn_dir), file_digest(path))
+            for path in get_includes(problem.mzn_path)
+        ]
+        data = file_digest(problem.dzn_path) if problem.dzn_path else ''
+        PROBLEM_DIGESTS[paths] = make_key(models, data)
+    return PROBLEM_DIGESTS[paths]
+
+
+def flattening_signature(solv_dict):
+    """
+    Returns the flattening signature of the solver of the dictionary solv_dict
+    (see pfolio_solvers.py): solvers with the same signature compile the same
+    model into the same FlatZinc model.
+    """
+    return solv_dict['solver'], solv_dict['conv_opts']
+
+
+def compilation_key(problem, solv_dict):
+    """
+    Returns the cache key of the compilation of problem by the solver of the
+    dictionary solv_dict (see pfolio_solvers.py), or None if the MiniZinc
+    library of the solver is unknown.
+    """
+    signature = lib_signature(solv_dict['solver'])
+    if signature is None:
+        return None
+    return make_key(
+        'mzn2fzn', problem_digest(problem), solv_dict['solver'],
+        solv_dict['conv_opts'], signature
+    )
@@ -0,0 +1,276 @@
+'''
+Daemon mode of sunny-cp: a long-running sunny-cp process, started with
+sunny-cp --daemon <SOCKET>, waits for solving jobs on a Unix domain socket.
+The daemon pays only once the Python startup, the import of the modules
+(including the portfolio definition), and the loading of the default
+knowledge bases, normalization limits and MiniZinc library signatures.
+
+A job is sent by the thin client bin/sunny-cp-client, with the same options
+and arguments of sunny-cp. The client passes its standard input, output and
+error to the daemon (as SCM_RIGHTS ancillary data), together with its
+arguments, working directory and environment. The daemon forks a process for
+each job, which inherits the warm state of the daemon and runs sunny-cp
+exactly as the sunny-cp executable would do, writing on the standard output
+of the client. The client relays the termination signals it receives to the
+job process, and exits with the exit status of the job.
+
+The messages exchanged on the socket are lines: the JSON request of the
+client, then the process id of the job and the exit status of the job, sent
+by the daemon.
+
+Since a job runs in a forked process, the state of the daemon is inherited
+by the jobs but not updated by them. The state persisting across jobs is:
+
+  - the modules and the portfolio definition, imported once;
+  - the default knowledge bases, normalization limits and MiniZinc library
+    signatures, loaded by the daemon before serving (a job reloads its own
+    copy if a file or minizinc changes);
+  - the entries of the caches passed to serve (e.g., the solvers schedules),
+    which a job sends back to the daemon on a pipe (see share) and the
+    daemon keeps in memory for the next jobs.
+
+The other caches (e.g., features and FlatZinc models) persist across jobs
+only through their on-disk stores (see the --cache-dir option).
+'''
+
+import os
+import sys
+import json
+import array
+import signal
+import socket
+import selectors
+import traceback
+
+# Termination signals, relayed by the client to the job process.
+SIGNALS = [signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGQUIT]
+
+# Maximum number of jobs waiting to be accepted by the daemon.
+BACKLOG = 64
+
+# Write end of the pipe sending the cache entries of a job process to the
+# daemon (None out of a job process).
+ENTRIES_FD = None
+
+
+def send_request(sock, args):
+    """
+    Sends the job request with the given sunny-cp arguments on the socket,
+    passing the standard file descriptors of the calling process.
+    """
+    request = json.dumps({
+        'args': args, 'cwd': os.getcwd(), 'env': dict(os.environ)
+    }).encode() + b'\n'
+    fds = array.array('i', [0, 1, 2])
+    sent = sock.sendmsg(
+        [request], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)]
+    )
+    sock.sendall(request[sent:])
+
+
+def recv_request(sock):
+    """
+    Receives a job request from the socket, and returns the pair (request,
+    fds) where request is the decoded JSON dictionary and fds is the list of
+    the passed file descriptors.
+    """
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(
+        1 << 16, socket.CMSG_LEN(3 * fds.itemsize)
+    )
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(
+                cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize]
+            )
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(1 << 16)
+        if not chunk:
+            raise EOFError('Truncated request')
+        data += chunk
+    return json.loads(data.decode()), list(fds)
+
+
+def run_job(conn, handlers, job):
+    """
+    Runs in a forked process the job requested on the connection conn, by
+    calling job with the sunny-cp arguments of the request. The signal
+    handlers of sunny-cp are restored from the dictionary handlers.
+    """
+    code = 1
+    try:
+        request, fds = recv_request(conn)
+        if len(fds) != 3:
+            raise ValueError('Standard file descriptors not received')
+        for fd, std_fd in zip(fds, [0, 1, 2]):
+            os.dup2(fd, std_fd)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+        conn.sendall(str(os.getpid()).encode() + b'\n')
+        try:
+            job(request['args'])
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+        except Exception:
+            traceback.print_exc()
+        if not sys.stdout.closed:
+            sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendall(str(code).encode() + b'\n')
+    finally:
+        os._exit(code)
+
+
+def share(name, key, value):
+    """
+    Sends the pair (key, value) of the cache name to the daemon, if called by
+    a job process, so that the daemon stores it in its own cache name and the
+    next jobs inherit it (see serve). The value must be JSON-serializable.
+    """
+    if ENTRIES_FD is None:
+        return
+    data = json.dumps([name, key, value]).encode() + b'\n'
+    while data:
+        data = data[os.write(ENTRIES_FD, data):]
+
+
+def receive_entries(data, caches):
+    """
+    Stores in the dictionary (name, Cache) caches the entries sent by a job
+    process (see share), i.e., the JSON lines of the bytes data.
+    """
+    for line in data.splitlines():
+        try:
+            name, key, value = json.loads(line.decode())
+        except ValueError:
+            continue
+        if name in caches:
+            caches[name].remember(key, value)
+
+
+def close_jobs(selector, server):
+    """
+    Closes the selector of the daemon, the server socket, and the pipes of
+    the jobs registered in the selector.
+    """
+    for key in list(selector.get_map().values()):
+        if key.fileobj is not server:
+            os.close(key.fd)
+    selector.close()
+    server.close()
+
+
+def serve(path, job, caches=None):
+    """
+    Waits for the jobs requested on the Unix domain socket at path, and runs
+    each job in a forked process by calling job with its arguments. The
+    entries that a job sends for the dictionary (name, Cache) caches are
+    stored in memory by the daemon (see share).
+    """
+    global ENTRIES_FD
+    caches = caches or {}
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(BACKLOG)
+    handlers = dict((sig, signal.getsignal(sig)) for sig in SIGNALS)
+
+    def stop(signum, frame):
+        sys.exit(0)
+
+    for sig in SIGNALS:
+        signal.signal(sig, stop)
+    # The terminated jobs are reaped automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # The server socket and the read ends of the pipes of the running jobs,
+    # whose data is the bytearray of the incomplete line received so far.
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    print('% sunny-cp daemon waiting for jobs on', path)
+    try:
+        while True:
+            # The entries sent by the jobs are stored before accepting new
+            # jobs, which then inherit them.
+            events = sorted(
+                selector.select(), key=lambda e: e[0].fileobj is server
+            )
+            for key, _ in events:
+                if key.fileobj is not server:
+                    data = os.read(key.fd, 1 << 16)
+                    if not data:
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+                        continue
+                    key.data.extend(data)
+                    end = key.data.rfind(b'\n') + 1
+                    receive_entries(bytes(key.data[:end]), caches)
+                    del key.data[:end]
+                    continue
+                try:
+                    conn, _ = server.accept()
+                except InterruptedError:
+                    continue
+                r, w = os.pipe()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if os.fork() == 0:
+                    os.close(r)
+                    close_jobs(selector, server)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    ENTRIES_FD = w
+                    run_job(conn, handlers, job)
+                os.close(w)
+                conn.close()
+                selector.register(r, selectors.EVENT_READ, bytearray())
+    finally:
+        close_jobs(selector, server)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_client(path, args):
+    """
+    Sends the job with the given sunny-cp arguments to the daemon waiting on
+    the Unix domain socket at path, and waits for its termination. Returns
+    the exit status of the job, or None if the daemon is not running.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    with sock:
+        send_request(sock, args)
+        lines = sock.makefile('rb')
+        line = lines.readline()
+        if not line:
+            return 1
+        pid = int(line)
+
+        def relay(signum, frame):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+        for sig in SIGNALS:
+            signal.signal(sig, relay)
+        line = lines.readline()
+        # The job process may be killed without reporting its exit status.
+        return int(line) if line else 1
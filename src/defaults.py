@@ -9,6 +9,8 @@ SUNNY_HOME = '/'.join(SUNNY_HOME)
 
 DEF_K = -1
 
+DEF_KNN = 'exact'
+
 DEF_TOUT = 1200
 
 DEF_BACKUP = 'chuffed'
@@ -23,6 +25,8 @@ DEF_LIMS_COP = SUNNY_HOME + '/kb/empty/empty_lims_cop'
 
 DEF_EXTRACTOR = 'mzn2feat'
 
+DEF_EXTRACTION_TIME = None
+
 DEF_CORES = cpu_count()
 
 DEF_TMP_DIR = SUNNY_HOME + '/tmp'
@@ -46,3 +50,15 @@ DEF_UB = float('+inf')
 DEF_RESTARTS = float('+inf')
 
 DEF_CHECK = {}
+
+DEF_CACHE_DIR = None
+
+DEF_CACHE_SIZE = 64
+
+DEF_COALESCE_TIME = 0
+
+DEF_FZN_CACHE_SIZE = 1024
+
+DEF_TRACE = None
+
+DEF_PIN = None
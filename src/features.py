@@ -11,43 +11,142 @@ possible future extensions.
 '''
 
 from math import isnan
-from subprocess import PIPE
+from subprocess import PIPE, TimeoutExpired
 import os
+import re
 import json
+import hashlib
 import psutil
+from cache import make_key, program_stamp
+
+# Normalization limits already loaded, indexed by their path.
+LOADED_LIMS = {}
+
+
+def get_includes(mzn_path):
+    """
+    Returns the list of the paths of the models included (possibly not
+    directly) by the MiniZinc model at mzn_path. Includes that are not found
+    in the folder of the including model (e.g., the globals of the MiniZinc
+    library) are ignored.
+    """
+    includes = []
+    models = [mzn_path]
+    while models:
+        model = models.pop()
+        with open(model, 'r') as infile:
+            # Ignore comments.
+            text = re.sub(r'%[^\n]*', '', infile.read())
+        for name in re.findall(r'\binclude\s*"([^"]+)"', text):
+            path = os.path.join(os.path.dirname(model), name)
+            if os.path.isfile(path) and path not in includes:
+                includes.append(path)
+                models.append(path)
+    return includes
+
+
+def file_digest(path):
+    """
+    Returns the hexadecimal SHA-1 digest of the contents of the file at path.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_lims(path):
+    """
+    Returns the dictionary of the normalization limits in the JSON file at the
+    given path. Each file is loaded only once, unless it is modified
+    afterwards.
+    """
+    mtime = os.path.getmtime(path)
+    if path in LOADED_LIMS and LOADED_LIMS[path][0] == mtime:
+        return LOADED_LIMS[path][1]
+    with open(path, 'r') as infile:
+        lims = json.load(infile)
+    LOADED_LIMS[path] = (mtime, lims)
+    return lims
 
 
 class mzn2feat:
 
+    # Cache object of the mzn2feat outputs (or None, for no caching).
+    cache = None
+
     @staticmethod
     def extract_features(args):
         problem = args[0]
-        not_norm_vector = mzn2feat.extract(problem)
+        timeout = args[2] if len(args) > 2 else None
+        not_norm_vector = mzn2feat.extract(problem, timeout)
         if not not_norm_vector:
             return None
-        with open(args[1], 'r') as infile:
-            lims = json.load(infile)
-        return mzn2feat.normalize(not_norm_vector, lims)
+        return mzn2feat.normalize(not_norm_vector, load_lims(args[1]))
 
     @staticmethod
-    def extract(problem):
+    def extract(problem, timeout=None):
         """
         Extracts the features from a MiniZinc model by exploiting the mzn2feat
-        features extractor.
+        features extractor, which is killed after timeout seconds (if not
+        None).
         """
         mzn_path = problem.mzn_path
         dzn_path = problem.dzn_path
         cmd = 'mzn2feat -i ' + mzn_path
         if dzn_path:
             cmd += ' -d ' + dzn_path
-        proc = psutil.Popen(cmd.split(), stdout=PIPE)
-        (out, err) = proc.communicate()
-        # Failure in features extraction.
-        if proc.returncode != 0:
-            return []
-        feat_vector = [float(f) for f in out.decode().split(",")]
+        out = None
+        if mzn2feat.cache:
+            key = mzn2feat.cache_key(
+                [mzn_path], [dzn_path] if dzn_path else [], []
+            )
+            out = mzn2feat.cache.get(key)
+        if out is None:
+            proc = psutil.Popen(cmd.split(), stdout=PIPE)
+            try:
+                (out, err) = proc.communicate(timeout=timeout)
+            except TimeoutExpired:
+                for p in proc.children(recursive=True) + [proc]:
+                    try:
+                        p.kill()
+                    except psutil.NoSuchProcess:
+                        pass
+                proc.communicate()
+                return []
+            # Failure in features extraction.
+            if proc.returncode != 0:
+                return []
+            out = out.decode()
+            if mzn2feat.cache:
+                mzn2feat.cache.put(key, out)
+        feat_vector = [float(f) for f in out.split(",")]
         return feat_vector
 
+    @staticmethod
+    def cache_key(mzn_paths, dzn_paths, args):
+        """
+        Returns the cache key of the mzn2feat output for the given models,
+        data files and extra arguments. The key only depends on the contents
+        of the files (and of the models they include), not on their paths, and
+        on the mzn2feat executable: a new version of the extractor does not
+        use the outputs of the old one.
+        """
+        models = []
+        for mzn_path in mzn_paths:
+            models.append(file_digest(mzn_path))
+            # Included models are identified by their relative paths.
+            mzn_dir = os.path.dirname(mzn_path)
+            models += [
+                (os.path.relpath(path, mzn_dir), file_digest(path))
+                for path in get_includes(mzn_path)
+            ]
+        data = [file_digest(dzn_path) for dzn_path in dzn_paths]
+        return make_key(
+            'mzn2feat', program_stamp('mzn2feat'), models, data, args
+        )
+
     @staticmethod
     def normalize(feat_vector, lims, lb=-1, ub=1, def_value=-1):
         """
@@ -85,6 +184,8 @@ class new_extractor:
 
     @staticmethod
     def extract_features(args):
+        # args is [problem, lims_path, timeout], where timeout is the time
+        # budget in seconds (or None).
         #args parsing and processing
         ...
         return feature_vector
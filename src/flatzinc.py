@@ -0,0 +1,309 @@
+'''
+FlatZincFile is an indexed FlatZinc model, where constraints on the objective
+variable can be added without reading and rewriting the whole model.
+
+The byte offsets of the solve item and of the objective variable declaration
+are computed once, when the object is created. Since a constraint item can
+immediately precede the solve item (which is the last item of a FlatZinc
+model), a constraint is added by truncating the file at the solve item and
+then writing the constraint followed by the solve item. In particular, the
+bound of the objective function injected at each restart of a solver replaces
+the previous one, so the file does not grow. Only the "output_var" annotation
+of the objective variable requires to copy the model (once).
+
+A FlatZinc model can share its data with other files (e.g., when it is a hard
+link to the model compiled for another solver): in this case, it is copied
+before being modified in place.
+
+The declarations of the variables are indexed only on demand, for turning a
+solution printed by a solver into constraints fixing the value of its
+variables (e.g., for checking the solution with another solver).
+'''
+
+import os
+import re
+import mmap
+import shutil
+import tempfile
+
+# Size (in bytes) of the blocks used for copying and scanning a model.
+BLOCK_SIZE = 1 << 20
+
+# Dictionary (type, pattern) of the values of each FlatZinc type that can be
+# written in a constraint. Other values (e.g., the enums or the strings
+# printed through the output model) cannot be encoded.
+LITERALS = {
+    'int': re.compile(r'-?\d+'),
+    'bool': re.compile(r'true|false'),
+    'float': re.compile(r'-?\d+(\.\d+)?([eE][-+]?\d+)?'),
+    'set': re.compile(
+        r'-?\d+\.\.-?\d+|\{\s*(-?\d+\s*(,\s*-?\d+\s*)*)?\}'
+    )
+}
+
+
+def copy_range(src, dst, length):
+    """
+    Copies length bytes from the current position of file src to file dst.
+    """
+    while length > 0:
+        data = src.read(min(length, BLOCK_SIZE))
+        if not data:
+            break
+        dst.write(data)
+        length -= len(data)
+
+
+def tokenize(line):
+    """
+    Returns the list of the tokens of a FlatZinc item, as bytes.
+    """
+    return line.replace(b'::', b' ').replace(b';', b'').split()
+
+
+def split_items(text):
+    """
+    Returns the list of the comma-separated items of the string text, ignoring
+    the commas enclosed in brackets or braces (e.g., in set literals).
+    """
+    items = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c in '[{(':
+            depth += 1
+        elif c in ']})':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    if text[start:].strip():
+        items.append(text[start:].strip())
+    return items
+
+
+def parse_value(val):
+    """
+    Returns the list of the values of the string val printed by a solver for a
+    variable, i.e., the elements of val if it is an array (e.g., "array1d(1..2,
+    [4, 5])") or val itself otherwise.
+    """
+    if val.startswith('array'):
+        return split_items(val[val.index('[') + 1:val.rindex(']')])
+    return [val]
+
+
+def encode_value(typ, val):
+    """
+    Returns the FlatZinc literal of the value val (a string) of a variable of
+    type typ, or None if val cannot be encoded.
+    """
+    if not LITERALS[typ].fullmatch(val):
+        return None
+    if typ == 'float' and '.' not in val and 'e' not in val.lower():
+        # An integer value of a float variable.
+        return val + '.0'
+    return val
+
+
+def var_type(domain):
+    """
+    Returns the FlatZinc type ('int', 'bool', 'float', or 'set') of the
+    variables declared with the given domain (bytes).
+    """
+    if domain.startswith(b'set'):
+        return 'set'
+    if b'bool' in domain:
+        return 'bool'
+    if b'float' in domain or b'.' in domain.replace(b'..', b''):
+        return 'float'
+    return 'int'
+
+
+class FlatZincFile:
+    """
+    FlatZincFile is a FlatZinc model indexed by the offsets of its items.
+    """
+
+    # Absolute path of the FlatZinc model.
+    path = ''
+
+    # Objective variable of the model (for optimization problems).
+    obj_var = ''
+
+    # Byte offset of the solve item, and its bytes. The bound constraint is
+    # written between solve_offset and the solve item.
+    solve_offset = -1
+    solve_item = b''
+
+    # Dictionary (name, (type, elements)) of the variables declared in the
+    # model (see output_vars), or None if not yet indexed.
+    outputs = None
+
+    def __init__(self, path):
+        """
+        Class Constructor: indexes the FlatZinc model at the given path.
+        """
+        self.path = path
+        with open(path, 'rb') as infile:
+            size = infile.seek(0, os.SEEK_END)
+            block = BLOCK_SIZE
+            # The last line starting with "solve" is searched backward.
+            while True:
+                start = max(size - block, 0)
+                infile.seek(start)
+                data = infile.read(size - start)
+                idx = data.rfind(b'\nsolve')
+                if idx >= 0:
+                    idx += 1
+                    break
+                if start == 0:
+                    idx = 0 if data.startswith(b'solve') else len(data)
+                    break
+                block *= 4
+        self.solve_offset = start + idx
+        self.solve_item = data[idx:]
+        tokens = tokenize(self.solve_item.split(b'\n', 1)[0])
+        if tokens and tokens[-1] not in [b'solve', b'satisfy']:
+            self.obj_var = tokens[-1].decode()
+
+    def find_declaration(self):
+        """
+        Returns the pair (offset, line) of the declaration of the objective
+        variable, or None if it is not found.
+        """
+        if not self.obj_var or self.solve_offset == 0:
+            return None
+        pattern = re.compile(
+            rb'^var [^:\n]*: *' + re.escape(self.obj_var.encode()) +
+            rb'(?=[\s;:=])', re.MULTILINE
+        )
+        with open(self.path, 'rb') as infile:
+            with mmap.mmap(
+                infile.fileno(), self.solve_offset, access=mmap.ACCESS_READ
+            ) as mm:
+                match = pattern.search(mm)
+                if match is None:
+                    return None
+                end = mm.find(b'\n', match.start())
+                if end < 0:
+                    end = len(mm)
+                return match.start(), mm[match.start():end + 1]
+
+    def output_vars(self):
+        """
+        Returns the dictionary (name, (type, elements)) of the variables of the
+        model, where elements is the list of the variables (or values) making
+        up the variable name: [name] for a variable, the elements of its
+        definition for an array annotated with "output_array".
+        """
+        if self.outputs is not None:
+            return self.outputs
+        self.outputs = {}
+        if self.solve_offset == 0:
+            return self.outputs
+        pattern = re.compile(
+            rb'^(array \[[^\]\n]*\] of )?var ([^:\n]*): *(\w+)(.*)$',
+            re.MULTILINE
+        )
+        with open(self.path, 'rb') as infile:
+            with mmap.mmap(
+                infile.fileno(), self.solve_offset, access=mmap.ACCESS_READ
+            ) as mm:
+                for match in pattern.finditer(mm):
+                    array, domain, name, rest = match.groups()
+                    name = name.decode()
+                    if not array:
+                        self.outputs[name] = (var_type(domain), [name])
+                    elif b'output_array' in rest and b'=' in rest:
+                        elems = rest[rest.rindex(b'=') + 1:].strip(b' ;\r')
+                        self.outputs[name] = (
+                            var_type(domain),
+                            split_items(elems.decode().strip('[]'))
+                        )
+        return self.outputs
+
+    def equality_constraints(self, solution):
+        """
+        Returns the string of the constraint items fixing the variables of the
+        model to the values of solution, a list of (variable, value) pairs
+        printed by a solver. The variables not in the model, and those whose
+        value cannot be encoded in FlatZinc, are ignored.
+        """
+        outputs = self.output_vars()
+        cons = []
+        for (var, val) in solution:
+            if var not in outputs:
+                continue
+            typ, elems = outputs[var]
+            vals = [encode_value(typ, v) for v in parse_value(val)]
+            if len(vals) != len(elems) or None in vals:
+                continue
+            cons += [
+                'constraint ' + typ + '_eq(' + e + ',' + v + ');\n'
+                for (e, v) in zip(elems, vals)
+            ]
+        return ''.join(cons)
+
+    def add_output_var(self):
+        """
+        Adds the "output_var" annotation to the declaration of the objective
+        variable, if it is not already annotated (or defined). Returns True
+        iff the annotation is added.
+        """
+        decl = self.find_declaration()
+        if decl is None:
+            return False
+        offset, line = decl
+        tokens = tokenize(line)
+        if b'output_var' in tokens or b'=' in tokens:
+            return False
+        new_line = line.rstrip().rstrip(b';') + b' :: output_var;\n'
+        self.rewrite(offset, len(line), new_line)
+        self.solve_offset += len(new_line) - len(line)
+        return True
+
+    def rewrite(self, offset, length, data):
+        """
+        Replaces the model with a copy where the length bytes at offset are
+        replaced by data.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        try:
+            with open(self.path, 'rb') as infile, os.fdopen(fd, 'wb') as out:
+                copy_range(infile, out, offset)
+                out.write(data)
+                infile.seek(offset + length)
+                copy_range(infile, out, float('+inf'))
+            shutil.copymode(self.path, tmp_path)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def unshare(self):
+        """
+        Copies the model if it is a hard link, so that it can be modified in
+        place without modifying the other links.
+        """
+        if os.stat(self.path).st_nlink > 1:
+            self.rewrite(0, 0, b'')
+
+    def add_constraints(self, cons):
+        """
+        Permanently adds the constraints of the string cons (a sequence of
+        FlatZinc constraint items) to the model.
+        """
+        self.set_bound(cons)
+        self.solve_offset += len(cons.encode())
+
+    def set_bound(self, cons):
+        """
+        Sets the constraint items of the string cons as the bound constraint
+        of the model, replacing the previous one (if any).
+        """
+        self.unshare()
+        with open(self.path, 'r+b') as outfile:
+            outfile.seek(self.solve_offset)
+            outfile.write(cons.encode() + self.solve_item)
+            outfile.truncate()
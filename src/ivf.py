@@ -0,0 +1,143 @@
+'''
+IVFIndex is an approximate index over the feature vectors of a knowledge base,
+meant for very large knowledge bases where a small loss of recall is worth a
+big speedup in the neighbourhood computation.
+
+The index is an inverted file: the instances are clustered around nlist
+centroids by k-means, and a query only scans the instances of the nprobe
+clusters closer to the feature vector. The index is stored in the knowledge
+base folder as the files ivf.npz (centroids and clusters) and ivf.json (the
+build-time parameters).
+'''
+
+import json
+import numpy
+from balltree import distances
+
+# Maximum number of instances used for training the centroids.
+MAX_TRAIN_SIZE = 100000
+
+# Number of rows processed at once when assigning instances to centroids.
+CHUNK_SIZE = 10000
+
+
+class IVFIndex:
+    """
+    Inverted file index: the instances of the i-th cluster are the positions
+    perm[offsets[i]:offsets[i + 1]].
+    """
+
+    # Matrix of the cluster centroids, one per row.
+    centroids = None
+
+    # Cluster boundaries in perm.
+    offsets = None
+
+    # Permutation of the knowledge base positions, grouped by cluster.
+    perm = None
+
+    # Dictionary of the build-time parameters (nlist, nprobe, iters, seed).
+    params = None
+
+    def __init__(self, centroids, offsets, perm, params):
+        """
+        Class Constructor.
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.perm = perm
+        self.params = params
+
+    def save(self, path):
+        """
+        Stores the index in the folder at the given path.
+        """
+        numpy.savez(
+            path + '/ivf.npz', centroids=self.centroids,
+            offsets=self.offsets, perm=self.perm
+        )
+        with open(path + '/ivf.json', 'w') as outfile:
+            json.dump(self.params, outfile)
+
+    def query(self, features, feat_vector, k, nprobe=None):
+        """
+        Returns the positions of (approximately) the k rows of features closer
+        to feat_vector, sorted by increasing distance and then by position.
+        More than nprobe clusters are scanned if they contain less than k
+        instances.
+        """
+        if nprobe is None:
+            nprobe = self.params['nprobe']
+        feat_vector = numpy.asarray(feat_vector, dtype=float)
+        order = numpy.argsort(distances(self.centroids, feat_vector))
+        sizes = numpy.cumsum(numpy.diff(self.offsets)[order])
+        nprobe = max(nprobe, int(numpy.searchsorted(sizes, k)) + 1)
+        idx = numpy.concatenate([
+            self.perm[self.offsets[c]:self.offsets[c + 1]]
+            for c in order[:nprobe]
+        ])
+        dist = distances(features[idx], feat_vector)
+        return idx[numpy.lexsort((idx, dist))[:k]]
+
+
+def assign(features, centroids):
+    """
+    Returns the position of the closest centroid of each row of features.
+    """
+    norms = numpy.einsum('ij,ij->i', centroids, centroids)
+    labels = numpy.empty(features.shape[0], dtype=int)
+    for start in range(0, features.shape[0], CHUNK_SIZE):
+        chunk = numpy.asarray(features[start:start + CHUNK_SIZE])
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, where |x|^2 does not matter.
+        labels[start:start + CHUNK_SIZE] = \
+            (norms - 2 * chunk.dot(centroids.T)).argmin(axis=1)
+    return labels
+
+
+def build_ivf(features, nlist=0, nprobe=0, iters=10, seed=0):
+    """
+    Builds the IVFIndex of the given features matrix with nlist clusters,
+    trained by iters iterations of k-means. By default, nlist is 4 times the
+    square root of the number of instances, and nprobe is nlist / 16.
+    """
+    n = features.shape[0]
+    if nlist <= 0:
+        nlist = int(4 * n ** 0.5)
+    nlist = min(nlist, n)
+    if nprobe <= 0:
+        nprobe = max(1, nlist // 16)
+    params = {'nlist': nlist, 'nprobe': nprobe, 'iters': iters, 'seed': seed}
+    if n == 0:
+        return IVFIndex(features[:0], numpy.zeros(1, dtype=int),
+                        numpy.empty(0, dtype=int), params)
+    rng = numpy.random.default_rng(seed)
+    train = numpy.asarray(features[rng.permutation(n)[:MAX_TRAIN_SIZE]])
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = assign(train, centroids)
+        counts = numpy.bincount(labels, minlength=nlist)
+        sums = numpy.column_stack([
+            numpy.bincount(labels, weights=train[:, j], minlength=nlist)
+            for j in range(train.shape[1])
+        ])
+        # Empty clusters keep their previous centroid.
+        full = counts > 0
+        centroids[full] = sums[full] / counts[full][:, None]
+    labels = assign(features, centroids)
+    perm = numpy.argsort(labels, kind='stable')
+    offsets = numpy.concatenate(
+        ([0], numpy.cumsum(numpy.bincount(labels, minlength=nlist)))
+    )
+    return IVFIndex(centroids, offsets, perm, params)
+
+
+def load_ivf(path):
+    """
+    Loads the IVFIndex stored in the folder at the given path.
+    """
+    with open(path + '/ivf.json', 'r') as infile:
+        params = json.load(infile)
+    with numpy.load(path + '/ivf.npz') as arrays:
+        return IVFIndex(
+            arrays['centroids'], arrays['offsets'], arrays['perm'], params
+        )
@@ -0,0 +1,331 @@
+'''
+KnowledgeBase is the in-memory abstraction of a sunny-cp knowledge base, used
+for computing the neighbourhood of a problem without re-reading the knowledge
+base file at every query.
+
+A knowledge base <KB>_<pb> (where pb is either csp or cop) can be stored as a
+CSV file (see kb/README.md) or in binary form, i.e., as a folder <KB>_bin_<pb>
+containing:
+  features.npy  the matrix of the feature vectors, one row per instance;
+  time.npy      the float64 matrix of the solving times, one row per instance
+                and one column per solver;
+  score.npy     as above, for the solving scores (COPs only);
+  area.npy      as above, for the solving areas (COPs only);
+  insts         the instance identifiers, one per line, in the rows order;
+  solvers       the solver identifiers, one per line, in the columns order;
+  balltree.npz  the ball tree of the feature vectors (see balltree.py);
+  ivf.npz       the (optional) approximate index of the feature vectors, with
+  ivf.json      its build-time parameters (see ivf.py).
+The .npy files are memory-mapped, so a binary knowledge base is loaded almost
+instantly and shared via the page cache by concurrent sunny-cp processes.
+When both the forms are available, the binary one is used.
+'''
+
+import os
+import ast
+import csv
+import numpy
+from balltree import *
+from ivf import *
+
+# Knowledge bases already loaded, indexed by their path.
+LOADED_KBS = {}
+
+# Runtime information stored in binary knowledge bases.
+BIN_FIELDS = ['time', 'score', 'area']
+
+# Minimum knowledge base size for using the ball tree instead of a linear scan
+# (see kb/util/bench_knn.py for measuring the actual crossover).
+BALLTREE_MIN_SIZE = 100000
+
+
+class KnowledgeBase:
+    """
+    Index of a knowledge base: the feature vectors are stored in a contiguous
+    matrix having one row per instance, so that all the distances from a given
+    feature vector can be computed with a single vectorized operation.
+    """
+
+    # Path of the knowledge base, i.e., of its CSV file.
+    path = ''
+
+    # Array of the instance identifiers, in the order of the knowledge base.
+    insts = None
+
+    # Matrix of the feature vectors: the i-th row refers to insts[i].
+    features = None
+
+    # List of the runtime information of each instance (CSV form only).
+    infos = None
+
+    # List of the solver identifiers (binary form only).
+    solvers = None
+
+    # Dictionary (field, matrix) of the runtime information (binary form only).
+    tables = None
+
+    # BallTree of the feature vectors, if any (binary form only).
+    tree = None
+
+    # IVFIndex of the feature vectors, if any (binary form only).
+    ivf = None
+
+    def __init__(self, path):
+        """
+        Class Constructor: loads the knowledge base at the given path, in its
+        binary form if available.
+        """
+        self.path = path
+        if os.path.isdir(bin_path(path)):
+            self.load_bin(bin_path(path))
+        else:
+            self.load_csv(path)
+
+    def load_csv(self, path):
+        """
+        Parses the knowledge base CSV file at the given path.
+        """
+        insts = []
+        features = []
+        self.infos = []
+        with open(path, 'r') as infile:
+            for row in csv.reader(infile, delimiter='|'):
+                insts.append(row[0])
+                features.append([float(f) for f in row[1][1:-1].split(',')])
+                self.infos.append(row[2])
+        self.insts = numpy.array(insts, dtype=object)
+        if features:
+            self.features = numpy.ascontiguousarray(features, dtype=float)
+        else:
+            self.features = numpy.empty((0, 0))
+
+    def load_bin(self, path):
+        """
+        Memory-maps the binary knowledge base in the folder at the given path.
+        """
+        with open(path + '/insts', 'r') as infile:
+            self.insts = numpy.array(infile.read().splitlines(), dtype=object)
+        with open(path + '/solvers', 'r') as infile:
+            self.solvers = infile.read().splitlines()
+        self.features = load_npy(path + '/features.npy')
+        self.tables = {}
+        for field in BIN_FIELDS:
+            if os.path.exists(path + '/' + field + '.npy'):
+                self.tables[field] = load_npy(path + '/' + field + '.npy')
+        if os.path.exists(path + '/balltree.npz'):
+            self.tree = load_balltree(path + '/balltree.npz')
+        if os.path.exists(path + '/ivf.npz'):
+            self.ivf = load_ivf(path)
+
+    def __len__(self):
+        return len(self.insts)
+
+    def info(self, i):
+        """
+        Returns the runtime information of the i-th instance, i.e., a
+        dictionary {s_1: I_1, ..., s_m: I_m} as described in kb/README.md.
+        """
+        if self.tables is None:
+            return ast.literal_eval(self.infos[i])
+        return dict(
+            (solver, dict(
+                (field, float(table[i, j]))
+                for field, table in list(self.tables.items())
+            )) for j, solver in enumerate(self.solvers)
+        )
+
+    def neighbourhood(self, idx):
+        """
+        Returns the Neighbourhood made of the instances at positions idx.
+        """
+        if self.tables is None:
+            solvers, tables = decode_infos([self.infos[i] for i in idx])
+        else:
+            solvers = self.solvers
+            tables = dict(
+                (field, numpy.asarray(table[idx], dtype=float))
+                for field, table in list(self.tables.items())
+            )
+        return Neighbourhood(
+            list(self.insts[idx]), solvers,
+            dict((field, table.T) for field, table in list(tables.items()))
+        )
+
+    def nearest(self, feat_vector, k, approx=False):
+        """
+        Returns the positions of the k instances closer to feat_vector,
+        sorted by increasing Euclidean distance. Ties are broken by position,
+        as a stable sort of all the distances would do. The ball tree, if
+        any, is used for large knowledge bases. If approx is True and the
+        knowledge base has an approximate index, the returned instances are
+        only approximately the k closest ones.
+        """
+        n = len(self)
+        if n == 0 or k <= 0:
+            return numpy.empty(0, dtype=int)
+        assert len(feat_vector) == self.features.shape[1]
+        if approx and self.ivf is not None:
+            return self.ivf.query(self.features, feat_vector, min(k, n))
+        if self.tree is not None and n >= BALLTREE_MIN_SIZE:
+            return self.tree.query(self.features, feat_vector, min(k, n))
+        return self.scan(feat_vector, k)
+
+    def scan(self, feat_vector, k):
+        """
+        As nearest, but always performing a linear scan of the knowledge base.
+        """
+        n = len(self)
+        feat_vector = numpy.asarray(feat_vector, dtype=float)
+        dist = distances(self.features, feat_vector)
+        if k < n:
+            # Partial selection of the k smallest distances. The instances at
+            # distance equal to the k-th one are then taken by position.
+            kth = dist[numpy.argpartition(dist, k - 1)[:k]].max()
+            closer = numpy.flatnonzero(dist < kth)
+            ties = numpy.flatnonzero(dist == kth)[:k - len(closer)]
+            idx = numpy.concatenate((closer, ties))
+        else:
+            idx = numpy.arange(n)
+        return idx[numpy.argsort(dist[idx], kind='stable')]
+
+
+class Neighbourhood:
+    """
+    Neighbourhood of a problem, i.e., the runtime information of its nearest
+    instances as dense matrices with one row per solver and one column per
+    neighbour.
+    """
+
+    # List of the neighbour instances, sorted by increasing distance.
+    insts = None
+
+    # List of the solvers, in the order of the matrix rows.
+    solvers = None
+
+    # Dictionary (field, matrix) of the runtime information, where field is
+    # either 'time', 'score' (COPs only), or 'area' (COPs only).
+    tables = None
+
+    def __init__(self, insts, solvers, tables):
+        """
+        Class Constructor.
+        """
+        self.insts = insts
+        self.solvers = solvers
+        self.tables = tables
+
+    def __len__(self):
+        return len(self.insts)
+
+    def table(self, field, pfolio):
+        """
+        Returns the matrix of the given runtime information restricted to the
+        solvers of pfolio: the i-th row refers to solver pfolio[i].
+        """
+        rows = dict((s, i) for i, s in enumerate(self.solvers))
+        return self.tables[field][[rows[s] for s in pfolio]]
+
+
+def decode_infos(infos):
+    """
+    Decodes the runtime information infos of the CSV knowledge base, and
+    returns a pair (solvers, tables) where solvers is the list of the solvers
+    and tables is a dictionary (field, matrix) where each matrix has one row
+    per instance and one column per solver.
+    """
+    infos = [ast.literal_eval(info) for info in infos]
+    solvers = list(infos[0].keys()) if infos else []
+    tables = {}
+    for field in BIN_FIELDS:
+        if all(field in info[s] for info in infos for s in solvers):
+            tables[field] = numpy.array([
+                [info[s][field] for s in solvers] for info in infos
+            ], dtype=float).reshape(len(infos), len(solvers))
+    return solvers, tables
+
+
+def bin_path(path):
+    """
+    Returns the path of the binary form of the knowledge base at path, i.e.,
+    <KB>_bin_<pb> for the knowledge base <KB>_<pb>.
+    """
+    head, pb = path.rsplit('_', 1)
+    return head + '_bin_' + pb
+
+
+def load_npy(path):
+    """
+    Memory-maps the .npy file at the given path. Empty arrays, that cannot be
+    memory-mapped, are simply read.
+    """
+    try:
+        return numpy.load(path, mmap_mode='r')
+    except ValueError:
+        return numpy.load(path)
+
+
+def kb_exists(path):
+    """
+    Returns True iff the knowledge base at path exists, in any form.
+    """
+    return os.path.exists(path) or os.path.isdir(bin_path(path))
+
+
+def kb_mtime(path):
+    """
+    Returns the last modification time of the knowledge base at path.
+    """
+    if os.path.isdir(bin_path(path)):
+        return os.path.getmtime(bin_path(path) + '/features.npy')
+    return os.path.getmtime(path)
+
+
+def load_kb(path):
+    """
+    Returns the KnowledgeBase object of the knowledge base at the given path.
+    Each knowledge base is loaded only once, unless it is modified afterwards.
+    """
+    mtime = kb_mtime(path)
+    if path in LOADED_KBS and LOADED_KBS[path][0] == mtime:
+        return LOADED_KBS[path][1]
+    kb = KnowledgeBase(path)
+    LOADED_KBS[path] = (mtime, kb)
+    return kb
+
+
+def csv_to_bin(path):
+    """
+    Converts the knowledge base CSV file at path into its binary form.
+    """
+    kb = KnowledgeBase.__new__(KnowledgeBase)
+    kb.load_csv(path)
+    solvers, tables = decode_infos(kb.infos)
+    out_path = bin_path(path)
+    if not os.path.exists(out_path):
+        os.mkdir(out_path)
+    numpy.save(out_path + '/features.npy', kb.features)
+    for field, table in list(tables.items()):
+        # Runtime information is stored with the precision of the CSV form,
+        # so that the SUNNY schedules (and their tie-breaking) do not change.
+        numpy.save(
+            out_path + '/' + field + '.npy', table.astype(numpy.float64)
+        )
+    with open(out_path + '/insts', 'w') as outfile:
+        outfile.writelines(inst + '\n' for inst in kb.insts)
+    with open(out_path + '/solvers', 'w') as outfile:
+        outfile.writelines(s + '\n' for s in solvers)
+    build_balltree(kb.features).save(out_path + '/balltree.npz')
+
+
+def bin_to_csv(path):
+    """
+    Converts the binary form of the knowledge base at path into a CSV file.
+    Note that only the runtime information stored in binary form (i.e., the
+    solving time, score, and area) is written.
+    """
+    kb = KnowledgeBase.__new__(KnowledgeBase)
+    kb.load_bin(bin_path(path))
+    with open(path, 'w') as outfile:
+        writer = csv.writer(outfile, delimiter='|')
+        for i in range(0, len(kb)):
+            writer.writerow([kb.insts[i], kb.features[i].tolist(), kb.info(i)])
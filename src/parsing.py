@@ -40,6 +40,13 @@ Portfolio Options
   -K <PATH>
     Absolute path of the folder which contains the knowledge base. For more
     details, see the README file in kb folder
+  -N <KNN>
+    The k-NN algorithm used for computing the neighborhood of the problem. It
+    can be either "exact" or "approx". The "approx" mode uses the approximate
+    index of the knowledge base (see the README file in kb folder), trading a
+    small loss of recall for a big speedup on very large knowledge bases. If
+    the knowledge base has no approximate index, the exact k-NN is used. The
+    default value is "exact".
   -s <SCHEDULE>
     Specifies a static schedule to be run before executing the SUNNY algorithm.
     It must in the form  s_1,t_1,s_2,t_2,...,s_m,t_m  where t_i is the time
@@ -50,9 +57,21 @@ Portfolio Options
   -e <EXTRACTOR>
     Feature extractor used by sunny-cp. By default is "mzn2feat", but it can be
     changed by defining a corresponding class in src/features.py.
+  -x <TIME>
+    Time limit (in seconds) for extracting the features and computing the
+    neighborhood of the problem, which run in background while the solvers of
+    the static schedule keep running. If the time limit expires, the backup
+    solver(s) will be used. By default, it is equal to the timeout T of SUNNY
+    algorithm. Also the constant +inf is allowed.
   -a
     Prints to standard output all the solutions of the problem (for CSPs only).
     or all the sub-optimal solutions (for COPs only).
+  --coalesce-time <TIME>
+    With -a, prints at most one sub-optimal solution of a COP every <TIME>
+    seconds: the solutions found within <TIME> seconds from the last printed
+    one are coalesced, and only the latest (i.e., the best) of them is printed
+    when <TIME> seconds are elapsed or the search ends. By default, <TIME> is 0
+    and all the sub-optimal solutions are printed.
   -f
     Imposes the free search to all the running solvers, i.e., any search
     annotation will be ignored.
@@ -83,17 +102,21 @@ Solvers Options
     - if UNT_i produces a solution, sunny-cp exploits its FlatZinc output for
       checking such solution by using TRU_i. If an inconsistency is detected,
       UNT_i is killed. Otherwise, the solution is printed;
-    - If UNT_i proves the optimality, then the optimal solution is checked as
-      described above. However, line ========== is never printed (even when the
-      solution is sound);
+    - If UNT_i proves the optimality (or completes the search), then line
+      ========== is printed only after all the solutions of UNT_i are checked
+      as described above, and no inconsistency is detected;
     - In all the other cases (including failures of TRU_i) we assume that UNT_i
       gives a correct answer, and thus the corresponding solution is printed.
     Note that checked solutions can be partial, since the variable assignments
     considered in the solution check are all and only those printed by UNT_i
     on standard output. So, the solution check also depends on the output
-    annotations defined by the user in the MiniZinc model. This option clearly
-    introduces an overhead in the solving process, especially if UNT_i produces
-    a lot of sub-optimal solutions or TRU_i is not performant.
+    annotations defined by the user in the MiniZinc model. The checks are run
+    in background (at most two at a time) while the solvers keep running, and
+    a solution is printed only when its check is done. The pending check of a
+    sub-optimal solution is dropped when a better solution is found. However,
+    this option clearly introduces an overhead in the solving process,
+    especially if UNT_i produces a lot of sub-optimal solutions or TRU_i is not
+    performant.
     *** NOTE ***: This option, unset by default, only works with MiniZinc 2.x.
     While UNT_i must be different from TRU_i, it is however possible to have
     UNT_i = UNT_j or TRU_i = TRU_j for some distinct indexes i,j in {1, ..., k}
@@ -129,6 +152,39 @@ Helper Options
   --keep
     Do not erase the temporary files created by the solver and stored in the
     specified directory (useful for debugging). This option is unset by default
+  --cache-dir <PATH>
+    Caches the feature vectors, the solvers schedules and the FlatZinc models
+    in the folder <PATH>, which is shared by different executions of sunny-cp:
+    the features of a problem are not extracted again if its model (including
+    the models it includes) and data did not change, its schedule is not
+    recomputed for the same neighborhood and parameters, and its model is not
+    compiled again by a solver with the same conversion options and MiniZinc
+    library. The number of cache hits and misses is printed in the log. The
+    cache is disabled by default
+  --cache-size <SIZE>
+    Maximum size (in MB) of each cache stored in the folder specified with
+    --cache-dir. The least recently used entries are evicted first.
+    By default, <SIZE> is 64 MB
+  --fzn-cache-size <SIZE>
+    Maximum size (in MB) of the cache of the FlatZinc models stored in the
+    folder specified with --cache-dir. By default, <SIZE> is 1024 MB
+  --trace <PATH>
+    Records the events of the run (solvers start, compilation, suspension,
+    resumption, restart and kill, solutions, features extraction, schedule)
+    in the trace file <PATH>, as JSON lines or, if <PATH> ends with .json, in
+    the Chrome trace-event format. The command python src/timeline.py <PATH>
+    summarizes the trace. By default, no trace is recorded
+  --pin <MODE>
+    Pins the processes of each running solver to a dedicated core, among the
+    cores sunny-cp is allowed to run on, so that solvers do not migrate
+    across cores (e.g., when suspended and then resumed). <MODE> can be either
+    "core", for pinning a solver to its core only, or "numa", for pinning it
+    to the cores of the NUMA node of its core. The core of a suspended or
+    terminated solver is given to the next solver. If the solvers are more
+    than the cores, the solvers exceeding the cores are not pinned. A solver
+    waiting for a MiniZinc conversion shared with other solvers takes a core
+    only when its FlatZinc execution starts. By default, the solvers are not
+    pinned
   --csp-<OPTION> <VALUE>
     Allows to set the specific option only if the input problem is a CSP. Note
     that the '-' character of <OPTION> must be omitted. E.g., --csp-T 900 sets
@@ -139,6 +195,29 @@ Helper Options
     that the '-' character of <OPTION> must be omitted. E.g., --cop-T 900 sets
     the T parameter to 900 only if the problem is a COP, while such option
     is ignored if the problem is a COP.
+
+Daemon Mode
+===========
+  sunny-cp --daemon <SOCKET>
+    Runs sunny-cp as a daemon waiting for solving jobs on the Unix domain
+    socket at path <SOCKET>, instead of solving a problem. The daemon keeps the
+    modules, the portfolio definition, the default knowledge bases and their
+    normalization limits loaded, so that the startup cost of sunny-cp is paid
+    only once. Each job is run in a process forked by the daemon, and the
+    solvers schedules computed by the jobs are kept in memory by the daemon.
+  sunny-cp-client [--socket <SOCKET>] [OPTIONS] <MODEL.mzn> [DATA.dzn]
+    Solves the problem with the daemon waiting on <SOCKET>, with the same
+    options and output of sunny-cp. The default socket is given by the
+    SUNNY_CP_SOCKET environment variable, or is /tmp/sunny-cp-<UID>.sock. If
+    no daemon is waiting on the socket, sunny-cp is executed directly.
+
+Batch Mode
+==========
+  sunny-cp-batch [OPTIONS] <INSTANCES>
+    Solves all the problems listed in the file <INSTANCES> in a single
+    process, sharing a budget of cores among them: each problem is scheduled
+    on the cores it takes, and the cores of a solved problem are given to the
+    other problems. See sunny-cp-batch --help for its options.
 '''
 
 import sys
@@ -148,6 +227,8 @@ from defaults import *
 from features import *
 from problem import *
 from pfolio_solvers import *
+from knowledge_base import kb_exists
+from affinity import PIN_MODES
 
 
 def parse_arguments(args):
@@ -163,11 +244,13 @@ def parse_arguments(args):
 
     # Initialize variables with the default values.
     k = DEF_K
-    check = DEF_CHECK
+    knn = DEF_KNN
+    check = dict(DEF_CHECK)
     timeout = DEF_TOUT
     backup = DEF_BACKUP
-    static = DEF_STATIC
+    static = list(DEF_STATIC)
     extractor = DEF_EXTRACTOR
+    extraction_time = DEF_EXTRACTION_TIME
     cores = DEF_CORES
     tmp_dir = DEF_TMP_DIR
     keep = DEF_KEEP
@@ -176,6 +259,12 @@ def parse_arguments(args):
     free_opt = DEF_FREE
     lb = DEF_LB
     ub = DEF_UB
+    cache_dir = DEF_CACHE_DIR
+    cache_size = DEF_CACHE_SIZE
+    coalesce_time = DEF_COALESCE_TIME
+    fzn_cache_size = DEF_FZN_CACHE_SIZE
+    trace = DEF_TRACE
+    pin = DEF_PIN
     solver_options = dict((s, {
         'wait_time': DEF_WAIT_TIME,
         'restart_time': DEF_RESTART_TIME,
@@ -214,12 +303,25 @@ def parse_arguments(args):
                 cores = n
         elif o == '-e':
             extractor = a
+        elif o == '-x':
+            extraction_time = float(a)
+            if extraction_time <= 0:
+                print('Error! Non-positive value ' + a +
+                      ' for extraction time.\nFor help use --help',
+                      file=sys.stderr)
+                sys.exit(2)
         elif o == '-k':
             k = int(a)
             if k < 0:
                 print('Error! Negative value ' + a +
                       ' for k value.\nFor help use --help', file=sys.stderr)
                 sys.exit(2)
+        elif o == '-N':
+            if a not in ['exact', 'approx']:
+                print('Error! Unknown k-NN algorithm ' + a +
+                      '.\nFor help use --help', file=sys.stderr)
+                sys.exit(2)
+            knn = a
         elif o == '-T':
             timeout = float(a)
             if timeout <= 0:
@@ -244,7 +346,7 @@ def parse_arguments(args):
                 pb = 'csp'
             kb = path + name + '_' + pb
             lims = path + name + '_lims_' + pb
-            if not os.path.exists(kb):
+            if not kb_exists(kb):
                 print('Error! File ' + kb + ' not exists.', file=sys.stderr)
                 print('For help use --help', file=sys.stderr)
                 sys.exit(2)
@@ -254,7 +356,7 @@ def parse_arguments(args):
                 sys.exit(2)
         elif o == '-s':
             s = a.split(',')
-            for i in range(0, len(s) / 2):
+            for i in range(0, len(s) // 2):
                 solver = s[2 * i]
                 time = float(s[2 * i + 1])
                 if time < 0:
@@ -317,9 +419,42 @@ def parse_arguments(args):
                     item['max_restarts'] = int(a)
         elif o == '--keep':
             keep = True
+        elif o == '--cache-dir':
+            if not os.path.isdir(a):
+                print('Error! Directory ' + a + ' not exists.',
+                      file=sys.stderr)
+                print('For help use --help', file=sys.stderr)
+                sys.exit(2)
+            cache_dir = a.rstrip('/') or '/'
+        elif o == '--cache-size':
+            cache_size = float(a)
+            if cache_size < 0:
+                print('Error! Negative cache size ' + a, file=sys.stderr)
+                print('For help use --help', file=sys.stderr)
+                sys.exit(2)
+        elif o == '--fzn-cache-size':
+            fzn_cache_size = float(a)
+            if fzn_cache_size < 0:
+                print('Error! Negative cache size ' + a, file=sys.stderr)
+                print('For help use --help', file=sys.stderr)
+                sys.exit(2)
+        elif o == '--trace':
+            trace = a
+        elif o == '--pin':
+            if a not in PIN_MODES:
+                print('Error! Unknown pinning mode ' + a, file=sys.stderr)
+                print('For help use --help', file=sys.stderr)
+                sys.exit(2)
+            pin = a
+        elif o == '--coalesce-time':
+            coalesce_time = float(a)
+            if coalesce_time < 0:
+                print('Error! Not acceptable negative time', file=sys.stderr)
+                print('For help use --help', file=sys.stderr)
+                sys.exit(2)
         elif o == '--check-solvers':
             s = a.split(',')
-            for i in range(0, len(s) / 2):
+            for i in range(0, len(s) // 2):
                 unt = s[2 * i]
                 tru = s[2 * i + 1]
                 if unt == tru:
@@ -327,7 +462,12 @@ def parse_arguments(args):
                           file=sys.stderr)
                     print('For help use --help', file=sys.stderr)
                     sys.exit(2)
-                check[unt] = tru
+                if unt not in DEF_PFOLIO or tru not in DEF_PFOLIO:
+                    print('Error! Unknown solver in ' + a, file=sys.stderr)
+                    print('For help use --help', file=sys.stderr)
+                    sys.exit(2)
+                # Untrusted solvers are identified by their names.
+                check[DEF_PFOLIO[unt]['name']] = tru
         elif o.startswith('--csp-') and solve == 'sat' \
           or o.startswith('--cop-') and solve != 'sat':
             if len(o) == 7:
@@ -339,7 +479,8 @@ def parse_arguments(args):
     problem = Problem(mzn, dzn, tmp_id + '.ozn', solve)
     return problem, k, timeout, pfolio, backup, kb, lims, static, extractor, \
         cores, solver_options, tmp_id, mem_limit, keep, all_opt, free_opt, \
-        lb, ub, check
+        lb, ub, check, knn, cache_dir, cache_size, extraction_time, \
+        coalesce_time, fzn_cache_size, trace, pin
 
 
 def get_args(args, pfolio):
@@ -349,8 +490,8 @@ def get_args(args, pfolio):
     dzn = ''
     try:
         options = [
-            'P', 'R', 'A', 'T', 'k', 'b', 'K', 's', 'd', 'p', 'e', 'm', 'l',
-            'u'
+            'P', 'R', 'A', 'T', 'k', 'b', 'K', 'N', 's', 'd', 'p', 'e', 'x',
+            'm', 'l', 'u'
         ]
         long_options = [
             'fzn-options', 'wait-time', 'restart-time', 'max-restarts'
@@ -358,7 +499,10 @@ def get_args(args, pfolio):
         long_options += [
             o + '-' + s for o in long_options for s in pfolio
         ]
-        long_options += ['check-solvers']
+        long_options += [
+            'check-solvers', 'cache-dir', 'cache-size', 'coalesce-time',
+            'fzn-cache-size', 'trace', 'pin'
+        ]
         csp_opts = ['csp-' + o + '=' for o in options + long_options] + \
             ['csp-a'] + ['csp-f']
         cop_opts = ['cop-' + o + '=' for o in options + long_options] + \
@@ -369,7 +513,7 @@ def get_args(args, pfolio):
         long_noval += ['cop-' + o for o in long_noval]
         long_options += long_noval + csp_opts + cop_opts
         opts, args = getopt.getopt(
-            args, 'hafT:k:b:K:s:d:p:e:x:m:l:u:P:R:A:', long_options
+            args, 'hafT:k:b:K:N:s:d:p:e:x:m:l:u:P:R:A:', long_options
         )
     except getopt.error as msg:
         print(msg)
@@ -0,0 +1,931 @@
+'''
+Portfolio is an asyncio implementation of the solving phase of sunny-cp: it
+runs a parallel schedule of constituent solvers on a problem, and yields the
+solutions of the problem as soon as they are found. Unlike bin/sunny-cp, the
+state of the solving process is kept in the Portfolio object, so a single
+Python process can drive many concurrent portfolios, e.g.:
+
+    async def solve(problem, schedule, cores):
+        async for solution in Portfolio(schedule, cores).solve(problem):
+            print(solution.output(), end='')
+
+where schedule is a parallel schedule computed by SUNNY algorithm (see
+scheduling.py), i.e., a list of pairs (solver, time), and each problem has its
+own ozn_path. As in sunny-cp:
+
+  - the static schedule (-s option) is run while the SUNNY schedule is being
+    computed (see extend), and its solvers are suspended at their timeout
+    and resumed when scheduled again;
+  - the solutions of untrusted solvers are checked (--check-solvers option);
+  - when the running solvers exceed the memory limit (-m option), the solver
+    using the most memory is killed;
+  - the solvers with the same flattening signature share their conversion
+    MiniZinc -> FlatZinc, which can be cached in a FileCache (see cache.py);
+  - the events of the solvers are recorded on a Timeline (see timeline.py).
+
+The comments printed by sunny-cp are not printed: the events are only
+recorded on the timeline.
+'''
+
+import os
+import time
+import shutil
+import signal
+import asyncio
+import tempfile
+import psutil
+from asyncio.subprocess import DEVNULL, PIPE
+from cache import make_key, clone_file
+from compilation import flattening_signature, compilation_key
+from defaults import DEF_WAIT_TIME, DEF_RESTART_TIME, DEF_RESTARTS
+from flatzinc import FlatZincFile
+from pfolio_solvers import DEF_PFOLIO
+from solver import RunningSolver, parse_assignment, check_model_cmd, \
+    check_model_of, check_constraints, check_outcome
+from timeline import Timeline
+
+# Maximum length (in bytes) of a line printed by a solver.
+LINE_LIMIT = 1 << 24
+
+# Time in seconds between two checks of the memory used by the solvers.
+MEM_CHECK_TIME = 0.5
+
+# Maximum number of solution checks running in parallel.
+CHECK_WORKERS = 2
+
+
+def signal_tree(pid, sig):
+    """
+    Sends the signal sig to the process pid, and to all its descendants.
+    """
+    try:
+        proc = psutil.Process(pid)
+        procs = proc.children(recursive=True) + [proc]
+    except psutil.NoSuchProcess:
+        return
+    for p in procs:
+        try:
+            p.send_signal(sig)
+        except psutil.NoSuchProcess:
+            pass
+
+
+def mem_percent(pid):
+    """
+    Returns the memory usage (in percent) of the process pid and of all its
+    descendants.
+    """
+    try:
+        proc = psutil.Process(pid)
+        procs = proc.children(recursive=True) + [proc]
+    except psutil.NoSuchProcess:
+        return 0
+    m = 0
+    for p in procs:
+        try:
+            m += p.memory_percent()
+        except psutil.NoSuchProcess:
+            pass
+    return m
+
+
+class Solution:
+    """
+    Solution of a problem, found by a constituent solver.
+    """
+
+    # Name of the solver that found the solution.
+    solver = ''
+
+    # List of the (variable, value) pairs of the solution.
+    assignment = None
+
+    # Objective value of the solution (None for CSPs).
+    objective = None
+
+    # Status of the solution. It can be either:
+    #     'sat': a solution of the problem
+    #     'opt': the search is complete, so the solution (if any) is optimal
+    #   'unsat': the problem has no solution
+    status = ''
+
+    def __init__(self, solver, assignment, objective, status):
+        """
+        Class Constructor.
+        """
+        self.solver = solver
+        self.assignment = assignment
+        self.objective = objective
+        self.status = status
+
+    def output(self):
+        """
+        Returns the solution in the output format of sunny-cp.
+        """
+        if self.status == 'unsat':
+            return '=====UNSATISFIABLE=====\n'
+        lines = [var + ' = ' + val + ';\n' for (var, val) in self.assignment]
+        if self.assignment:
+            lines.append('----------\n')
+        if self.status == 'opt':
+            lines.append('==========\n')
+        return ''.join(lines)
+
+
+class Portfolio:
+    """
+    Portfolio runs a parallel schedule of solvers on a problem.
+    """
+
+    # List of the pairs (solver, time) of the parallel schedule (None until
+    # the schedule is given, see extend).
+    schedule = None
+
+    # Number of cores.
+    cores = 0
+
+    # Dictionary (solver, options) of the solver options, as returned by
+    # parse_arguments (wait_time, restart_time and max_restarts).
+    options = None
+
+    # Options -a and -f of sunny-cp.
+    all_opt = False
+    free_opt = False
+
+    # Lower and upper bound of the objective function (for COPs only).
+    lb = float('-inf')
+    ub = float('+inf')
+
+    # List of the pairs (solver, time) of the static schedule.
+    static = None
+
+    # Dictionary (untrusted, trusted) of the solvers checking the solutions
+    # of the untrusted solvers.
+    check = None
+
+    # Maximum percentage of memory used by the running solvers.
+    mem_limit = 100
+
+    # FileCache of the FlatZinc models compiled by the solvers (or None).
+    fzn_cache = None
+
+    # Timeline recording the events of the solvers.
+    timeline = None
+
+    # Problem being solved (None if the portfolio is not solving).
+    problem = None
+
+    # List of the solvers of the schedule not started yet (while solving).
+    pending = None
+
+    # Dictionary (solver, task) of the running and suspended solvers.
+    tasks = None
+
+    # Dictionary (solver, future) of the suspended solvers: the future is
+    # resolved when the solver is resumed.
+    suspended = None
+
+    # Set of the solvers of the static schedule.
+    static_solvers = None
+
+    # Set of the names of the solvers failed so far: they are not run again.
+    failed = None
+
+    # Set of the solvers killed for exceeding the memory limit.
+    oom = None
+
+    # List of the solution checks not processed yet, in order of submission.
+    checks = None
+
+    def __init__(
+        self, schedule, cores, options=None, all_opt=False, free_opt=False,
+        lb=float('-inf'), ub=float('+inf'), static=(), check=None,
+        mem_limit=100, fzn_cache=None, timeline=None
+    ):
+        """
+        Class Constructor.
+        """
+        self.schedule = schedule
+        self.cores = cores
+        self.options = options or {}
+        self.all_opt = all_opt
+        self.free_opt = free_opt
+        self.lb = lb
+        self.ub = ub
+        self.static = list(static)
+        self.check = check or {}
+        self.mem_limit = mem_limit
+        self.fzn_cache = fzn_cache
+        self.timeline = timeline or Timeline()
+        self.pending = []
+        self.tasks = {}
+        self.suspended = {}
+        self.static_solvers = set()
+        self.failed = set()
+        self.oom = set()
+        self.checks = []
+
+    async def solve(self, problem):
+        """
+        Solves the problem, yielding a Solution object for each solution (for
+        COPs, each solution better than the previous ones). The last Solution
+        has status 'opt' or 'unsat' if the search is complete, otherwise the
+        generator stops when all the solvers are terminated. If no schedule is
+        given, the solvers of the static schedule run until the schedule is
+        given by extend.
+        """
+        # State of the solving process: the pending solvers, the tasks of the
+        # running and suspended solvers, the queue of their Solution objects,
+        # the FlatZinc models shared by the solvers (and the futures of their
+        # conversion processes), and the check models.
+        self.problem = problem
+        self.queue = asyncio.Queue()
+        self.best = []
+        self.tmp_dir = tempfile.mkdtemp(prefix='sunny-cp-')
+        self.shared = {}
+        self.conversions = {}
+        self.compiled = set()
+        self.rejected = set()
+        self.check_models = {}
+        self.check_copies = {}
+        self.check_locks = {}
+        self.check_procs = set()
+        self.check_slots = asyncio.Semaphore(CHECK_WORKERS)
+        self.pending = self.running_schedule(self.static)
+        self.static_solvers = set(self.pending)
+        monitor = None
+        if self.mem_limit < 100:
+            monitor = asyncio.ensure_future(self.monitor())
+        try:
+            if self.schedule is not None:
+                self.pending += self.running_schedule(self.schedule)
+            for _ in range(self.cores):
+                if self.pending:
+                    self.start(self.pending.pop(0))
+            while self.running() or self.checks or self.schedule is None \
+                    or not self.queue.empty():
+                item = await self.queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    continue
+                yield item
+                if item.status in ['opt', 'unsat'] or \
+                   problem.isCSP() and not self.all_opt:
+                    break
+        finally:
+            if monitor:
+                monitor.cancel()
+            procs = []
+            for chk in self.checks:
+                chk['task'].cancel()
+            for proc in self.check_procs:
+                signal_tree(proc.pid, signal.SIGKILL)
+                procs.append(proc)
+            for solver, task in list(self.tasks.items()):
+                task.cancel()
+                if solver.process and solver.process.returncode is None:
+                    signal_tree(solver.process.pid, signal.SIGKILL)
+                    procs.append(solver.process)
+            # The killed processes are reaped before returning.
+            for proc in procs:
+                await proc.wait()
+            self.problem = None
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def running_schedule(self, schedule):
+        """
+        Returns the list of the RunningSolver objects of the pairs (solver,
+        time) of schedule, skipping the solvers failed so far.
+        """
+        solvers = []
+        for (s, t) in schedule:
+            if DEF_PFOLIO[s]['name'] in self.failed:
+                continue
+            opts = self.options.get(s, {})
+            solvers.append(RunningSolver(
+                DEF_PFOLIO[s], self.problem.solve,
+                self.tmp_dir + '/' + s + '.fzn',
+                '-a' if self.all_opt else '', '-f' if self.free_opt else '',
+                float(opts.get('wait_time', DEF_WAIT_TIME)),
+                opts.get('restart_time', DEF_RESTART_TIME), t,
+                opts.get('max_restarts', DEF_RESTARTS)
+            ))
+        return solvers
+
+    def running(self):
+        """
+        Returns the list of the running (i.e., not suspended) solvers.
+        """
+        return [s for s in self.tasks if s not in self.suspended]
+
+    def extend(self, schedule):
+        """
+        Gives the parallel schedule (a list of pairs (solver, time)) to a
+        portfolio created without it: its solvers are run after those of the
+        static schedule, starting from the cores not taken by the latter.
+        """
+        self.schedule = schedule
+        if self.problem is None:
+            return
+        self.pending += self.running_schedule(schedule)
+        while len(self.running()) < self.cores and self.pending:
+            self.start(self.pending.pop(0))
+        self.queue.put_nowait(None)
+
+    def start(self, solver):
+        """
+        Starts a task running solver, unless a suspended solver has the same
+        name: in this case, the latter is resumed for the time of solver.
+        """
+        for susp in list(self.suspended):
+            if susp.name() == solver.name():
+                if solver not in self.static_solvers:
+                    # It is killed at its timeout, as the other solvers of
+                    # the parallel schedule.
+                    self.static_solvers.discard(susp)
+                self.resume(susp, solver.timeout)
+                return
+        task = asyncio.ensure_future(self.run(solver))
+        self.tasks[solver] = task
+
+        def done(task):
+            del self.tasks[solver]
+            self.suspended.pop(solver, None)
+            if task.cancelled():
+                self.queue.put_nowait(None)
+            else:
+                self.queue.put_nowait(task.exception())
+
+        task.add_done_callback(done)
+
+    def grow(self, cores):
+        """
+        Gives at most cores more cores to the portfolio, for starting ahead
+        the pending solvers of the schedule having some time allocated.
+        Returns the number of cores actually taken (none, if the portfolio is
+        not solving).
+        """
+        taken = 0
+        while taken < cores and self.pending and self.pending[0].timeout > 0:
+            self.start(self.pending.pop(0))
+            taken += 1
+        self.cores += taken
+        return taken
+
+    def signal(self, solver, sig):
+        """
+        Sends the signal sig to the process of solver (if any), and to its
+        descendants. A MiniZinc conversion shared by other solvers is not
+        killed, and it is not stopped while another solver is running it.
+        """
+        proc = solver.process
+        if proc is None or proc.returncode is not None:
+            return
+        sharing = [
+            s for s in self.tasks if s is not solver and s.process is proc
+        ]
+        if sig == signal.SIGSTOP:
+            sharing = [s for s in sharing if s not in self.suspended]
+        if sig != signal.SIGCONT and sharing:
+            return
+        signal_tree(proc.pid, sig)
+
+    def kill(self, solver):
+        """
+        Kills the process of solver (if any) and its descendants.
+        """
+        self.timeline.event('kill', solver.name(), span='')
+        self.signal(solver, signal.SIGKILL)
+
+    def suspend(self, solver):
+        """
+        Suspends solver, which reached its timeout.
+        """
+        self.timeline.event('suspend', solver.name(), span='suspended')
+        self.signal(solver, signal.SIGSTOP)
+        self.suspended[solver] = asyncio.get_event_loop().create_future()
+        # The solving loop checks whether some solver is still running.
+        self.queue.put_nowait(None)
+
+    def resume(self, solver, timeout):
+        """
+        Resumes the suspended solver, and runs it for timeout seconds.
+        """
+        future = self.suspended.pop(solver)
+        self.timeline.event('resume', solver.name(), span='search'
+                            if solver.status == 'flatzinc' else 'compile')
+        self.signal(solver, signal.SIGCONT)
+        solver.timeout = timeout
+        solver.start_time = time.time()
+        solver.solution_time = time.time()
+        future.set_result(None)
+
+    def discard(self, solver):
+        """
+        Kills the suspended solver.
+        """
+        self.kill(solver)
+        self.suspended.pop(solver)
+        self.tasks[solver].cancel()
+
+    async def run(self, solver):
+        """
+        Runs solver until its termination, or until its core is given to
+        another solver.
+        """
+        problem = self.problem
+        while True:
+            if solver.status == 'ready':
+                solver.status = 'mzn2fzn'
+                if self.compiled_fzn(solver):
+                    # The conversion MiniZinc -> FlatZinc is skipped.
+                    continue
+                if not await self.share_compilation(solver):
+                    signature = flattening_signature(solver.solv_dict)
+                    future = asyncio.get_event_loop().create_future()
+                    self.conversions[signature] = future
+                    solver.process = await asyncio.create_subprocess_exec(
+                        *solver.mzn2fzn_cmd(problem, self.shared_fzn(solver)),
+                        stdout=DEVNULL, stderr=DEVNULL
+                    )
+                    future.set_result(solver.process)
+                    self.timeline.event(
+                        'compile', solver.name(), span='compile'
+                    )
+            else:
+                if solver.status == 'mzn2fzn':
+                    if problem.isCOP() and not solver.obj_var:
+                        solver.set_obj_var(problem, self.lb, self.ub)
+                    solver.status = 'flatzinc'
+                elif solver.name() == problem.best_solver or \
+                        problem.bound_better_than(solver.obj_value):
+                    solver.inject_bound(problem.best_bound)
+                solver.process = await asyncio.create_subprocess_exec(
+                    *solver.flatzinc_cmd(problem), stdout=PIPE,
+                    stderr=DEVNULL, limit=LINE_LIMIT
+                )
+                self.timeline.event('search', solver.name(), span='search')
+            solver.start_time = time.time()
+            solver.solution_time = time.time()
+            outcome = await self.supervise(solver)
+            while outcome == 'suspend':
+                await self.suspended[solver]
+                outcome = await self.supervise(solver)
+            elapsed = time.time() - solver.start_time
+            if outcome == 'exit':
+                self.timeline.event(
+                    'exit', solver.name(), span='', status=solver.status,
+                    returncode=solver.process.returncode
+                )
+            if outcome == 'restart':
+                self.timeline.event('restart', solver.name())
+                solver.num_restarts += 1
+                solver.timeout = max(solver.timeout - elapsed, 0)
+            elif outcome == 'exit' and solver.status == 'mzn2fzn' and \
+                    solver.process.returncode == 0:
+                self.compiled_by(solver)
+                solver.timeout = max(solver.timeout - elapsed, 0)
+            elif outcome == 'exit':
+                if solver in self.oom:
+                    # As in sunny-cp, its core is not given to another
+                    # solver.
+                    return
+                if solver.process.returncode != 0:
+                    self.fail(solver)
+                self.next(solver)
+                return
+            else:
+                return
+
+    def shared_fzn(self, solver):
+        """
+        Returns the path of the FlatZinc model compiled for solver, which is
+        shared by the solvers with the same flattening signature.
+        """
+        signature = flattening_signature(solver.solv_dict)
+        if signature not in self.shared:
+            self.shared[signature] = \
+                self.tmp_dir + '/' + make_key(*signature)[:12] + '.fzn'
+        return self.shared[signature]
+
+    def fzn_cache_entry(self, solver):
+        """
+        Returns a pair (key, files) where key identifies the compilation of
+        the problem by solver in the fzn_cache, and files is the dictionary
+        (extension, path) of the compiled files. The key is None if there is
+        no fzn_cache or the compilation cannot be cached.
+        """
+        if self.fzn_cache is None:
+            return None, None
+        key = compilation_key(self.problem, solver.solv_dict)
+        return key, {'.fzn': self.shared_fzn(solver),
+                     '.ozn': self.problem.ozn_path}
+
+    def compiled_fzn(self, solver):
+        """
+        Returns True iff the FlatZinc model of solver is already compiled (or
+        found in the fzn_cache), copying it to the fzn_path of solver.
+        """
+        signature = flattening_signature(solver.solv_dict)
+        if signature not in self.compiled:
+            key, files = self.fzn_cache_entry(solver)
+            if not key or not self.fzn_cache.get(key, files):
+                return False
+            self.compiled.add(signature)
+        clone_file(self.shared_fzn(solver), solver.fzn_path)
+        return True
+
+    async def share_compilation(self, solver):
+        """
+        Makes solver wait for the conversion of another solver with the same
+        flattening signature (which is resumed, if suspended). Returns False
+        if there is no such conversion, or if it was killed or failed.
+        """
+        signature = flattening_signature(solver.solv_dict)
+        if signature not in self.conversions:
+            return False
+        # The process of the conversion may be still starting.
+        proc = await self.conversions[signature]
+        if proc.returncode not in [None, 0]:
+            return False
+        solver.process = proc
+        self.signal(solver, signal.SIGCONT)
+        self.timeline.event(
+            'compile', solver.name(), span='compile', shared=True
+        )
+        return True
+
+    def compiled_by(self, solver):
+        """
+        Marks as compiled the FlatZinc model converted by solver, possibly
+        storing it in the fzn_cache, and copies it to the fzn_path of solver.
+        """
+        signature = flattening_signature(solver.solv_dict)
+        if signature not in self.compiled:
+            self.timeline.event('compiled', solver.name())
+            self.compiled.add(signature)
+            key, files = self.fzn_cache_entry(solver)
+            if key:
+                self.fzn_cache.put(key, files)
+        clone_file(self.shared_fzn(solver), solver.fzn_path)
+
+    async def supervise(self, solver):
+        """
+        Processes the output of the running solver until it exits ('exit'),
+        reaches its timeout ('timeout' or, if suspended, 'suspend'), or has
+        to be restarted ('restart').
+        """
+        problem = self.problem
+        proc = solver.process
+        while True:
+            timeout = solver.next_check(problem) - time.time()
+            timeout = None if timeout == float('+inf') else max(timeout, 0)
+            try:
+                if solver.status == 'flatzinc':
+                    line = await asyncio.wait_for(
+                        proc.stdout.readline(), timeout
+                    )
+                    if line:
+                        self.process_line(solver, line.rstrip())
+                        continue
+                await asyncio.wait_for(proc.wait(), timeout)
+                return 'exit'
+            except asyncio.TimeoutError:
+                pass
+            except ValueError:
+                # The solver printed a line longer than LINE_LIMIT: it is
+                # killed, and handled as a failed solver.
+                self.kill(solver)
+                await proc.wait()
+                return 'exit'
+            now = time.time()
+            if now - solver.start_time > solver.timeout and \
+               now - solver.solution_time > solver.wait_time:
+                if self.timeout(solver):
+                    if solver in self.suspended:
+                        return 'suspend'
+                    return 'timeout'
+            elif solver.status == 'flatzinc' and \
+                    problem.bound_better_than(solver.obj_value) and \
+                    now - solver.solution_time > solver.restart_time:
+                self.kill(solver)
+                await proc.wait()
+                if solver.num_restarts < solver.max_restarts:
+                    return 'restart'
+                # As in sunny-cp, its core is not given to another solver.
+                return 'timeout'
+
+    async def monitor(self):
+        """
+        Kills the running solver using the most memory whenever the running
+        solvers (if more than one) exceed mem_limit percent of the memory.
+        """
+        while True:
+            await asyncio.sleep(MEM_CHECK_TIME)
+            running = [
+                s for s in self.running()
+                if s.process and s not in self.oom
+            ]
+            if len(running) < 2:
+                continue
+            mems = [mem_percent(s.process.pid) for s in running]
+            if sum(mems) > self.mem_limit:
+                solver = running[mems.index(max(mems))]
+                self.oom.add(solver)
+                self.kill(solver)
+
+    def fail(self, solver):
+        """
+        Discards the next runs of solver, which failed.
+        """
+        self.failed.add(solver.name())
+        self.pending = [s for s in self.pending if s.name() != solver.name()]
+
+    def next(self, solver):
+        """
+        Gives the core of solver to the next pending solver or, if none, to a
+        suspended solver (if any), together with the time not used by solver.
+        """
+        remaining = solver.timeout + solver.start_time - time.time()
+        if self.pending:
+            new_solver = self.pending.pop(0)
+            new_solver.timeout += remaining
+            self.start(new_solver)
+        elif self.suspended:
+            new_solver = next(iter(self.suspended))
+            self.resume(new_solver, new_solver.timeout + remaining)
+
+    def timeout(self, solver):
+        """
+        Handles the timeout of solver. Returns True if solver is killed (or
+        suspended, if it is a solver of the static schedule), False if it
+        keeps running.
+        """
+        self.timeline.event('timeout', solver.name())
+        if solver in self.static_solvers:
+            stop = self.suspend
+        else:
+            stop = self.kill
+        if not self.pending:
+            stop(solver)
+            return True
+        new_solver = self.pending.pop(0)
+        if new_solver.timeout == 0:
+            # All the scheduled solvers have been run (or are running).
+            if len(self.running()) == 1 or \
+               solver.name() == self.problem.best_solver:
+                solver.timeout = float('+inf')
+                return False
+            self.kill(solver)
+            for susp in list(self.suspended):
+                if susp.name() == self.problem.best_solver:
+                    # The best solver so far is resumed.
+                    self.resume(susp, float('+inf'))
+                else:
+                    self.discard(susp)
+            self.pending = []
+            return True
+        if new_solver.name() == solver.name():
+            # As in sunny-cp, the solver keeps running, and its next timeout
+            # is handled by the next solver of the schedule.
+            return False
+        stop(solver)
+        self.start(new_solver)
+        return True
+
+    def process_line(self, solver, line):
+        """
+        Processes a line (of bytes) printed by solver. The solutions of an
+        untrusted solver are held until they are checked.
+        """
+        problem = self.problem
+        trusted = self.check.get(solver.name())
+        assignment = parse_assignment(line)
+        if assignment:
+            var, val = assignment
+            if val and var == solver.obj_var:
+                solver.obj_value = int(val)
+            solver.solution[var] = val
+            solver.solution_time = time.time()
+        elif line == b'----------':
+            if problem.isCSP() or \
+               problem.bound_worse_than(solver.obj_value):
+                if trusted:
+                    self.submit_check(solver, trusted)
+                else:
+                    self.accept(solver, self.solution_of(solver),
+                                solver.obj_value if problem.isCOP() else None)
+            solver.solution_time = time.time()
+        elif line == b'==========' or line == b'=====UNSATISFIABLE=====':
+            if not trusted:
+                self.complete(solver, line)
+            elif line == b'==========':
+                # The search is completed once the solutions of solver are
+                # checked.
+                self.submit_check(solver, trusted, final=True)
+
+    def solution_of(self, solver):
+        """
+        Returns the list of the (variable, value) pairs of the solution of
+        solver, without the objective variable if it is not an output variable
+        of the model.
+        """
+        return [
+            (var, val) for (var, val) in solver.solution.items()
+            if var != solver.obj_var or solver.output_var
+        ]
+
+    def accept(self, solver, solution, obj_value):
+        """
+        Accepts a (possibly checked) solution found by solver, having
+        objective value obj_value (for COPs only).
+        """
+        problem = self.problem
+        self.timeline.event('solution', solver.name(), objective=obj_value)
+        if problem.isCOP():
+            problem.best_bound = obj_value
+            problem.best_solver = solver.name()
+            self.best = solution
+            # The checks of the superseded solutions are dropped.
+            for chk in list(self.checks):
+                if not chk['final'] and \
+                   not problem.bound_worse_than(chk['obj_value']):
+                    chk['task'].cancel()
+                    self.checks.remove(chk)
+        self.queue.put_nowait(Solution(solver.name(), solution, obj_value,
+                                       'sat'))
+
+    def complete(self, solver, line):
+        """
+        Yields the outcome of the search completed by solver, i.e., line
+        (either ========== or =====UNSATISFIABLE=====).
+        """
+        problem = self.problem
+        self.timeline.event('completed', solver.name(), outcome=line.decode())
+        if problem.has_bound():
+            # With -a, the best solution has already been yielded.
+            self.queue.put_nowait(Solution(
+                solver.name(), [] if self.all_opt else self.best,
+                problem.best_bound, 'opt'
+            ))
+        elif line == b'==========':
+            self.queue.put_nowait(Solution(solver.name(), [], None, 'opt'))
+        else:
+            self.queue.put_nowait(Solution(solver.name(), [], None, 'unsat'))
+
+    def submit_check(self, solver, trusted, final=False):
+        """
+        Starts the check of the current solution of solver with the trusted
+        solver. The checks are processed in order of submission. If final is
+        True, solver completed the search: this is notified when all the
+        checks submitted so far are done.
+        """
+        problem = self.problem
+        obj_value = solver.obj_value if problem.isCOP() else None
+        for chk in self.checks:
+            if problem.isCOP() and chk['solver'] is solver and \
+               chk['obj_value'] == obj_value:
+                # The same solution is already being checked.
+                chk['final'] = chk['final'] or final
+                return
+        chk = {
+            'solver': solver,
+            'assignment': list(solver.solution.items()),
+            'solution': self.solution_of(solver),
+            'obj_value': obj_value,
+            'final': final
+        }
+        # There is nothing to check if the solution is already checked or
+        # superseded.
+        marker = final and not problem.bound_worse_than(obj_value)
+        previous = [c['task'] for c in self.checks]
+        chk['task'] = asyncio.ensure_future(
+            self.process_check(chk, None if marker else trusted, previous)
+        )
+
+        def done(task):
+            if task.cancelled():
+                self.queue.put_nowait(None)
+            else:
+                self.queue.put_nowait(task.exception())
+
+        chk['task'].add_done_callback(done)
+        self.checks.append(chk)
+
+    async def process_check(self, chk, trusted, previous):
+        """
+        Checks the solution of chk with the trusted solver (if any) and, once
+        the previous check tasks are done, processes its outcome. The solver
+        of an inconsistent solution is killed.
+        """
+        problem = self.problem
+        success = True
+        if trusted:
+            try:
+                success = await self.check_solution(
+                    trusted, chk['assignment'], chk['obj_value']
+                )
+            except RuntimeError:
+                # A failure of the trusted solver is not an inconsistency:
+                # the check is unavailable, and the solution is accepted
+                # unchecked.
+                pass
+        if previous:
+            await asyncio.wait(previous)
+        self.checks.remove(chk)
+        solver = chk['solver']
+        if solver in self.rejected:
+            return
+        if not success:
+            # The outcome of the other checks of solver is ignored.
+            self.rejected.add(solver)
+            if solver in self.suspended:
+                self.discard(solver)
+            else:
+                self.kill(solver)
+            return
+        if trusted and (
+            problem.isCSP() or problem.bound_worse_than(chk['obj_value'])
+        ):
+            self.accept(solver, chk['solution'], chk['obj_value'])
+        if chk['final'] and not problem.bound_better_than(chk['obj_value']):
+            self.complete(solver, b'==========')
+
+    async def check_solution(self, trusted, solution, bound):
+        """
+        Uses the trusted solver for checking the solution of the problem,
+        having objective value bound (for COPs only). Returns False iff an
+        inconsistency is detected, and raises a RuntimeError if the solution
+        cannot be checked.
+        """
+        model = await self.check_model(trusted)
+        if model is False:
+            return False
+        if model is None:
+            raise RuntimeError('model not compiled by ' + trusted)
+        solv = DEF_PFOLIO[trusted]
+        # The model is copied only once for each check running in parallel:
+        # then each check just replaces the constraints at the end of a copy.
+        copies = self.check_copies.setdefault(trusted, [])
+        if copies:
+            copy = copies.pop()
+        else:
+            fd, fzn_path = tempfile.mkstemp(suffix='.fzn', dir=self.tmp_dir)
+            os.close(fd)
+            clone_file(model.path, fzn_path)
+            copy = FlatZincFile(fzn_path)
+        try:
+            copy.set_bound(
+                check_constraints(model, solv, self.problem, solution, bound)
+            )
+            inf = float('inf')
+            rs = RunningSolver(
+                solv, self.problem.solve, copy.path, '', '', inf, inf, inf,
+                inf
+            )
+            outcome = await self.run_check(rs.flatzinc_cmd(self.problem))
+        finally:
+            copies.append(copy)
+        return check_outcome(trusted, *outcome)
+
+    async def check_model(self, trusted):
+        """
+        Returns the FlatZincFile of the model of the problem compiled by the
+        trusted solver for checking the solutions, compiling it at the first
+        call. Returns None if the compilation fails, and False if the model is
+        inconsistent.
+        """
+        lock = self.check_locks.setdefault(trusted, asyncio.Lock())
+        async with lock:
+            if trusted not in self.check_models:
+                fd, fzn_path = tempfile.mkstemp(
+                    suffix='.fzn', dir=self.tmp_dir
+                )
+                os.close(fd)
+                _, err, returncode = await self.run_check(check_model_cmd(
+                    DEF_PFOLIO[trusted], self.problem, fzn_path
+                ))
+                self.check_models[trusted] = \
+                    check_model_of(fzn_path, err, returncode)
+        return self.check_models[trusted]
+
+    async def run_check(self, cmd):
+        """
+        Runs the command of a check (at most CHECK_WORKERS at a time) until
+        its termination, and returns its (stdout, stderr, returncode) triple.
+        """
+        async with self.check_slots:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=PIPE, stderr=PIPE
+            )
+            self.check_procs.add(proc)
+            try:
+                out, err = await proc.communicate()
+            except asyncio.CancelledError:
+                # The check is dropped.
+                signal_tree(proc.pid, signal.SIGKILL)
+                raise
+            finally:
+                self.check_procs.discard(proc)
+        return out, err, proc.returncode
@@ -2,35 +2,28 @@
 Module for computing and parallelizing the solvers schedule of SUNNY algorithm.
 '''
 
-import csv
-import ast
+import numpy
 from math import sqrt
-from combinations import *
+from itertools import chain, combinations, islice
+from knowledge_base import *
 
+# Maximum number of score entries processed at once by best_cop_subset.
+CHUNK_CELLS = 1 << 20
 
-def get_neighbours(feat_vector, k, kb):
+
+def get_neighbours(feat_vector, k, kb, approx=False):
     """
-    Returns a dictionary (inst_name, inst_info) of the k instances closer to
-    the feat_vector in the knowledge base kb. If k <= 0, then k is set to the
-    square root of the knowledge base size.
+    Returns the Neighbourhood of the k instances closer to the feat_vector in
+    the knowledge base kb, which can be either the path of the knowledge base
+    or a KnowledgeBase object. If k <= 0, then k is set to the square root of
+    the knowledge base size. If approx is True, the approximate index of kb
+    (if any) is used.
     """
-    reader = csv.reader(open(kb, 'r'), delimiter='|')
-    infos = {}
-    feat_vectors = {}
-    distances = []
-    n = 0
-    for row in reader:
-        n += 1
-        inst = row[0]
-        d = euclidean_distance(
-            feat_vector, list(map(float, row[1][1:-1].split(',')))
-        )
-        distances.append((d, inst))
-        infos[inst] = row[2]
-    sorted_dist = distances.sort(key=lambda x: x[0])
+    if not isinstance(kb, KnowledgeBase):
+        kb = load_kb(kb)
     if k <= 0:
-        k = int(round(sqrt(n)))
-    return dict((inst, infos[inst]) for (d, inst) in distances[0:k])
+        k = int(round(sqrt(len(kb))))
+    return kb.neighbourhood(kb.nearest(feat_vector, k, approx))
 
 
 def euclidean_distance(fv1, fv2):
@@ -45,23 +38,95 @@ def euclidean_distance(fv1, fv2):
     return sqrt(distance)
 
 
+def popcount(x):
+    """
+    Returns the number of bits set in the non-negative integer x.
+    """
+    return bin(x).count('1')
+
+
+def to_bitset(row):
+    """
+    Returns the integer whose j-th bit is set iff the boolean row[j] is True.
+    """
+    return int.from_bytes(
+        numpy.packbits(row, bitorder='little').tobytes(), 'little'
+    )
+
+
+def best_csp_subset(masks, times, size, max_solved, min_time):
+    """
+    Returns a triple (solved, time, subset) where subset is the list of the
+    positions of the first subset of cardinality size, w.r.t. the
+    lexicographic ordering, that maximizes the number of solved instances and
+    then minimizes the solving time. masks[i] is the bitset of the instances
+    solved by the i-th solver and times[i] is its (non-negative) solving time.
+    Returns None if no subset solves more than max_solved instances, or
+    max_solved instances in less than min_time.
+
+    The subsets are visited depth-first in lexicographic order, updating the
+    bitset of the solved instances incrementally, and a branch is pruned as
+    soon as it cannot improve the best subset found so far.
+    """
+    m = len(masks)
+    # suffix_or[j] and suffix_min[j] are the union of the bitsets and the
+    # minimum time of the solvers at positions j, j + 1, ..., m - 1.
+    suffix_or = [0] * (m + 1)
+    suffix_min = [float('+inf')] * (m + 1)
+    for j in range(m - 1, -1, -1):
+        suffix_or[j] = suffix_or[j + 1] | masks[j]
+        suffix_min[j] = min(suffix_min[j + 1], times[j])
+    best = None
+    subset = []
+
+    def visit(start, solved, time):
+        nonlocal best, max_solved, min_time
+        left = size - len(subset)
+        if left == 0:
+            num_solved = popcount(solved)
+            if num_solved > max_solved or \
+               num_solved == max_solved and time < min_time:
+                max_solved = num_solved
+                min_time = time
+                best = (num_solved, time, list(subset))
+            return
+        for j in range(start, m - left + 1):
+            # The bounds only get worse for the next positions.
+            bound = popcount(solved | suffix_or[j])
+            if bound < max_solved or \
+               bound == max_solved and time + suffix_min[j] >= min_time:
+                return
+            subset.append(j)
+            visit(j + 1, solved | masks[j], time + times[j])
+            subset.pop()
+
+    visit(0, 0, 0)
+    return best
+
+
+def row_sums(matrix):
+    """
+    Returns the sums of the rows of matrix, accumulated from left to right as
+    sum does: numpy.sum uses a pairwise summation, whose result can differ in
+    the last bits and thus change the tie-breaking of the schedules.
+    """
+    sums = numpy.zeros(matrix.shape[0])
+    for j in range(matrix.shape[1]):
+        sums += matrix[:, j]
+    return sums
+
+
 def sunny_csp(neighbours, k, timeout, pfolio, backup, min_size):
     """
     Given the neighborhood of a given CSP and the runtime infos, returns the
     corresponding SUNNY schedule.
     """
-    solved = {}
-    times = {}
-    for solver in pfolio:
-        solved[solver] = set([])
-        times[solver] = 0.0
-    for inst, item in list(neighbours.items()):
-        item = ast.literal_eval(item)
-        for solver in pfolio:
-            time = item[solver]['time']
-            if time < timeout:
-                solved[solver].add(inst)
-            times[solver] += time
+    # solved[i][j] is True iff pfolio[i] solves the j-th neighbour.
+    time = neighbours.table('time', pfolio)
+    solved = time < timeout
+    times = dict(zip(pfolio, row_sums(time).tolist()))
+    num_solved = dict(zip(pfolio, solved.sum(axis=1).tolist()))
+    masks = [to_bitset(row) for row in solved]
     max_solved = 0
     min_time = float('+inf')
     best_pfolio = []
@@ -69,29 +134,21 @@ def sunny_csp(neighbours, k, timeout, pfolio, backup, min_size):
     # Select the best sub-portfolio. min_size is the minimum cardinality.
     for i in range(min_size, m + 1):
         old_pfolio = best_pfolio
-        for j in range(0, binom(m, i)):
-            solved_instances = set([])
-            solving_time = 0
-            # get the (j + 1)-th subset of cardinality i
-            sub_pfolio = get_subset(j, i, pfolio)
-            for solver in sub_pfolio:
-                solved_instances.update(solved[solver])
-                solving_time += times[solver]
-            num_solved = len(solved_instances)
-            if num_solved > max_solved or \
-               num_solved == max_solved and solving_time < min_time:
-                min_time = solving_time
-                max_solved = num_solved
-                best_pfolio = sub_pfolio
+        best = best_csp_subset(
+            masks, [times[s] for s in pfolio], i, max_solved, min_time
+        )
+        if best is not None:
+            max_solved, min_time, subset = best
+            best_pfolio = [pfolio[j] for j in subset]
         if old_pfolio == best_pfolio:
             break
     # n is the number of instances solved by each solver plus the instances
     # that no solver can solver.
-    n = sum([len(solved[s]) for s in best_pfolio]) + (k - max_solved)
+    n = sum([num_solved[s] for s in best_pfolio]) + (k - max_solved)
     schedule = {}
     # Compute the schedule and sort it by number of solved instances.
     for solver in best_pfolio:
-        ns = len(solved[solver])
+        ns = num_solved[solver]
         if ns == 0 or round(timeout / n * ns) == 0:
             continue
         schedule[solver] = timeout / n * ns
@@ -107,61 +164,96 @@ def sunny_csp(neighbours, k, timeout, pfolio, backup, min_size):
     return sorted_schedule
 
 
+def best_cop_subset(score, times, areas, size, max_score, min_time, min_area):
+    """
+    Returns a tuple (score, time, area, subset) where subset is the list of
+    the positions of the first subset of cardinality size > 0, w.r.t. the
+    lexicographic ordering, that maximizes the score and then minimizes the
+    solving time and the area. score is the solvers x neighbours score matrix,
+    while times[i] and areas[i] are the total time and area of the i-th
+    solver. Returns None if no subset improves on max_score, min_time and
+    min_area (in this order).
+
+    The subsets are scored in chunks of at most CHUNK_CELLS score entries.
+    """
+    m, k = score.shape
+    chunk = max(1, CHUNK_CELLS // max(k, 1))
+    subsets = combinations(range(m), size)
+    best = None
+    while True:
+        idx = numpy.fromiter(
+            chain.from_iterable(islice(subsets, chunk)), dtype=int
+        ).reshape(-1, size)
+        if len(idx) == 0:
+            return best
+        # Times and areas are summed in the order of the solvers, as sum does.
+        best_scores = score[idx[:, 0]]
+        time = times[idx[:, 0]]
+        area = areas[idx[:, 0]]
+        for j in range(1, size):
+            numpy.maximum(best_scores, score[idx[:, j]], out=best_scores)
+            time = time + times[idx[:, j]]
+            area = area + areas[idx[:, j]]
+        sub_score = row_sums(best_scores)
+        # Position of the first best subset of the chunk.
+        cands = numpy.flatnonzero(sub_score == sub_score.max())
+        cands = cands[time[cands] == time[cands].min()]
+        j = cands[area[cands].argmin()]
+        if sub_score[j] > max_score or \
+           sub_score[j] == max_score and time[j] < min_time or \
+           sub_score[j] == max_score and time[j] == min_time and \
+           area[j] < min_area:
+            max_score = float(sub_score[j])
+            min_time = float(time[j])
+            min_area = float(area[j])
+            best = (max_score, min_time, min_area, idx[j].tolist())
+
+
 def sunny_cop(neighbours, k, timeout, pfolio, backup, min_size):
     """
     Given the neighborhood of a given COP and the runtime infos, returns the
     corresponding SUNNY schedule.
     """
-    scores = {}
-    times = {}
-    areas = {}
-    for solver in pfolio:
-        scores[solver] = []
-        times[solver] = 0.0
-        areas[solver] = 0.0
-    for inst, item in list(neighbours.items()):
-        item = ast.literal_eval(item)
-        for solver in pfolio:
-            scores[solver].append(item[solver]['score'])
-            times[solver] += item[solver]['time']
-            areas[solver] += item[solver]['area']
+    # score[i][j] is the score of pfolio[i] on the j-th neighbour.
+    score = neighbours.table('score', pfolio)
+    scores = dict(zip(pfolio, row_sums(score).tolist()))
+    solv_times = row_sums(neighbours.table('time', pfolio))
+    solv_areas = row_sums(neighbours.table('area', pfolio))
+    times = dict(zip(pfolio, solv_times.tolist()))
+    # No sub-portfolio can score more than the whole portfolio. The sums are
+    # accumulated in the same order, so this bound holds also in floating
+    # point (rounding is monotone).
+    max_total = 0
+    if len(pfolio) > 0:
+        max_total = row_sums(score.max(axis=0, keepdims=True))[0]
+    min_times = numpy.cumsum(numpy.sort(solv_times))
     max_score = 0
     min_time = float('+inf')
     min_area = float('+inf')
     best_pfolio = []
     # Select the best sub-portfolio.
     m = len(pfolio)
-    for i in range(min_size, m + 1):
+    for i in range(max(min_size, 1), m + 1):
+        # Bigger sub-portfolios cannot improve on max_total in less time.
+        if max_score >= max_total and \
+           min_times[i - 1] * (1 - 1e-9) > min_time:
+            break
         old_pfolio = best_pfolio
-        for j in range(0, binom(m, i)):
-            score = 0
-            time = 0
-            area = 0
-            # get the (j + 1)-th subset of cardinality i
-            sub_pfolio = get_subset(j, i, pfolio)
-            port_scores = dict([
-                (s, l) for s, l in list(scores.items()) if s in sub_pfolio
-            ])
-            for h in range(0, k):
-                score += max([inst[h] for inst in list(port_scores.values())])
-            time = sum([times[solver] for solver in sub_pfolio])
-            area = sum([areas[solver] for solver in sub_pfolio])
-            if score > max_score or \
-               score == max_score and time < min_time or \
-               score == max_score and time == min_time and area < min_area:
-                min_time = time
-                min_area = area
-                max_score = score
-                best_pfolio = sub_pfolio
+        best = best_cop_subset(
+            score, solv_times, solv_areas, i, max_score, min_time, min_area
+        )
+        if best is not None:
+            max_score, min_time, min_area, subset = best
+            best_pfolio = [pfolio[j] for j in subset]
         if old_pfolio == best_pfolio:
             break
     # n is the number of instances solved by each solver plus the instances
     # that no solver can solver.
-    n = sum([sum(scores[s]) for s in best_pfolio]) + (k - max_score)
+    n = sum([scores[s] for s in best_pfolio]) + (k - max_score)
     schedule = {}
     # compute the schedule and sort it by number of solved instances.
     for solver in best_pfolio:
-        ns = sum(scores[solver])
+        ns = scores[solver]
         if ns == 0 or round(timeout / n * ns) == 0:
             continue
         schedule[solver] = timeout / n * ns
@@ -193,3 +285,29 @@ def parallelize(seq_sched, cores, timeout):
         par_sched.append((s, t * timeout / seq_time))
     assert round(sum(t for (s, t) in par_sched[cores - 1:]), 5) == timeout
     return par_sched
+
+
+def compute_schedule(problem, neighbours, k, timeout, pfolio, backup, cores):
+    """
+    Returns the parallel schedule computed by SUNNY algorithm.
+    """
+    if problem.isCSP():
+        seq_sched = sunny_csp(neighbours, k, timeout, pfolio, backup, cores)
+    else:
+        seq_sched = sunny_cop(neighbours, k, timeout, pfolio, backup, cores)
+    print('% SUNNY sequential schedule:', seq_sched)
+    if len(seq_sched) <= cores:
+        print('% Schedule size <= No. of cores!', 'No re-scheduling needed!')
+        par_sched = [
+            (s, float('+inf')) for (s, t) in
+            sorted(seq_sched, key=lambda x: x[0], reverse=True)
+        ]
+        not_sched = [
+            (s, float('+inf')) for s in pfolio
+            if s not in list(dict(par_sched).keys())
+        ]
+        par_sched += not_sched[:cores - len(seq_sched)]
+    else:
+        print('% Parallelizing schedule on', cores, 'cores')
+        par_sched = parallelize(seq_sched, cores, timeout)
+    return par_sched
@@ -2,11 +2,14 @@
 Solver is the abstraction of a constituent solver of the portfolio. Each solver
 must be an object of class Solver.
 
-RunningSolver is instead a solver running on a given FlatZinc model.
+RunningSolver is instead a solver running on a given FlatZinc model, whose
+output is split into lines by a LineBuffer.
 '''
 
 
+import os
 import psutil
+from flatzinc import FlatZincFile
 
 
 class Solver:
@@ -83,9 +86,15 @@ class RunningSolver:
     # Object of class psutil.Popen referring to the solving process.
     process = None
 
+    # LineBuffer of the output of the solving process.
+    output = None
+
     # True iff the value of obj_var is annotated with "output_var".
     output_var = True
 
+    # FlatZincFile object indexing the FlatZinc model (for COPs only).
+    fzn = None
+
     # Number of times solver has been restarted.
     num_restarts = -1
 
@@ -110,6 +119,8 @@ class RunningSolver:
         self.timeout = timeout
         self.num_restarts = 0
         self.max_restarts = max_restarts
+        self.solution = {}
+        self.output = LineBuffer()
         if solve == 'min':
             self.obj_value = float('+inf')
         elif solve == 'max':
@@ -121,11 +132,29 @@ class RunningSolver:
         """
         return self.solv_dict['name']
 
+    def next_check(self, problem):
+        """
+        Returns the time (in seconds since the epoch) when the solver has to be
+        checked for its timeout or for a restart, unless it produces output.
+        """
+        check = max(
+            self.start_time + self.timeout,
+            self.solution_time + self.wait_time
+        )
+        if self.status == 'flatzinc' and \
+           problem.bound_better_than(self.obj_value):
+            check = min(check, self.solution_time + self.restart_time)
+        return check
+
     def mem_percent(self):
         """
         Returns the memory usage (in percent) of the solver process.
         """
-        m = self.process.memory_percent()
+        try:
+            m = self.process.memory_percent()
+        except psutil.NoSuchProcess:
+            # The process is terminated (possibly, a shared conversion).
+            return 0
         for p in self.process.children(recursive=True):
             try:
                 m += p.memory_percent()
@@ -133,15 +162,13 @@ class RunningSolver:
                 pass
         return m
 
-    def mzn2fzn_cmd(self, pb):
+    def mzn2fzn_cmd(self, pb, fzn_path=None):
         """
         Returns the command for converting a given MiniZinc model to FlatZinc
-        by using solver-specific redefinitions.
+        by using solver-specific redefinitions. The FlatZinc model is written
+        to fzn_path (by default, the fzn_path of the solver).
         """
-        return ('minizinc -c --output-ozn-to-file ' + pb.ozn_path +
-                ' --solver ' + self.solv_dict['solver'] + ' ' +
-                self.solv_dict['conv_opts'] + ' ' + pb.mzn_path + ' ' +
-                pb.dzn_path + ' -o ' + self.fzn_path).split()
+        return mzn2fzn_cmd(self.solv_dict, pb, fzn_path or self.fzn_path)
 
     def flatzinc_cmd(self, pb):
         """
@@ -156,30 +183,21 @@ class RunningSolver:
         Retrieve and set the name of the obj. variable in the FlatZinc model,
         possibly adding the "output_var" annotation to obj_var declaration.
         """
-        lines = []
-        with open(self.fzn_path, 'r') as infile:
-            for line in reversed(infile.readlines()):
-                tokens = line.replace('::', ' ').replace(';', '').split()
-                if 'solve' in tokens:
-                    self.obj_var = tokens[-1].replace(';', '')
-                    cons = ''
-                    if lb > float('-inf'):
-                        cons += self.solv_dict['constraint'].replace(
-                            'RHS', self.obj_var
-                        ).replace('LHS', str(lb - 1)) + ';\n'
-                    if ub < float('+inf'):
-                        cons += self.solv_dict['constraint'].replace(
-                            'LHS', self.obj_var
-                        ).replace('RHS', str(ub + 1)) + ';\n'
-                    line = cons + line
-                if tokens[0] == 'var' and self.obj_var in tokens and \
-                   'output_var' not in tokens and '=' not in tokens:
-                    self.output_var = False
-                    line = line.replace(';', '') + ' :: output_var;\n'
-                lines.append(line)
-            infile.close()
-        with open(self.fzn_path, 'w') as outfile:
-            outfile.writelines(reversed(lines))
+        self.fzn = FlatZincFile(self.fzn_path)
+        self.obj_var = self.fzn.obj_var
+        cons = ''
+        if lb > float('-inf'):
+            cons += self.solv_dict['constraint'].replace(
+                'RHS', self.obj_var
+            ).replace('LHS', str(lb - 1)) + ';\n'
+        if ub < float('+inf'):
+            cons += self.solv_dict['constraint'].replace(
+                'LHS', self.obj_var
+            ).replace('RHS', str(ub + 1)) + ';\n'
+        if self.fzn.add_output_var():
+            self.output_var = False
+        if cons:
+            self.fzn.add_constraints(cons)
 
     def inject_bound(self, bound):
         """
@@ -193,14 +211,143 @@ class RunningSolver:
                 'RHS', self.obj_var).replace('LHS', str(bound))
         else:
             return
-        lines = []
-        with open(self.fzn_path, 'r') as infile:
-            add = True
-            for line in infile.readlines():
-                if add and 'constraint' in line.split():
-                    lines.append(cons + ';\n')
-                    add = False
-                lines.append(line)
-        with open(self.fzn_path, 'w') as outfile:
-            outfile.writelines(lines)
+        if self.fzn is None:
+            self.fzn = FlatZincFile(self.fzn_path)
+        self.fzn.set_bound(cons + ';\n')
         self.obj_value = bound
+
+
+def mzn2fzn_cmd(solv_dict, pb, fzn_path):
+    """
+    Returns the command for converting the MiniZinc model of pb to the FlatZinc
+    model at fzn_path, by using the redefinitions of the solver of solv_dict.
+    """
+    return ('minizinc -c --output-ozn-to-file ' + pb.ozn_path +
+            ' --solver ' + solv_dict['solver'] + ' ' + solv_dict['conv_opts'] +
+            ' ' + pb.mzn_path + ' ' + pb.dzn_path + ' -o ' + fzn_path).split()
+
+
+def check_model_cmd(solv_dict, pb, fzn_path):
+    """
+    Returns the command for converting the MiniZinc model of pb to the FlatZinc
+    model at fzn_path, used by the solver of solv_dict for checking the
+    solutions found by the other solvers (see --check-solvers option).
+    """
+    return ('minizinc -c --no-output-ozn --solver ' + solv_dict['solver'] +
+            ' ' + solv_dict['conv_opts'] + ' ' + pb.mzn_path + ' ' +
+            pb.dzn_path + ' -o ' + fzn_path).split()
+
+
+def check_model_of(fzn_path, err, returncode):
+    """
+    Returns the FlatZincFile at fzn_path written by a check_model_cmd command
+    that printed err (bytes) on stderr and exited with returncode. Returns
+    None if the conversion failed, and False if the model is inconsistent.
+    """
+    if 'model inconsistency detected' in err.decode():
+        return False
+    if returncode == 0 and os.path.getsize(fzn_path):
+        return FlatZincFile(fzn_path)
+    return None
+
+
+def check_constraints(model, solv_dict, pb, solution, bound):
+    """
+    Returns the constraints to be added to the check model (a FlatZincFile)
+    of the solver of solv_dict for checking the solution of pb, a list of
+    (variable, value) pairs, having objective value bound (for COPs only).
+    """
+    # The variables introduced by the flattening of the untrusted solver do
+    # not correspond to those of the model.
+    cons = model.equality_constraints([
+        (var, val) for (var, val) in solution
+        if 'X_INTRODUCED_' not in var and '%' not in var
+    ])
+    if pb.isCOP() and model.obj_var:
+        cons += solv_dict['constraint'].replace('LHS', model.obj_var) \
+            .replace('RHS', str(bound + 1)) + ';\n'
+        cons += solv_dict['constraint'].replace('RHS', model.obj_var) \
+            .replace('LHS', str(bound - 1)) + ';\n'
+    return cons
+
+
+def check_outcome(name, out, err, returncode):
+    """
+    Returns the outcome of the check of a solution done by the solver name,
+    given the stdout and stderr (bytes) and the returncode of the check: False
+    iff an inconsistency is detected. Raises a RuntimeError if the solution
+    cannot be checked.
+    """
+    out = out.decode()
+    if '=====UNSATISFIABLE=====' in out or '=====UNBOUNDED=====' in out:
+        return False
+    if returncode != 0 or '----------' not in out:
+        # An error of the trusted solver is not an inconsistency.
+        error = err.decode().strip().splitlines()
+        raise RuntimeError(name + ' failed' + (
+            ': ' + error[-1] if error else ''
+        ))
+    return True
+
+
+class LineBuffer:
+    """
+    LineBuffer incrementally splits the output of a process into lines, even
+    when a line is read in several chunks.
+    """
+
+    # Bytearray of the output read and not yet returned as complete lines.
+    data = None
+
+    # Position of data up to which no newline has been found.
+    scanned = 0
+
+    def __init__(self):
+        self.data = bytearray()
+        self.scanned = 0
+
+    def feed(self, chunk):
+        """
+        Appends the bytes chunk to the output.
+        """
+        self.data += chunk
+
+    def lines(self, eof=False):
+        """
+        Returns the list of the complete lines (without newlines) of the output
+        not yet returned. If eof is True, the last line is returned even if it
+        is not terminated by a newline.
+        """
+        data = self.data
+        if eof:
+            end = len(data)
+        else:
+            # Only the output fed after the last call is scanned.
+            end = data.rfind(b'\n', self.scanned)
+            if end < 0:
+                self.scanned = len(data)
+                return []
+        with memoryview(data) as view:
+            block = view[:end].tobytes()
+        del data[:end + 1]
+        self.scanned = 0
+        lines = block.split(b'\n')
+        if eof and not lines[-1]:
+            lines.pop()
+        return lines
+
+
+def parse_assignment(line):
+    """
+    Returns the pair (variable, value) of the strings of an assignment line
+    b'var = val;' printed by a solver, or None if line is not an assignment.
+    Only the variable and the value are decoded.
+    """
+    idx = line.find(b' = ')
+    if idx < 0:
+        return None
+    end = line.find(b';', idx + 3)
+    if end < 0:
+        end = len(line)
+    with memoryview(line) as view:
+        return str(view[:idx], 'utf-8'), str(view[idx + 3:end], 'utf-8')
@@ -1,24 +1,142 @@
 #!/usr/bin/env python3
 """
 A simple HTTP server to call sunny-cp.
+The /process requests are solved by the Portfolio (see portfolio.py) of each
+request, all driven by the same event loop of the server, instead of running
+a sunny-cp process per request.
 Examples for sending requests:
     curl -F "--help=" http://localhost:9001
     curl -F "-P=gecode" "mzn=@<FILE>" http://localhost:9001
 """
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import redirect_stdout, redirect_stderr
 import urllib.parse
 import logging
 import cgi
 import tempfile
 import os
+import io
+import sys
+import time
+import asyncio
+import threading
+import traceback
 import subprocess
 import click
+from batch import neighbours_of
+from cache import Cache, FileCache
+from features import mzn2feat
+from parsing import parse_arguments
+from pfolio_solvers import DEF_PFOLIO
+from portfolio import Portfolio
+from scheduling import compute_schedule
+from timeline import Timeline
 
 # default timeout in seconds for sunny
 TIMEOUT = 1200
+# cache of the mzn2feat outputs (None if caching is disabled)
+CACHE = None
+# event loop running the portfolios of the /process requests
+LOOP = None
+# lock held while the standard output is redirected
+OUTPUT_LOCK = threading.Lock()
 logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
 
 
+def start_loop():
+    """
+    Starts the event loop running the portfolios in a background thread.
+    """
+    global LOOP
+    LOOP = asyncio.new_event_loop()
+    if sys.version_info < (3, 8):
+        # The child processes are reaped by the watcher of the main thread.
+        asyncio.get_child_watcher().attach_loop(LOOP)
+    threading.Thread(target=LOOP.run_forever, daemon=True).start()
+
+
+async def solve(args, output, timeout):
+    """
+    Solves the problem of the parsed arguments args of sunny-cp (see
+    parse_arguments) within timeout seconds, appending the output of sunny-cp
+    to the list output. As in sunny-cp, the static schedule runs while the
+    SUNNY schedule is computed; then the Portfolio runs the latter.
+    """
+    problem, k, T, pfolio, backup, kb, lims, static, extractor, cores, \
+        solver_options, _, mem_limit, _, all_opt, free_opt, lb, ub, check, \
+        knn, cache_dir, _, extraction_time, _, fzn_cache_size, trace, _ = args
+    pfolio = list(pfolio)
+    fzn_cache = None
+    if cache_dir:
+        fzn_cache = FileCache(cache_dir + '/fzn', fzn_cache_size * 2**20)
+    timeline = Timeline()
+    if trace:
+        timeline.open(trace)
+    portfolio = Portfolio(
+        None, cores, solver_options, all_opt, free_opt, lb, ub, static,
+        check, mem_limit, fzn_cache, timeline
+    )
+
+    async def schedule():
+        try:
+            await compute(time.time())
+        except Exception:
+            # The portfolio terminates when the static schedule is done.
+            portfolio.extend([])
+            raise
+
+    async def compute(start):
+        neighbours = []
+        if cores < len(pfolio) and extractor == 'mzn2feat':
+            limit = T if extraction_time is None else extraction_time
+            neighbours = await asyncio.get_event_loop().run_in_executor(
+                None, neighbours_of, problem, kb, lims, k,
+                None if limit == float('+inf') else limit, knn == 'approx'
+            )
+        solvers = [
+            s for s in pfolio if DEF_PFOLIO[s]['name'] not in portfolio.failed
+        ]
+        if not neighbours or len(solvers) <= cores:
+            output.append('% Switching to backup solver(s)\n')
+            par_sched = [(s, float('+inf')) for s in solvers[:cores]]
+        else:
+            buf = io.StringIO()
+            with OUTPUT_LOCK, redirect_stdout(buf):
+                par_sched = compute_schedule(
+                    problem, neighbours, k if k > 0 else len(neighbours),
+                    T - round(time.time() - start), solvers,
+                    backup if backup in solvers else solvers[0], cores
+                )
+            output.append(buf.getvalue())
+        par_sched += [
+            (s, 0) for s in solvers if s not in list(dict(par_sched).keys())
+        ]
+        output.append('% SUNNY parallel schedule: ' + str(par_sched) + '\n')
+        portfolio.extend(par_sched)
+
+    async def run():
+        scheduler = asyncio.ensure_future(schedule())
+        try:
+            async for solution in portfolio.solve(problem):
+                output.append(solution.output())
+            if scheduler.done():
+                scheduler.result()
+        finally:
+            scheduler.cancel()
+
+    try:
+        await asyncio.wait_for(run(), timeout)
+    finally:
+        timeline.close()
+
+
+def to_bytes(values):
+    """
+    Joins the (either str or bytes) values of a posted field into bytes.
+    """
+    return b''.join(v.encode() if isinstance(v, str) else v for v in values)
+
+
 class MyServer(BaseHTTPRequestHandler):
 
     def _set_headers(self):
@@ -26,6 +144,51 @@ class MyServer(BaseHTTPRequestHandler):
         self.send_header('Content-type', 'text/plain')
         self.end_headers()
 
+    def _send(self, code, text):
+        self.send_response(code)
+        self.send_header('Content-type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+    def _process(self, args, timeout):
+        '''
+        Runs sunny-cp with the arguments args in the event loop of the server
+        (see solve), and sends its output.
+        '''
+        output = io.StringIO()
+        try:
+            with OUTPUT_LOCK, redirect_stdout(output), \
+                    redirect_stderr(output):
+                args = parse_arguments(args)
+        except SystemExit as e:
+            self._send(400 if e.code else 200, output.getvalue())
+            return
+        except ValueError as e:
+            # A badly formatted option value.
+            self._send(400, output.getvalue() + 'Error! ' + str(e) + '\n')
+            return
+        # The .ozn file of the problem is not shared with other requests.
+        file_id, ozn_path = tempfile.mkstemp(suffix='.ozn')
+        os.close(file_id)
+        args[0].ozn_path = ozn_path
+        lines = []
+        future = asyncio.run_coroutine_threadsafe(
+            solve(args, lines, timeout), LOOP
+        )
+        code = 200
+        try:
+            future.result()
+        except asyncio.TimeoutError:
+            # As for the timeout command, the output so far is sent.
+            pass
+        except Exception:
+            logging.debug(traceback.format_exc())
+            lines.append(traceback.format_exc())
+            code = 400
+        finally:
+            os.remove(ozn_path)
+        self._send(code, ''.join(lines))
+
     def do_GET(self):
         '''
         Handle GET requests.
@@ -63,6 +226,8 @@ class MyServer(BaseHTTPRequestHandler):
         # http://stackoverflow.com/questions/4233218/python-basehttprequesthandler-post-variables
         ctype, pdict = cgi.parse_header(self.headers['content-type'])
         if ctype == 'multipart/form-data':
+            pdict['boundary'] = pdict['boundary'].encode()
+            pdict['CONTENT-LENGTH'] = int(self.headers['content-length'])
             postvars = cgi.parse_multipart(self.rfile, pdict)
         elif ctype == 'application/x-www-form-urlencoded':
             length = int(self.headers['content-length'])
@@ -83,17 +248,20 @@ class MyServer(BaseHTTPRequestHandler):
             mzn = []
             dzn = []
             extra_param = []
+            # Parameters of the cache key: the timeout does not change the
+            # output of mzn2feat, since timed out runs are not cached.
+            key_param = []
             for i in postvars:
                 if i.startswith('mzn'):
                     logging.debug("Found mzn input file")
                     file_id, name = tempfile.mkstemp(suffix='.mzn', text=True)
-                    os. write(file_id, ''.join(postvars[i]))
+                    os.write(file_id, to_bytes(postvars[i]))
                     os.close(file_id)
                     mzn.append(name)
                 elif i.startswith('dzn'):
                     logging.debug("Found dzn input file")
                     file_id, name = tempfile.mkstemp(suffix='.dzn', text=True)
-                    os.write(file_id, ''.join(postvars[i]))
+                    os.write(file_id, to_bytes(postvars[i]))
                     os.close(file_id)
                     dzn.append(name)
                 else:
@@ -101,11 +269,13 @@ class MyServer(BaseHTTPRequestHandler):
                         self.send_response(400)
                         self.send_header('Content-type', 'text/plain')
                         self.end_headers()
-                        self.wfile.write("Parameter %s badly formatted" % i)
+                        self.wfile.write(
+                            ("Parameter %s badly formatted" % i).encode())
                         return
                     if postvars[i][0] == "":
                         logging.debug("Found flag %s" % i)
                         extra_param.append(i)
+                        key_param.append(i)
                     else:
                         logging.debug(
                             "Found parameter %s with value %s" %
@@ -115,23 +285,37 @@ class MyServer(BaseHTTPRequestHandler):
                                 timeout = postvars[i][0]
                         extra_param.append(i)
                         extra_param.append(postvars[i][0])
+                        if i != "-T":
+                            key_param += [i, postvars[i][0]]
+
+            cmd = ["timeout", timeout, "mzn2feat"] + extra_param
+            for i in mzn:
+                cmd += ["-i", i]
+            for i in dzn:
+                cmd += ["-d", i]
+
+            key = None
+            cached = None
+            if CACHE and urllib.parse.urlparse(self.path).path != "/process":
+                key = mzn2feat.cache_key(mzn, dzn, key_param)
+                cached = CACHE.get(key)
+                logging.debug('Features cache: {}'.format(CACHE.stats()))
 
-            if urllib.parse.urlparse(self.path).path == "/process":
-                cmd = ["timeout", timeout, "sunny-cp"] + extra_param
-                cmd += mzn
-                cmd += dzn
-            else:
-                cmd = ["timeout", timeout, "mzn2feat"] + extra_param
-                for i in mzn:
-                    cmd += ["-i", i]
-                for i in dzn:
-                    cmd += ["-d", i]
-
-            logging.debug('Running cmd {}'.format(cmd))
+            process = None
             try:
+                if cached is not None:
+                    self._set_headers()
+                    self.wfile.write(cached.encode())
+                    return
+                if urllib.parse.urlparse(self.path).path == "/process":
+                    self._process(extra_param + mzn + dzn, float(timeout))
+                    return
+                logging.debug('Running cmd {}'.format(cmd))
                 process = subprocess.Popen(
                     cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                 out, err = process.communicate()
+                if key and process.returncode == 0:
+                    CACHE.put(key, out.decode())
                 if process.returncode != 0 and process.returncode != 124:
                     logging.debug(
                         "The command returned with return code {}. STDOUT <{}>. STDERR <{}>".format(
@@ -153,7 +337,7 @@ class MyServer(BaseHTTPRequestHandler):
                     if os.path.exists(i):
                         os.remove(i)
                 # stop process in case of errors
-                if process.poll() is None:
+                if process is not None and process.poll() is None:
                     process.kill()
         else:
             self.send_response(400)
@@ -161,7 +345,8 @@ class MyServer(BaseHTTPRequestHandler):
             self.end_headers()
 
 
-def run(server_class=HTTPServer, handler_class=MyServer, port=9001):
+def run(server_class=ThreadingHTTPServer, handler_class=MyServer, port=9001):
+    start_loop()
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
     print('Starting httpd...')
@@ -171,7 +356,17 @@ def run(server_class=HTTPServer, handler_class=MyServer, port=9001):
 @click.command()
 @click.option('--port', '-p', type=click.INT, default=9001,
               help='Port used by the server to wait for requests.')
-def main(port):
+@click.option('--cache-dir', type=click.Path(exists=True, file_okay=False),
+              default=None,
+              help='Folder where the mzn2feat outputs of /get_features are '
+                   'cached (the same used by the --cache-dir of sunny-cp).')
+@click.option('--cache-size', type=click.FLOAT, default=64,
+              help='Maximum size (in MB) of the cache.')
+def main(port, cache_dir, cache_size):
+    global CACHE
+    if cache_dir:
+        CACHE = Cache(os.path.join(cache_dir, 'features.db'),
+                      cache_size * 2**20)
     run(port=port)
 
 
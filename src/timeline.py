@@ -0,0 +1,225 @@
+'''
+Timeline records the timestamped events of a sunny-cp run (see the --trace
+option), for finding out where the wall time of the run goes.
+
+An event has a name, a time (in seconds since the start of the run), and a
+track: the track of a solver is its name, while the phases of sunny-cp are on
+the 'sunny-cp' track and the features extraction on the 'features' track. An
+event can also close the span of its track (e.g., the compilation of a
+solver) and open a new one (e.g., its search). The trace is written either
+as JSON lines, one event per line, or in the Chrome trace-event format (if
+the path of the trace ends with .json), which can be loaded in a trace viewer
+such as chrome://tracing or Perfetto. In the latter case, the spans are
+written as complete events.
+
+When no trace is opened, recording an event costs a method call.
+
+Usage: python timeline.py <TRACE>
+
+prints a summary of the trace of a sunny-cp run: the time to the first and
+the last solution, and the time spent in each span, overall and by track.
+'''
+
+import sys
+import json
+import time
+
+# Track of the events of sunny-cp phases.
+MAIN_TRACK = 'sunny-cp'
+
+
+class Timeline:
+    """
+    Timeline writes the events of a sunny-cp run on a trace file.
+    """
+
+    # File object of the trace (None if the timeline is disabled).
+    file = None
+
+    # True iff the trace is in the Chrome trace-event format.
+    chrome = False
+
+    # String written before the next record of the trace.
+    separator = ''
+
+    # Time in seconds (since the epoch) when the timeline was opened.
+    start = 0
+
+    # Dictionary (track, (span, time)) of the spans opened so far.
+    spans = None
+
+    # Time in seconds spent waiting for events (see bin/sunny-cp).
+    waited = 0
+
+    def __init__(self):
+        """
+        Class Constructor: the timeline is disabled until it is opened.
+        """
+        self.spans = {}
+
+    def open(self, path, start=None):
+        """
+        Starts writing the trace at path. The time of the events is relative
+        to start (by default, the current time).
+        """
+        self.file = open(path, 'w')
+        self.chrome = path.endswith('.json')
+        self.start = time.time() if start is None else start
+        self.separator = '[\n' if self.chrome else ''
+
+    def event(self, name, track=MAIN_TRACK, span=None, when=None, **args):
+        """
+        Records the event name on the given track, with the JSON-serializable
+        args, happened at time when (by default, now). If span is not None,
+        the span of the track (if any) is closed and, if span is not empty,
+        span is opened.
+        """
+        if self.file is None:
+            return
+        now = (time.time() if when is None else when) - self.start
+        if span is not None:
+            self.close_span(track, now)
+            if span:
+                self.spans[track] = (span, now)
+        if self.chrome:
+            self.write({
+                'name': name, 'ph': 'i', 's': 't', 'ts': now * 1e6, 'pid': 1,
+                'tid': track, 'args': dict(args, span=span)
+            })
+        else:
+            record = dict(args, time=now, event=name, track=track)
+            if span is not None:
+                record['span'] = span
+            self.write(record)
+
+    def write(self, record):
+        """
+        Writes the record (a JSON-serializable dictionary) on the trace.
+        """
+        self.file.write(self.separator + json.dumps(record))
+        self.separator = ',\n' if self.chrome else '\n'
+
+    def close_span(self, track, now):
+        """
+        Closes the span of track (if any) at time now.
+        """
+        if track not in self.spans:
+            return
+        span, begin = self.spans.pop(track)
+        if self.chrome:
+            self.write({
+                'name': span, 'ph': 'X', 'ts': begin * 1e6,
+                'dur': (now - begin) * 1e6, 'pid': 1, 'tid': track
+            })
+
+    def close(self):
+        """
+        Records the end of the run, closing all the spans, and stops writing
+        the trace.
+        """
+        if self.file is None:
+            return
+        self.event('end', span='', waited=self.waited)
+        now = time.time() - self.start
+        for track in list(self.spans):
+            self.close_span(track, now)
+        self.file.write('\n]\n' if self.chrome else '\n')
+        self.file.close()
+        self.file = None
+
+
+def read_events(path):
+    """
+    Returns the list of the events of the trace at path, as dictionaries with
+    keys 'time', 'event', 'track' and (possibly) 'span', plus the event args.
+    """
+    with open(path, 'r') as infile:
+        text = infile.read()
+    if not text.lstrip().startswith('['):
+        events = [json.loads(line) for line in text.splitlines() if line]
+        return sorted(events, key=lambda e: e['time'])
+    # The trace of an interrupted run is not terminated.
+    text = text.rstrip().rstrip(']').rstrip().rstrip(',')
+    events = []
+    for record in json.loads(text + ']'):
+        if record.get('ph') == 'i':
+            event = dict(
+                record['args'], time=record['ts'] / 1e6,
+                event=record['name'], track=record['tid']
+            )
+            if event['span'] is None:
+                del event['span']
+            events.append(event)
+    return sorted(events, key=lambda e: e['time'])
+
+
+def span_times(events):
+    """
+    Returns the dictionary (track, (span, seconds)) of the time spent in each
+    span of each track, by replaying the events.
+    """
+    opened = {}
+    times = {}
+    end = events[-1]['time'] if events else 0
+    for event in events + [{'time': end, 'span': '', 'track': t}
+                           for t in list(set(e['track'] for e in events))]:
+        if 'span' not in event:
+            continue
+        track = event['track']
+        if track in opened:
+            span, begin = opened.pop(track)
+            spans = times.setdefault(track, {})
+            spans[span] = spans.get(span, 0) + event['time'] - begin
+        if event['span']:
+            opened[track] = (event['span'], event['time'])
+    return times
+
+
+def summary(events):
+    """
+    Returns the list of the lines of the summary of the events of a run.
+    """
+    lines = []
+    if not events:
+        return ['Empty trace']
+    lines.append('Total time: %.3f s' % events[-1]['time'])
+    solutions = [e for e in events if e['event'] == 'solution']
+    for label, event in [('First', solutions[:1]), ('Last', solutions[-1:])]:
+        for e in event:
+            objective = e.get('objective')
+            lines.append('%s solution: %.3f s by %s%s' % (
+                label, e['time'], e['track'],
+                '' if objective is None else ' (objective %s)' % objective
+            ))
+    if not solutions:
+        lines.append('No solution found')
+    lines.append('Solutions: ' + str(len(solutions)))
+    for e in events:
+        if e['event'] == 'end':
+            lines.append('Waiting for events: %.3f s' % e.get('waited', 0))
+    times = span_times(events)
+    totals = {}
+    for spans in times.values():
+        for span, t in spans.items():
+            totals[span] = totals.get(span, 0) + t
+    lines.append('Time by span:')
+    for span, t in sorted(totals.items(), key=lambda x: -x[1]):
+        lines.append('  %-12s %10.3f s' % (span, t))
+    lines.append('Time by track:')
+    for track in sorted(times):
+        lines.append('  ' + track + ': ' + ', '.join(
+            '%s %.3f s' % (span, t) for span, t in sorted(times[track].items())
+        ))
+    return lines
+
+
+def main(args):
+    if len(args) != 1 or args[0] in ['-h', '--help']:
+        print(__doc__)
+        sys.exit(0 if args else 2)
+    for line in summary(read_events(args[0])):
+        print(line)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
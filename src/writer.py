@@ -0,0 +1,90 @@
+'''
+SolutionWriter prints the solutions of sunny-cp on standard output. A solution
+is serialized into a single buffer, which is written with a single system call
+(after flushing the output printed with print, to preserve the order).
+
+When printing all the sub-optimal solutions of a COP (-a option), a lot of
+solutions can be found in a short time. A SolutionWriter with a positive
+window prints at most one of such solutions every window seconds: the
+solutions found within the window are coalesced, and only the latest one is
+printed when the window expires (or when the search ends).
+'''
+
+import os
+import sys
+import time
+
+
+class SolutionWriter:
+    """
+    SolutionWriter writes the solutions on a file descriptor.
+    """
+
+    # File descriptor on which solutions are written.
+    fd = 1
+
+    # Minimum time (in seconds) between two coalesced solutions.
+    window = 0
+
+    # Time in seconds (since the epoch) of the last written solution.
+    write_time = float('-inf')
+
+    # Bytes of the latest coalesced solution not yet written (or None).
+    pending = None
+
+    def __init__(self, fd=1, window=0):
+        """
+        Class Constructor.
+        """
+        self.fd = fd
+        self.window = window
+        self.write_time = float('-inf')
+        self.pending = None
+
+    def write(self, assignment, lines=('----------', ), coalesce=False):
+        """
+        Writes the list of (variable, value) pairs of assignment followed by
+        the given lines. If coalesce is True, the solution is written only if
+        the window has expired, otherwise it replaces the pending solution.
+        """
+        data = ''.join(
+            [var + ' = ' + val + ';\n' for (var, val) in assignment] +
+            [line + '\n' for line in lines]
+        ).encode()
+        if coalesce and time.time() < self.write_time + self.window:
+            self.pending = data
+            return
+        self.pending = None
+        self.write_time = time.time()
+        self.write_bytes(data)
+
+    def deadline(self):
+        """
+        Returns the time (in seconds since the epoch) when the pending solution
+        has to be written, or +inf if there is no pending solution.
+        """
+        if self.pending is None:
+            return float('+inf')
+        return self.write_time + self.window
+
+    def flush(self, force=False):
+        """
+        Writes the pending solution (if any) if its window has expired or if
+        force is True.
+        """
+        if self.pending is not None and \
+           (force or time.time() >= self.deadline()):
+            data = self.pending
+            self.pending = None
+            self.write_time = time.time()
+            self.write_bytes(data)
+
+    def write_bytes(self, data):
+        """
+        Writes data on the file descriptor.
+        """
+        sys.stdout.flush()
+        view = memoryview(data)
+        while view:
+            # A write can be partial if interrupted by a signal.
+            view = view[os.write(self.fd, view):]
@@ -0,0 +1,8 @@
+'''
+Portfolio of the fake solvers of the unit tests (see minizinc in this folder).
+'''
+
+DEF_PFOLIO = dict((s, {
+    'solver': s, 'name': s.capitalize(), 'conv_opts': '', 'solv_opts': '',
+    'constraint': 'constraint int_lin_le([1,-1],[LHS,RHS],-1)'
+}) for s in ['chuffed', 'gecode', 'highs'])
@@ -0,0 +1,137 @@
+'''
+Tests of the pinning of the solvers to dedicated cores (see src/affinity.py).
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import psutil
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+import affinity
+from affinity import CorePool, parse_cpulist, set_affinity
+from test_sunny_cp import EXAMPLES, solutions, sunny_cp
+
+
+class FakeProcess:
+    """
+    Stub of a psutil process, whose children are forked when it is pinned.
+    """
+
+    def __init__(self, pid, forked=(), dead=False):
+        self.pid = pid
+        self.forked = list(forked)
+        self.dead = dead
+        self.children_list = []
+
+    def fork(self):
+        self.children_list += self.forked
+        self.forked = []
+
+    def children(self, recursive=False):
+        if self.dead:
+            raise psutil.NoSuchProcess(self.pid)
+        return list(self.children_list)
+
+
+class TestAffinity(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes_dir = tempfile.mkdtemp()
+        self.nodes = mock.patch.object(affinity, 'NODES_PATH', self.nodes_dir)
+        self.nodes.start()
+
+    def tearDown(self):
+        self.nodes.stop()
+        shutil.rmtree(self.nodes_dir)
+
+    def add_node(self, node, cpulist):
+        os.mkdir(self.nodes_dir + '/node%d' % node)
+        with open(self.nodes_dir + '/node%d/cpulist' % node, 'w') as outfile:
+            outfile.write(cpulist + '\n')
+
+    def test_parse_cpulist(self):
+        self.assertEqual(parse_cpulist('0-3,8,10-11\n'),
+                         [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpulist(''), [])
+
+    def test_parent_first(self):
+        # The children forked while the parent is pinned are pinned too.
+        proc = FakeProcess(1, [FakeProcess(2), FakeProcess(3)])
+        pinned = []
+
+        def setaffinity(pid, cpus):
+            pinned.append((pid, cpus))
+            if pid == 1:
+                proc.fork()
+            if pid == 3:
+                raise OSError('No such process')
+
+        with mock.patch('os.sched_setaffinity', setaffinity):
+            set_affinity(proc, {5})
+        self.assertEqual(pinned, [(1, {5}), (2, {5}), (3, {5})])
+
+    def test_terminated(self):
+        pinned = []
+        with mock.patch('os.sched_setaffinity',
+                        lambda pid, cpus: pinned.append(pid)):
+            set_affinity(FakeProcess(1, dead=True), {0})
+        self.assertEqual(pinned, [1])
+
+    def test_core_pool(self):
+        pool = CorePool('core', [3, 1, 0, 2])
+        a, b, c = object(), object(), object()
+        self.assertEqual(pool.acquire(a), {0})
+        self.assertEqual(pool.acquire(b), {1})
+        # An owner keeps its core until it is released.
+        self.assertEqual(pool.acquire(a), {0})
+        pool.release(a)
+        self.assertEqual(pool.acquire(c), {0})
+        # A released owner gets back another core, if its core is taken.
+        self.assertEqual(pool.acquire(a), {2})
+        pool.release(b)
+        pool.release(c)
+        self.assertEqual(pool.acquire(b), {1})
+        self.assertEqual(pool.acquire(c), {0})
+        self.assertEqual(pool.acquire(object()), {3})
+        self.assertIsNone(pool.acquire(object()))
+        for owner in [a, b, c]:
+            pool.release(owner)
+        self.assertEqual(list(pool.owners), [3])
+
+    def test_numa_pool(self):
+        self.add_node(0, '0-2')
+        self.add_node(1, '3-5')
+        pool = CorePool('numa', range(6))
+        a, b, c, d = object(), object(), object(), object()
+        self.assertEqual(pool.acquire(a), {0, 1, 2})
+        # The node with most free cores is preferred.
+        self.assertEqual(pool.acquire(b), {3, 4, 5})
+        self.assertEqual(pool.acquire(c), {0, 1, 2})
+        self.assertEqual(pool.owners, {0: a, 3: b, 1: c})
+        pool.release(c)
+        self.assertEqual(pool.acquire(d), {0, 1, 2})
+        # The previous core of c is taken, but its node has a free core.
+        self.assertEqual(pool.acquire(c), {0, 1, 2})
+        self.assertEqual(pool.owners, {0: a, 3: b, 1: d, 2: c})
+        for owner in [a, b, c, d]:
+            pool.release(owner)
+        self.assertEqual(pool.owners, {})
+
+    def test_sunny_cp(self):
+        # The pinned solvers find the same solutions.
+        args = ['-a', '-P', 'chuffed,gecode', '-p', '2']
+        args += [EXAMPLES + 'golomb.mzn']
+        pinned = sunny_cp(['--pin', 'core'] + args, FAKE_SPEED_chuffed='0.1')
+        self.assertEqual(
+            solutions(pinned),
+            solutions(sunny_cp(args, FAKE_SPEED_chuffed='0.1'))
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
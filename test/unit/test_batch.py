@@ -0,0 +1,110 @@
+'''
+Tests of the batch mode of sunny-cp (see src/batch.py), solving many problems
+with the fake solvers in the fakes folder on a global budget of cores.
+'''
+
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+FAKES = SUNNY_HOME + '/test/unit/fakes'
+# The fake portfolio is found before the one of the installation.
+sys.path.insert(0, FAKES)
+sys.path.append(SUNNY_HOME + '/src')
+import batch
+from batch import Batch, run_batch
+from test_sunny_cp import EXAMPLES
+
+PFOLIO = ['chuffed', 'gecode', 'highs']
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {
+            'PATH': FAKES + os.pathsep + os.environ.get('PATH', ''),
+            'FAKE_SPEED_chuffed': '0.5', 'FAKE_SPEED_gecode': '0.2',
+            'FAKE_SPEED_highs': '0.3'
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def run_batch(self, models, cores, max_cores):
+        """
+        Solves models on the given budget of cores, checking after each
+        assignment of the cores that the budget is never exceeded. Returns the
+        list of the jobs and the number of cores given to the running
+        portfolios by Batch.grow.
+        """
+        path = self.tmp_dir + '/instances'
+        with open(path, 'w') as outfile:
+            outfile.writelines(EXAMPLES + m + '\n' for m in models)
+        launch = Batch.launch
+        grow = Batch.grow
+        grown = []
+
+        def check(batch):
+            jobs = list(batch.running.values())
+            self.assertGreaterEqual(batch.free, 0)
+            self.assertEqual(batch.free + sum(j.cores for j in jobs), cores)
+            for job in jobs:
+                self.assertGreaterEqual(job.cores, 1)
+                if job.portfolio is not None:
+                    running = job.portfolio.running()
+                    self.assertLessEqual(len(running), job.cores)
+
+        def checked_launch(batch):
+            launch(batch)
+            check(batch)
+
+        def checked_grow(batch):
+            free = batch.free
+            grow(batch)
+            grown.append(free - batch.free)
+            check(batch)
+
+        # No knowledge base is used: each problem has a schedule of all the
+        # solvers, so that the free cores can be given to the running
+        # portfolios.
+        def schedule(problem, neighbours, k, timeout, pfolio, backup, cores):
+            return [(s, 100) for s in pfolio]
+
+        with mock.patch.object(Batch, 'launch', checked_launch), \
+                mock.patch.object(Batch, 'grow', checked_grow), \
+                mock.patch.object(batch, 'load_kb'), \
+                mock.patch.object(batch, 'neighbours_of',
+                                  return_value=['inst']), \
+                mock.patch.object(batch, 'compute_schedule', schedule), \
+                redirect_stdout(io.StringIO()):
+            jobs = run_batch(path, self.tmp_dir, cores, max_cores, PFOLIO,
+                             'chuffed', {'cop': ('', ''), 'csp': ('', '')},
+                             10, 60)
+        return jobs, sum(grown)
+
+    def test_budget(self):
+        jobs, grown = self.run_batch(['golomb.mzn'] * 5, 3, 2)
+        self.assertEqual([j.outcome for j in jobs], ['OPTIMAL'] * 5)
+        # While problems are waiting, each one runs on a single core, then
+        # the cores left are given to the last running portfolios.
+        self.assertEqual([j.cores for j in jobs[:3]], [1, 1, 1])
+        self.assertGreater(grown, 0)
+        self.assertTrue(all(j.cores <= 3 for j in jobs))
+
+    def test_max_cores(self):
+        jobs, _ = self.run_batch(['golomb.mzn', 'zebra.mzn'], 8, 2)
+        self.assertEqual([j.outcome for j in jobs], ['OPTIMAL', 'SATISFIED'])
+        self.assertTrue(all(j.cores <= len(PFOLIO) for j in jobs))
+
+
+if __name__ == '__main__':
+    unittest.main()
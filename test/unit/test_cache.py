@@ -0,0 +1,79 @@
+'''
+Tests of the caches of the files compiled by the solvers (see src/cache.py).
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+import cache
+from cache import FileCache, clone_file
+
+
+def compile_to(path, text):
+    """
+    Writes text at path as a compiler does, i.e., truncating the file in
+    place instead of replacing it.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    with os.fdopen(fd, 'w') as outfile:
+        outfile.write(text)
+
+
+def read(path):
+    with open(path, 'r') as infile:
+        return infile.read()
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = FileCache(self.tmp_dir + '/cache', 2**20)
+        # The file system does not support reflinks.
+        self.patch = mock.patch.object(
+            cache.fcntl, 'ioctl', side_effect=OSError('no reflinks')
+        )
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_clone_is_a_copy(self):
+        src = self.tmp_dir + '/src'
+        dst = self.tmp_dir + '/dst'
+        compile_to(src, 'model')
+        clone_file(src, dst)
+        self.assertEqual(read(dst), 'model')
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+        compile_to(dst, 'other model')
+        self.assertEqual(read(src), 'model')
+
+    def test_compile_twice(self):
+        fzn = self.tmp_dir + '/model.fzn'
+        ozn = self.tmp_dir + '/model.ozn'
+        files = {'.fzn': fzn, '.ozn': ozn}
+        # First compilation, then cached.
+        compile_to(fzn, 'fzn 1')
+        compile_to(ozn, 'ozn 1')
+        self.cache.put('key1', files)
+        # The cached files are cloned to the same paths, which are then
+        # overwritten by the compilation of another model.
+        self.assertTrue(self.cache.get('key1', files))
+        compile_to(fzn, 'fzn 2')
+        compile_to(ozn, 'ozn 2')
+        self.cache.put('key2', files)
+        for key, n in [('key1', '1'), ('key2', '2')]:
+            self.assertTrue(self.cache.get(key, files))
+            self.assertEqual(read(fzn), 'fzn ' + n)
+            self.assertEqual(read(ozn), 'ozn ' + n)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+'''
+Tests of the signatures of the MiniZinc libraries (see src/compilation.py).
+'''
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from compilation import lib_signature
+
+# Fake minizinc command, answering the queries of lib_signature.
+MINIZINC = '''#! /usr/bin/env python3
+import sys
+answers = {
+    '--version': %r,
+    '--config-dirs': %r,
+    '--solvers-json': %r
+}
+print(answers[sys.argv[1]])
+'''
+
+
+class TestLibSignature(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lib_dir = self.tmp_dir + '/lib'
+        os.makedirs(self.lib_dir + '/std')
+        os.makedirs(self.lib_dir + '/chuffed')
+        self.write(self.lib_dir + '/std/stdlib.mzn', 'std')
+        self.write(self.lib_dir + '/chuffed/redefs.mzn', 'redefs')
+        self.install('bin1', 'version 1')
+        self.install('bin2', 'version 2')
+        self.path = os.environ.get('PATH', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, path, text):
+        with open(path, 'w') as outfile:
+            outfile.write(text)
+
+    def install(self, name, version):
+        """
+        Installs a fake minizinc command in the folder name.
+        """
+        os.makedirs(self.tmp_dir + '/' + name)
+        solvers = [{'id': 'org.chuffed.chuffed', 'mznlib': '-Gchuffed'}]
+        path = self.tmp_dir + '/' + name + '/minizinc'
+        self.write(path, MINIZINC % (
+            version, json.dumps({'mznStdlibDir': self.lib_dir}),
+            json.dumps(solvers)
+        ))
+        os.chmod(path, 0o755)
+
+    def signature(self, name):
+        path = self.tmp_dir + '/' + name + os.pathsep + self.path
+        with mock.patch.dict(os.environ, {'PATH': path}):
+            return lib_signature('chuffed')
+
+    def test_unknown_solver(self):
+        path = self.tmp_dir + '/bin1' + os.pathsep + self.path
+        with mock.patch.dict(os.environ, {'PATH': path}):
+            self.assertIsNone(lib_signature('gecode'))
+
+    def test_minizinc_changed(self):
+        sig1 = self.signature('bin1')
+        self.assertIsNotNone(sig1)
+        self.assertEqual(self.signature('bin1'), sig1)
+        self.assertNotEqual(self.signature('bin2'), sig1)
+        self.assertEqual(self.signature('bin1'), sig1)
+
+    def test_library_changed(self):
+        sig1 = self.signature('bin1')
+        self.write(self.lib_dir + '/chuffed/redefs.mzn', 'new redefs')
+        sig2 = self.signature('bin1')
+        self.assertNotEqual(sig1, sig2)
+        self.write(self.lib_dir + '/std/new.mzn', '')
+        self.assertNotEqual(self.signature('bin1'), sig2)
+
+
+if __name__ == '__main__':
+    unittest.main()
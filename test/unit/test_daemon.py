@@ -0,0 +1,209 @@
+'''
+Tests of the daemon mode of sunny-cp (see src/daemon.py).
+'''
+
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import unittest
+import subprocess
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+from test_sunny_cp import EXAMPLES, FAKES, solutions, sunny_cp
+
+# Daemon whose jobs print the value of their first argument in a cache shared
+# with the daemon, after storing there their second argument (if any). The
+# jobs exit, read their standard input, print their working directory and
+# environment, fail, or wait if their first argument is a command.
+DAEMON = '''import os
+import sys
+import time
+sys.path.append(%r)
+from cache import Cache
+from daemon import serve, share
+CACHE = Cache()
+
+
+def job(args):
+    if args[0] == 'exit':
+        sys.exit(int(args[1]) if args[1:] else None)
+    if args[0] == 'stdin':
+        print(sys.stdin.read().upper(), end='')
+        print('error', file=sys.stderr)
+        return
+    if args[0] == 'env':
+        print(os.getcwd(), os.environ.get('SUNNY_TEST'))
+        return
+    if args[0] == 'fail':
+        raise ValueError('failed')
+    if args[0] == 'sleep':
+        print('sleeping', flush=True)
+        time.sleep(60)
+    print(args[0], CACHE.get(args[0]))
+    if len(args) > 1:
+        CACHE.put(args[0], args[1])
+        share('values', args[0], args[1])
+
+
+serve(sys.argv[1], job, {'values': CACHE})
+''' % (SUNNY_HOME + '/src')
+
+# Client sending its arguments to the daemon.
+CLIENT = '''import sys
+sys.path.append(%r)
+from daemon import run_client
+sys.exit(run_client(sys.argv[1], sys.argv[2:]))
+''' % (SUNNY_HOME + '/src')
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket = self.tmp_dir + '/daemon.sock'
+        self.daemon = subprocess.Popen(
+            [sys.executable, '-c', DAEMON, self.socket],
+            stdout=subprocess.DEVNULL
+        )
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.daemon.terminate()
+        self.daemon.wait()
+        shutil.rmtree(self.tmp_dir)
+
+    def client(self, *args):
+        """
+        Runs a job of the daemon, and returns the lines it prints.
+        """
+        out = subprocess.run(
+            [sys.executable, '-c', CLIENT, self.socket] + list(args),
+            stdout=subprocess.PIPE, timeout=30, check=True
+        ).stdout
+        return out.decode().splitlines()
+
+    def run_client(self, *args, **kwargs):
+        """
+        Runs a job of the daemon, and returns the completed client process.
+        """
+        return subprocess.run(
+            [sys.executable, '-c', CLIENT, self.socket] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30,
+            **kwargs
+        )
+
+    def test_shared_cache(self):
+        # The entries cached by a job are found by the next jobs.
+        self.assertEqual(self.client('a', 'x'), ['a None'])
+        self.assertEqual(self.client('a'), ['a x'])
+        self.assertEqual(self.client('b', 'y'), ['b None'])
+        self.assertEqual(self.client('a', 'z'), ['a x'])
+        self.assertEqual(self.client('a'), ['a z'])
+        self.assertEqual(self.client('b'), ['b y'])
+
+    def test_standard_fds(self):
+        # The job reads and writes on the standard streams of the client.
+        proc = self.run_client('stdin', input=b'line 1\nline 2\n')
+        self.assertEqual(proc.stdout.decode().splitlines(),
+                         ['LINE 1', 'LINE 2'])
+        self.assertEqual(proc.stderr.decode().splitlines(), ['error'])
+        self.assertEqual(proc.returncode, 0)
+
+    def test_cwd_and_env(self):
+        env = dict(os.environ, SUNNY_TEST='value')
+        proc = self.run_client('env', cwd=self.tmp_dir, env=env)
+        self.assertEqual(proc.stdout.decode().split(),
+                         [os.path.realpath(self.tmp_dir), 'value'])
+
+    def test_exit_status(self):
+        self.assertEqual(self.run_client('exit').returncode, 0)
+        self.assertEqual(self.run_client('exit', '0').returncode, 0)
+        self.assertEqual(self.run_client('exit', '3').returncode, 3)
+        proc = self.run_client('fail')
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn('ValueError: failed', proc.stderr.decode())
+
+    def test_signal_relayed(self):
+        # The job killed by a signal relayed by the client reports no exit
+        # status.
+        client = subprocess.Popen(
+            [sys.executable, '-c', CLIENT, self.socket, 'sleep'],
+            stdout=subprocess.PIPE
+        )
+        try:
+            self.assertEqual(client.stdout.readline(), b'sleeping\n')
+            client.send_signal(signal.SIGTERM)
+            self.assertEqual(client.wait(timeout=30), 1)
+        finally:
+            client.kill()
+            client.wait()
+            client.stdout.close()
+
+    def test_no_daemon(self):
+        # The client returns None if the daemon is not running.
+        self.daemon.terminate()
+        self.daemon.wait()
+        self.assertFalse(os.path.exists(self.socket))
+        proc = subprocess.run([
+            sys.executable, '-c', CLIENT.replace('sys.exit(', 'print('),
+            self.socket
+        ], stdout=subprocess.PIPE, timeout=30)
+        self.assertEqual(proc.stdout, b'None\n')
+
+
+class TestSunnyCpDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket = self.tmp_dir + '/daemon.sock'
+        self.env = dict(os.environ, PYTHONPATH=FAKES, FAKE_SPEED_chuffed='0.1')
+        self.env['PATH'] = FAKES + os.pathsep + os.environ.get('PATH', '')
+        self.daemon = subprocess.Popen([
+            sys.executable, SUNNY_HOME + '/bin/sunny-cp', '--daemon',
+            self.socket
+        ], stdout=subprocess.DEVNULL, env=self.env)
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.daemon.terminate()
+        self.daemon.wait()
+        shutil.rmtree(self.tmp_dir)
+
+    def client(self, args):
+        """
+        Solves a problem with the daemon, and returns the completed client
+        process.
+        """
+        return subprocess.run([
+            sys.executable, SUNNY_HOME + '/bin/sunny-cp-client', '--socket',
+            self.socket
+        ] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=self.env, timeout=60)
+
+    def test_same_output(self):
+        args = ['-a', '-P', 'chuffed,gecode', '-p', '2']
+        args += [EXAMPLES + 'golomb.mzn']
+        proc = self.client(args)
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(
+            solutions(proc.stdout.decode().splitlines()),
+            solutions(sunny_cp(args, FAKE_SPEED_chuffed='0.1'))
+        )
+
+    def test_usage_error(self):
+        proc = self.client(['-x', '0', EXAMPLES + 'golomb.mzn'])
+        self.assertEqual(proc.returncode, 2)
+        self.assertIn('Error!', proc.stderr.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+'''
+Tests of the FlatZinc models modified in place (see src/flatzinc.py).
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from flatzinc import FlatZincFile
+
+# FlatZinc model with output variables of each type.
+MODEL = '''var 1..3: c :: output_var;
+var 0..10: x :: output_var;
+var bool: b :: output_var;
+var float: f :: output_var;
+var set of 1..3: s :: output_var;
+var 0..10: y;
+array [1..2] of var 0..10: q :: output_array([1..2]) = [x,y];
+var 0..100: obj :: output_var;
+solve minimize obj;
+'''
+
+
+class TestFlatZincFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = self.tmp_dir + '/model.fzn'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def model(self, text=MODEL):
+        with open(self.path, 'w') as outfile:
+            outfile.write(text)
+        return FlatZincFile(self.path)
+
+    def test_equality_constraints(self):
+        cons = self.model().equality_constraints([
+            ('x', '4'), ('b', 'true'), ('f', '2'), ('s', '{1, 3}'),
+            ('q', 'array1d(1..2, [4, 5])'), ('z', '1')
+        ])
+        self.assertEqual(cons.splitlines(), [
+            'constraint int_eq(x,4);', 'constraint bool_eq(b,true);',
+            'constraint float_eq(f,2.0);', 'constraint set_eq(s,{1, 3});',
+            'constraint int_eq(x,4);', 'constraint int_eq(y,5);'
+        ])
+
+    def test_values_not_encoded(self):
+        # Enums and strings printed through the output model are ignored.
+        cons = self.model().equality_constraints([
+            ('c', 'Red'), ('x', '"4"'), ('b', '1'), ('s', '{Red}'),
+            ('q', 'array1d(1..2, [4, Blue])')
+        ])
+        self.assertEqual(cons, '')
+
+    def text(self):
+        with open(self.path) as infile:
+            return infile.read()
+
+    def test_set_bound(self):
+        # Each bound replaces the previous one, the added constraints stay.
+        fzn = self.model()
+        fzn.set_bound('constraint int_le(obj,50);\n')
+        fzn.add_constraints('constraint int_le(x,5);\n')
+        fzn.set_bound('constraint int_le(obj,40);\n')
+        fzn.set_bound('constraint int_le(obj,30);\n')
+        self.assertEqual(self.text(), MODEL.replace(
+            'solve', 'constraint int_le(x,5);\nconstraint int_le(obj,30);\n'
+            'solve'
+        ))
+
+    def test_no_trailing_newline(self):
+        fzn = self.model(MODEL.rstrip('\n'))
+        self.assertEqual(fzn.obj_var, 'obj')
+        fzn.set_bound('constraint int_le(obj,50);\n')
+        fzn.set_bound('constraint int_le(obj,40);\n')
+        self.assertTrue(self.text().endswith(
+            'constraint int_le(obj,40);\nsolve minimize obj;'
+        ))
+
+    def test_add_output_var(self):
+        # The annotation is added once, and the model stays consistent.
+        text = MODEL.replace('obj :: output_var;', 'obj;')
+        fzn = self.model(text)
+        self.assertTrue(fzn.add_output_var())
+        self.assertFalse(fzn.add_output_var())
+        fzn.set_bound('constraint int_le(obj,50);\n')
+        self.assertEqual(self.text(), MODEL.replace(
+            'solve', 'constraint int_le(obj,50);\nsolve'
+        ))
+        fzn = self.model()
+        self.assertFalse(fzn.add_output_var())
+        self.assertEqual(self.text(), MODEL)
+
+    def test_unshare(self):
+        # The other links of a shared model are not modified.
+        fzn = self.model()
+        link = self.tmp_dir + '/link.fzn'
+        os.link(self.path, link)
+        fzn.set_bound('constraint int_le(obj,50);\n')
+        with open(link) as infile:
+            self.assertEqual(infile.read(), MODEL)
+        self.assertEqual(os.stat(self.path).st_nlink, 1)
+        self.assertIn('constraint int_le(obj,50);', self.text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+'''
+Tests of the binary form of the knowledge bases and of their k-NN search (see
+src/knowledge_base.py).
+'''
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+import numpy
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from knowledge_base import KnowledgeBase, bin_path, bin_to_csv, csv_to_bin
+from balltree import build_balltree
+from ivf import build_ivf
+from scheduling import sunny_cop
+
+SOLVERS = ['chuffed', 'gecode', 'highs', 'ortools']
+
+
+def write_csv_kb(path, size, rng):
+    """
+    Writes at path a random COP knowledge base of the given size.
+    """
+    with open(path, 'w') as outfile:
+        for i in range(size):
+            features = [rng.random() for _ in range(5)]
+            info = dict((s, {
+                'time': rng.choice([rng.uniform(0, 1200), 1200.0]),
+                'score': rng.choice([0.0, 0.25, 0.75, 1.0, rng.random()]),
+                'area': rng.uniform(0, 1e5)
+            }) for s in SOLVERS)
+            outfile.write('inst%d|%s|%s\n' % (i, features, info))
+
+
+class TestBinaryKB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = self.tmp_dir + '/random_cop'
+        write_csv_kb(self.path, 300, random.Random(0))
+        self.csv_kb = KnowledgeBase(self.path)
+        csv_to_bin(self.path)
+        self.bin_kb = KnowledgeBase(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_tables_exact(self):
+        self.assertIsNotNone(self.bin_kb.tables)
+        idx = list(range(len(self.csv_kb)))
+        csv_nb = self.csv_kb.neighbourhood(idx)
+        bin_nb = self.bin_kb.neighbourhood(idx)
+        for field in ['time', 'score', 'area']:
+            self.assertEqual(
+                csv_nb.table(field, SOLVERS).tolist(),
+                bin_nb.table(field, SOLVERS).tolist()
+            )
+
+    def test_same_schedules(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            k = rng.randint(1, 20)
+            idx = rng.sample(range(len(self.csv_kb)), k)
+            pfolio = rng.sample(SOLVERS, rng.randint(2, len(SOLVERS)))
+            schedules = [
+                sunny_cop(kb.neighbourhood(idx), k, 1200, pfolio, pfolio[0], 1)
+                for kb in [self.csv_kb, self.bin_kb]
+            ]
+            self.assertEqual(schedules[0], schedules[1])
+
+    def test_csv_round_trip(self):
+        # The CSV file written back from the binary form is the same
+        # knowledge base, up to the formatting of its runtime information.
+        os.remove(self.path)
+        bin_to_csv(self.path)
+        shutil.rmtree(bin_path(self.path))
+        kb = KnowledgeBase(self.path)
+        self.assertEqual(kb.insts.tolist(), self.csv_kb.insts.tolist())
+        self.assertEqual(kb.features.tolist(), self.csv_kb.features.tolist())
+        for i in range(len(kb)):
+            self.assertEqual(kb.info(i), self.csv_kb.info(i))
+        csv_to_bin(self.path)
+        kb = KnowledgeBase(self.path)
+        for field in ['time', 'score', 'area']:
+            self.assertEqual(kb.tables[field].tolist(),
+                             self.bin_kb.tables[field].tolist())
+
+
+class TestBallTree(unittest.TestCase):
+
+    def test_same_as_scan(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = tmp_dir + '/random_cop'
+            write_csv_kb(path, 2000, random.Random(0))
+            csv_to_bin(path)
+            kb = KnowledgeBase(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertIsNotNone(kb.tree)
+        rng = random.Random(4)
+        for _ in range(50):
+            fv = [rng.random() for _ in range(5)]
+            k = rng.randint(1, 300)
+            self.assertEqual(kb.tree.query(kb.features, fv, k).tolist(),
+                             kb.scan(fv, k).tolist())
+
+    def test_ties(self):
+        # Rounded features have many instances at the same distance, which
+        # are taken by position as in the linear scan.
+        rng = numpy.random.default_rng(5)
+        features = rng.integers(0, 4, (1000, 3)).astype(float)
+        kb = KnowledgeBase.__new__(KnowledgeBase)
+        kb.features = features
+        kb.insts = ['inst%d' % i for i in range(len(features))]
+        tree = build_balltree(features)
+        for _ in range(50):
+            fv = rng.integers(0, 4, 3).astype(float)
+            k = int(rng.integers(1, 200))
+            self.assertEqual(tree.query(features, fv, k).tolist(),
+                             kb.scan(fv, k).tolist())
+
+
+class TestApproxKNN(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = self.tmp_dir + '/random_cop'
+        write_csv_kb(self.path, 2000, random.Random(0))
+        csv_to_bin(self.path)
+        self.exact_kb = KnowledgeBase(self.path)
+        build_ivf(self.exact_kb.features).save(bin_path(self.path))
+        self.kb = KnowledgeBase(self.path)
+        self.rng = random.Random(2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def feat_vector(self):
+        return [self.rng.random() for _ in range(5)]
+
+    def test_recall(self):
+        self.assertIsNotNone(self.kb.ivf)
+        recall = 0.0
+        for _ in range(100):
+            fv = self.feat_vector()
+            exact = self.kb.scan(fv, 10)
+            approx = self.kb.nearest(fv, 10, approx=True)
+            self.assertEqual(len(approx), 10)
+            dist = numpy.linalg.norm(self.kb.features[approx] - fv, axis=1)
+            self.assertTrue((numpy.diff(dist) >= 0).all())
+            recall += len(numpy.intersect1d(exact, approx)) / 10.0
+        self.assertGreaterEqual(recall / 100, 0.95)
+
+    def test_exact_without_approx(self):
+        for _ in range(20):
+            fv = self.feat_vector()
+            self.assertEqual(self.kb.nearest(fv, 10).tolist(),
+                             self.kb.scan(fv, 10).tolist())
+
+    def test_exact_without_index(self):
+        # With no approximate index, -N approx falls back to the exact k-NN.
+        self.assertIsNone(self.exact_kb.ivf)
+        for _ in range(20):
+            fv = self.feat_vector()
+            self.assertEqual(
+                self.exact_kb.nearest(fv, 10, approx=True).tolist(),
+                self.exact_kb.scan(fv, 10).tolist()
+            )
+
+    def test_exact_small_kb(self):
+        # All the clusters are scanned when k covers the knowledge base.
+        path = self.tmp_dir + '/small_cop'
+        write_csv_kb(path, 30, random.Random(3))
+        csv_to_bin(path)
+        build_ivf(KnowledgeBase(path).features).save(bin_path(path))
+        kb = KnowledgeBase(path)
+        self.assertIsNotNone(kb.ivf)
+        for k in [30, 50]:
+            fv = self.feat_vector()
+            self.assertEqual(kb.nearest(fv, k, approx=True).tolist(),
+                             kb.scan(fv, k).tolist())
+
+    def test_exact_all_clusters(self):
+        # Probing all the clusters gives the exact k-NN, ties included.
+        ivf = self.kb.ivf
+        for _ in range(20):
+            fv = self.feat_vector()
+            self.assertEqual(
+                ivf.query(self.kb.features, fv, 10,
+                          ivf.params['nlist']).tolist(),
+                self.kb.scan(fv, 10).tolist()
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+'''
+Tests of the generation of the default portfolio (see solvers/make_pfolio.py)
+with the fake solvers in the fakes folder.
+'''
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+FAKES = SUNNY_HOME + '/test/unit/fakes'
+sys.path.append(SUNNY_HOME + '/src')
+sys.path.append(SUNNY_HOME + '/solvers')
+import compilation
+import make_pfolio
+
+
+class TestMakePfolio(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.solvers_path = self.tmp_dir + '/solvers/'
+        os.mkdir(self.solvers_path)
+        shutil.copy(SUNNY_HOME + '/solvers/constraint.mzn', self.solvers_path)
+        self.add_solver('chuffed', ['chuffed'])
+        self.add_solver('gecode', ['gecode', 'gecode-lns'])
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                'PATH': FAKES + os.pathsep + os.environ.get('PATH', '')
+            }),
+            mock.patch.object(make_pfolio, 'solvers_path', self.solvers_path),
+            mock.patch.object(
+                make_pfolio, 'pfolio_path', self.tmp_dir + '/pfolio_solvers.py'
+            ),
+            mock.patch.object(
+                make_pfolio, 'CACHE_PATH', self.tmp_dir + '/pfolio_cache.db'
+            )
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def add_solver(self, solver, ids):
+        """
+        Writes the .solv file of solver, with a version for each id.
+        """
+        with open(self.solvers_path + solver + '.solv', 'w') as outfile:
+            json.dump({'versions': [{
+                'id': i, 'name': i.capitalize(), 'conv_opts': '',
+                'solv_opts': '-f' if i.endswith('lns') else ''
+            } for i in ids]}, outfile)
+
+    def make_pfolio(self):
+        """
+        Runs make_pfolio.py, and returns the pair (probed, pfolio) where
+        probed is the number of solvers probed and pfolio the generated
+        DEF_PFOLIO dictionary.
+        """
+        # The outputs of minizinc are not remembered across the runs.
+        compilation.MINIZINC_OUTPUTS.clear()
+        compilation.LIB_SIGNATURES.clear()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            make_pfolio.main()
+        probed = [
+            line for line in out.getvalue().splitlines()
+            if line.startswith('Probed ')
+        ]
+        pfolio = {}
+        with open(make_pfolio.pfolio_path) as infile:
+            exec(infile.read(), pfolio)
+        return int(probed[0].split()[1]), pfolio['DEF_PFOLIO']
+
+    def test_pfolio(self):
+        probed, pfolio = self.make_pfolio()
+        # A solver is probed once, whatever the number of its versions.
+        self.assertEqual(probed, 2)
+        self.assertEqual(sorted(pfolio), ['chuffed', 'gecode', 'gecode-lns'])
+        self.assertEqual(pfolio['gecode-lns'], {
+            'solver': 'gecode', 'name': 'Gecode-lns', 'conv_opts': '',
+            'solv_opts': '-f',
+            'constraint': 'constraint int_lin_le([1,-1],[LHS,RHS],-1)'
+        })
+
+    def test_cached_constraints(self):
+        _, pfolio = self.make_pfolio()
+        self.assertEqual(self.make_pfolio(), (0, pfolio))
+        # Only the new solvers are probed.
+        self.add_solver('highs', ['highs'])
+        probed, pfolio = self.make_pfolio()
+        self.assertEqual(probed, 1)
+        self.assertEqual(pfolio['highs']['constraint'],
+                         pfolio['chuffed']['constraint'])
+        # All the solvers are probed again if constraint.mzn changes.
+        with open(self.solvers_path + 'constraint.mzn', 'a') as outfile:
+            outfile.write('% Changed.\n')
+        self.assertEqual(self.make_pfolio()[0], 3)
+
+    def test_changed_library(self):
+        self.make_pfolio()
+        # A new version of minizinc changes the signatures of the libraries
+        # of all the solvers.
+        with mock.patch.dict(os.environ, {'FAKE_VERSION': '2.8.0'}):
+            self.assertEqual(self.make_pfolio()[0], 2)
+            self.assertEqual(self.make_pfolio()[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
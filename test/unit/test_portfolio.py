@@ -0,0 +1,269 @@
+'''
+Tests of the asyncio Portfolio (see src/portfolio.py), compared with the event
+loop of bin/sunny-cp on the fake solvers in the fakes folder.
+'''
+
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+FAKES = SUNNY_HOME + '/test/unit/fakes'
+# The fake portfolio is found before the one of the installation.
+sys.path.insert(0, FAKES)
+sys.path.append(SUNNY_HOME + '/src')
+import portfolio
+from portfolio import Portfolio
+from parsing import get_solve
+from problem import Problem
+from cache import FileCache
+from timeline import Timeline, read_events
+from test_sunny_cp import EXAMPLES, sunny_cp
+
+
+def outcome(lines):
+    """
+    Returns a pair (solutions, complete) where solutions is the list of the
+    solutions in the output lines of sunny-cp, each one a list of lines, and
+    complete is True iff the search is complete.
+    """
+    solutions = []
+    solution = []
+    for line in lines:
+        if line.startswith('%') or line == '==========':
+            continue
+        if line == '----------':
+            if solution not in solutions:
+                solutions.append(solution)
+            solution = []
+        else:
+            solution.append(line)
+    return solutions, '==========' in lines
+
+
+class FakeSolver:
+    """
+    Stub of a RunningSolver in the schedule of a Portfolio.
+    """
+
+    process = None
+
+    def __init__(self, name, timeout):
+        self.solver = name
+        self.timeout = timeout
+
+    def name(self):
+        return self.solver
+
+
+class TestPortfolio(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {
+            'PATH': FAKES + os.pathsep + os.environ.get('PATH', '')
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def solve(self, model, pfolio, cores=None, later=None, **kwargs):
+        """
+        Solves model with a Portfolio running the solvers of pfolio on the
+        given cores (by default, a core per solver). If pfolio is None, the
+        schedule is given by later, a pair (delay, schedule). Returns the
+        Portfolio and the lines it prints.
+        """
+        mzn_path = EXAMPLES + model
+        problem = Problem(
+            mzn_path, '', self.tmp_dir + '/model.ozn', get_solve(mzn_path)
+        )
+        schedule = None
+        if pfolio is not None:
+            schedule = [(s, float('+inf')) for s in pfolio]
+        pf = Portfolio(schedule, cores or len(pfolio), **kwargs)
+
+        async def solve():
+            if later:
+                loop.call_later(later[0], pf.extend, later[1])
+            return [sol.output() async for sol in pf.solve(problem)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            outputs = loop.run_until_complete(solve())
+        finally:
+            loop.close()
+        return pf, ''.join(outputs).splitlines()
+
+    def trace(self, *args, **kwargs):
+        """
+        Solves as solve, recording the events of the Portfolio on a timeline.
+        Returns the lines printed and the list of the events.
+        """
+        timeline = Timeline()
+        timeline.open(self.tmp_dir + '/trace.jsonl')
+        try:
+            _, lines = self.solve(*args, timeline=timeline, **kwargs)
+        finally:
+            timeline.close()
+        return lines, read_events(self.tmp_dir + '/trace.jsonl')
+
+    def compare(self, model, all_opt, **env):
+        """
+        Checks that Portfolio and sunny-cp have the same outcome, when
+        running chuffed and gecode on two cores.
+        """
+        args = ['-P', 'chuffed,gecode', '-p', '2', EXAMPLES + model]
+        if all_opt:
+            args.insert(0, '-a')
+        expected = outcome(sunny_cp(args, **env))
+        with mock.patch.dict(os.environ, env):
+            _, lines = self.solve(
+                model, ['chuffed', 'gecode'], all_opt=all_opt
+            )
+        self.assertEqual(outcome(lines), expected)
+        return expected
+
+    def test_cop(self):
+        solutions, complete = self.compare(
+            'golomb.mzn', True, FAKE_SPEED_chuffed='0.1'
+        )
+        self.assertEqual(len(solutions), 15)
+        self.assertTrue(complete)
+
+    def test_csp(self):
+        for all_opt in [True, False]:
+            solutions, complete = self.compare('zebra.mzn', all_opt)
+            self.assertEqual(len(solutions), 2 if all_opt else 1)
+
+    def test_failure(self):
+        self.compare(
+            'golomb.mzn', True, FAKE_SPEED_gecode='0.1', FAKE_FAIL_chuffed='1'
+        )
+
+    def test_line_limit(self):
+        # The solver printing a too long line is killed, the others go on.
+        with mock.patch.object(portfolio, 'LINE_LIMIT', 1024), \
+                mock.patch.dict(os.environ, {
+                    'FAKE_LONG_chuffed': '4096', 'FAKE_SPEED_gecode': '0.1'
+                }):
+            _, lines = self.solve('golomb.mzn', ['chuffed', 'gecode'])
+        self.assertEqual(lines[-2:], ['----------', '=========='])
+
+    def test_max_restarts(self):
+        # Chuffed is killed at its first restart, and its core is not given
+        # to HiGHS.
+        options = {'chuffed': {'restart_time': 0, 'max_restarts': 0}}
+        with mock.patch.dict(os.environ, {
+            'FAKE_SPEED_gecode': '0.5', 'FAKE_SPEED_chuffed': '2'
+        }):
+            pf, lines = self.solve(
+                'golomb.mzn', ['gecode', 'chuffed', 'highs'], cores=2,
+                options=options, all_opt=True
+            )
+        self.assertEqual(lines[-1], '==========')
+        self.assertEqual([s.name() for s in pf.pending], ['Highs'])
+
+    def test_check_solvers(self):
+        env = {'FAKE_SPEED_chuffed': '0.1'}
+        check = {'Chuffed': 'gecode'}
+        with mock.patch.dict(os.environ, env):
+            _, lines = self.solve(
+                'golomb.mzn', ['chuffed'], check=check, all_opt=True
+            )
+        self.assertEqual(lines[-4:], [
+            'x = 2;', 'q = array1d(1..2, [1, 2]);', '----------', '=========='
+        ])
+        self.assertEqual(outcome(lines), outcome(sunny_cp(
+            ['-P', 'chuffed', '-p', '1', '-a', '--check-solvers',
+             'chuffed,gecode', EXAMPLES + 'golomb.mzn'], **env
+        )))
+        # The inconsistent solution is not accepted, and its solver is
+        # killed.
+        with mock.patch.dict(os.environ, dict(env, FAKE_BAD='2')):
+            _, lines = self.solve(
+                'golomb.mzn', ['chuffed'], check=check, all_opt=True
+            )
+        self.assertNotIn('==========', lines)
+        self.assertNotIn('q = array1d(1..2, [1, 2]);', lines)
+        # A failure of the trusted solver does not reject the solutions.
+        with mock.patch.dict(os.environ, dict(env, FAKE_FAIL_gecode='1')):
+            _, lines = self.solve(
+                'golomb.mzn', ['chuffed'], check=check, all_opt=True
+            )
+        self.assertEqual(lines.count('----------'), 15)
+        self.assertEqual(lines[-1], '==========')
+
+    def test_static_schedule(self):
+        # Gecode is suspended at its timeout and resumed when the schedule
+        # is given, without converting the model again.
+        lines, events = self.trace(
+            'golomb.mzn', None, cores=1, later=(1, [('gecode', 10)]),
+            static=[('gecode', 0.5)], all_opt=True,
+            options={'gecode': {'wait_time': 0}}
+        )
+        self.assertEqual(lines[-1], '==========')
+        self.assertEqual(len(outcome(lines)[0]), 15)
+        names = [e['event'] for e in events if e['track'] == 'Gecode']
+        self.assertEqual(names.count('compile'), 1)
+        self.assertEqual(names.count('search'), 1)
+        self.assertLess(names.index('suspend'), names.index('resume'))
+
+    def test_shared_compilation(self):
+        # Two solvers with the same flattening signature share a single
+        # conversion, which is cached for the next portfolios.
+        pfolio = dict(portfolio.DEF_PFOLIO['gecode'], name='Gecode2')
+        cache = FileCache(self.tmp_dir + '/fzn', 2**20)
+        with mock.patch.dict(portfolio.DEF_PFOLIO, {'gecode2': pfolio}):
+            lines, events = self.trace(
+                'zebra.mzn', ['gecode', 'gecode2'], fzn_cache=cache
+            )
+            self.assertEqual(lines[-1], '----------')
+            compiles = [e for e in events if e['event'] == 'compile']
+            self.assertEqual(len(compiles), 2)
+            self.assertEqual(
+                [e.get('shared', False) for e in compiles], [False, True]
+            )
+            lines, events = self.trace(
+                'zebra.mzn', ['gecode', 'gecode2'], fzn_cache=cache
+            )
+            self.assertEqual(lines[-1], '----------')
+            self.assertFalse([e for e in events if e['event'] == 'compile'])
+
+    def test_mem_limit(self):
+        # The solver using the most memory is killed, and the other one goes
+        # on alone.
+        usage = {}
+
+        def mem_percent(pid):
+            return usage.setdefault(pid, 40 + len(usage))
+
+        with mock.patch.object(portfolio, 'mem_percent', mem_percent), \
+                mock.patch.object(portfolio, 'MEM_CHECK_TIME', 0.1):
+            pf, lines = self.solve(
+                'golomb.mzn', ['chuffed', 'gecode'], mem_limit=50,
+                all_opt=True
+            )
+        self.assertEqual(lines[-1], '==========')
+        self.assertEqual(len(pf.oom), 1)
+        self.assertEqual(len(outcome(lines)[0]), 15)
+
+    def test_timeout_same_solver(self):
+        # The solver keeps running, without extending its timeout.
+        pf = Portfolio([], 1)
+        solver = FakeSolver('Chuffed', 5)
+        pf.tasks = {solver: None}
+        pf.pending = [FakeSolver('Chuffed', 10), FakeSolver('Gecode', 10)]
+        self.assertFalse(pf.timeout(solver))
+        self.assertEqual(solver.timeout, 5)
+        self.assertEqual([s.name() for s in pf.pending], ['Gecode'])
+
+
+if __name__ == '__main__':
+    unittest.main()
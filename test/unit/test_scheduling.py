@@ -0,0 +1,183 @@
+'''
+Tests of the SUNNY schedules (see src/scheduling.py), compared with a plain
+implementation of SUNNY algorithm that scans all the sub-portfolios and sums
+the runtime information with sum.
+'''
+
+import os
+import sys
+import random
+import unittest
+import numpy
+from itertools import combinations
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from knowledge_base import Neighbourhood
+from scheduling import sunny_csp, sunny_cop
+
+SOLVERS = ['chuffed', 'gecode', 'highs', 'ortools', 'choco', 'cplex']
+
+
+def ref_csp(infos, k, timeout, pfolio, backup, min_size):
+    """
+    Reference SUNNY schedule of a CSP, where infos is the list of the runtime
+    information of the neighbours.
+    """
+    solved = dict((s, set()) for s in pfolio)
+    times = dict((s, 0.0) for s in pfolio)
+    for inst, info in enumerate(infos):
+        for s in pfolio:
+            if info[s]['time'] < timeout:
+                solved[s].add(inst)
+            times[s] += info[s]['time']
+    max_solved = 0
+    min_time = float('+inf')
+    best_pfolio = []
+    for i in range(min_size, len(pfolio) + 1):
+        old_pfolio = best_pfolio
+        for sub_pfolio in combinations(pfolio, i):
+            num_solved = len(set().union(*[solved[s] for s in sub_pfolio]))
+            solving_time = sum([times[s] for s in sub_pfolio])
+            if num_solved > max_solved or \
+               num_solved == max_solved and solving_time < min_time:
+                min_time = solving_time
+                max_solved = num_solved
+                best_pfolio = list(sub_pfolio)
+        if old_pfolio == best_pfolio:
+            break
+    n = sum([len(solved[s]) for s in best_pfolio]) + (k - max_solved)
+    schedule = {}
+    for s in best_pfolio:
+        ns = len(solved[s])
+        if ns == 0 or round(timeout / n * ns) == 0:
+            continue
+        schedule[s] = timeout / n * ns
+    tot_time = sum(schedule.values())
+    if round(tot_time) < timeout:
+        if backup in schedule:
+            schedule[backup] += timeout - tot_time
+        else:
+            schedule[backup] = timeout - tot_time
+    return sorted(list(schedule.items()), key=lambda x: times[x[0]])
+
+
+def ref_cop(infos, k, timeout, pfolio, backup, min_size):
+    """
+    Reference SUNNY schedule of a COP, where infos is the list of the runtime
+    information of the neighbours.
+    """
+    scores = dict((s, []) for s in pfolio)
+    times = dict((s, 0.0) for s in pfolio)
+    areas = dict((s, 0.0) for s in pfolio)
+    for info in infos:
+        for s in pfolio:
+            scores[s].append(info[s]['score'])
+            times[s] += info[s]['time']
+            areas[s] += info[s]['area']
+    max_score = 0
+    min_time = float('+inf')
+    min_area = float('+inf')
+    best_pfolio = []
+    for i in range(min_size, len(pfolio) + 1):
+        old_pfolio = best_pfolio
+        for sub_pfolio in combinations(pfolio, i):
+            score = 0
+            for h in range(0, k):
+                score += max([scores[s][h] for s in sub_pfolio])
+            time = sum([times[s] for s in sub_pfolio])
+            area = sum([areas[s] for s in sub_pfolio])
+            if score > max_score or \
+               score == max_score and time < min_time or \
+               score == max_score and time == min_time and area < min_area:
+                min_time = time
+                min_area = area
+                max_score = score
+                best_pfolio = list(sub_pfolio)
+        if old_pfolio == best_pfolio:
+            break
+    n = sum([sum(scores[s]) for s in best_pfolio]) + (k - max_score)
+    schedule = {}
+    for s in best_pfolio:
+        ns = sum(scores[s])
+        if ns == 0 or round(timeout / n * ns) == 0:
+            continue
+        schedule[s] = timeout / n * ns
+    tot_time = sum(schedule.values())
+    if round(tot_time) < timeout:
+        if backup in schedule:
+            schedule[backup] += timeout - tot_time
+        else:
+            schedule[backup] = timeout - tot_time
+    return sorted(list(schedule.items()), key=lambda x: times[x[0]])
+
+
+def random_infos(k, rng):
+    """
+    Returns the runtime information of k random neighbours. The values are
+    often repeated, so that many sub-portfolios are tied.
+    """
+    times = [0.1, 0.3, 0.7, 1.1, 1200.0]
+    scores = [0.0, 0.1, 0.25, 0.3, 0.75, 1.0]
+    return [dict((s, {
+        'time': rng.choice(times + [rng.uniform(0, 1200)]),
+        'score': rng.choice(scores + [rng.random()]),
+        'area': rng.choice([0.1, 0.2, rng.uniform(0, 1e5)])
+    }) for s in SOLVERS) for _ in range(k)]
+
+
+def neighbourhood(infos):
+    """
+    Returns the Neighbourhood with the runtime information infos.
+    """
+    tables = dict((field, numpy.array(
+        [[info[s][field] for info in infos] for s in SOLVERS]
+    )) for field in ['time', 'score', 'area'])
+    return Neighbourhood(list(range(len(infos))), SOLVERS, tables)
+
+
+class TestSchedules(unittest.TestCase):
+
+    def check(self, sunny, ref, seed):
+        rng = random.Random(seed)
+        for _ in range(200):
+            k = rng.randint(1, 40)
+            infos = random_infos(k, rng)
+            pfolio = rng.sample(SOLVERS, rng.randint(1, len(SOLVERS)))
+            min_size = rng.randint(1, len(pfolio))
+            args = (k, 1200, pfolio, pfolio[0], min_size)
+            self.assertEqual(
+                sunny(neighbourhood(infos), *args), ref(infos, *args)
+            )
+
+    def test_csp(self):
+        self.check(sunny_csp, ref_csp, 0)
+
+    def test_cop(self):
+        self.check(sunny_cop, ref_cop, 1)
+
+    def test_cop_bound(self):
+        # The first solver has the best score on all the neighbours but one,
+        # where the second solver is better by a few ULPs: the search cannot
+        # stop after the first cardinality.
+        rng = random.Random(2)
+        pfolio = SOLVERS[:2]
+        for _ in range(200):
+            k = rng.randint(9, 30)
+            infos = random_infos(k, rng)
+            for info in infos:
+                info[pfolio[0]]['score'] = rng.random()
+                info[pfolio[1]]['score'] = 0.0
+            info = rng.choice(infos)
+            score = info[pfolio[0]]['score']
+            for _ in range(rng.randint(1, 3)):
+                score = float(numpy.nextafter(score, 2))
+            info[pfolio[1]]['score'] = score
+            args = (k, 1200, pfolio, pfolio[0], 1)
+            self.assertEqual(
+                sunny_cop(neighbourhood(infos), *args), ref_cop(infos, *args)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
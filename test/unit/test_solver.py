@@ -0,0 +1,55 @@
+'''
+Tests of the splitting of the output of a solver into lines (see
+src/solver.py).
+'''
+
+import os
+import sys
+import unittest
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+from solver import LineBuffer, parse_assignment
+
+
+class TestLineBuffer(unittest.TestCase):
+
+    def test_chunks(self):
+        # A line read in several chunks is returned once complete.
+        buf = LineBuffer()
+        buf.feed(b'x = 1;\nq = arr')
+        self.assertEqual(buf.lines(), [b'x = 1;'])
+        buf.feed(b'ay1d(1..2, ')
+        self.assertEqual(buf.lines(), [])
+        buf.feed(b'[4, 5]);\n----------\n')
+        self.assertEqual(
+            buf.lines(), [b'q = array1d(1..2, [4, 5]);', b'----------']
+        )
+        self.assertEqual(buf.lines(), [])
+
+    def test_partial_line_at_eof(self):
+        buf = LineBuffer()
+        buf.feed(b'----------\n==========')
+        self.assertEqual(buf.lines(), [b'----------'])
+        self.assertEqual(buf.lines(eof=True), [b'=========='])
+        # A terminated last line does not add an empty line.
+        buf.feed(b'----------\n')
+        self.assertEqual(buf.lines(eof=True), [b'----------'])
+        self.assertEqual(buf.lines(eof=True), [])
+
+    def test_long_line(self):
+        # A line much longer than the chunks is not lost, also at EOF.
+        line = b'x = array1d(1..100000, [' + b'1, ' * 100000 + b'1]);'
+        for eof in [False, True]:
+            buf = LineBuffer()
+            for i in range(0, len(line), 4096):
+                buf.feed(line[i:i + 4096])
+                self.assertEqual(buf.lines(), [])
+            if not eof:
+                buf.feed(b'\n')
+            self.assertEqual(buf.lines(eof), [line])
+            self.assertEqual(parse_assignment(line)[0], 'x')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+'''
+End-to-end tests of bin/sunny-cp, run with the fake solvers in the fakes
+folder (see fakes/minizinc).
+'''
+
+import os
+import sys
+import shutil
+import signal
+import time
+import tempfile
+import threading
+import unittest
+import subprocess
+import importlib.util
+from unittest import mock
+from importlib.machinery import SourceFileLoader
+import psutil
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+FAKES = SUNNY_HOME + '/test/unit/fakes'
+EXAMPLES = SUNNY_HOME + '/test/examples/'
+# The fake portfolio is found before the one of the installation.
+sys.path.insert(0, FAKES)
+sys.path.append(SUNNY_HOME + '/src')
+from features import mzn2feat
+from parsing import get_solve
+from problem import Problem
+
+
+def sunny_cp(args, **env):
+    """
+    Runs sunny-cp with the given arguments and the fake solvers, whose
+    behaviour is set by the variables env, and returns the lines it prints.
+    """
+    env = dict(os.environ, **env)
+    # The fake portfolio is found before the one of the installation.
+    env['PYTHONPATH'] = FAKES
+    env['PATH'] = FAKES + os.pathsep + env.get('PATH', '')
+    out = subprocess.run(
+        [sys.executable, SUNNY_HOME + '/bin/sunny-cp'] + args, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60
+    ).stdout
+    return out.decode().splitlines()
+
+
+def load_sunny_cp():
+    """
+    Imports (once) bin/sunny-cp as a module, with the fake portfolio and
+    without changing the signal handlers of the caller.
+    """
+    if 'sunny_cp' in sys.modules:
+        return sys.modules['sunny_cp']
+    if FAKES not in sys.path:
+        sys.path.insert(0, FAKES)
+    sigs = [signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGQUIT]
+    handlers = [signal.getsignal(sig) for sig in sigs]
+    loader = SourceFileLoader('sunny_cp', SUNNY_HOME + '/bin/sunny-cp')
+    module = importlib.util.module_from_spec(
+        importlib.util.spec_from_loader('sunny_cp', loader)
+    )
+    try:
+        loader.exec_module(module)
+        sys.modules['sunny_cp'] = module
+        return module
+    finally:
+        for sig, handler in zip(sigs, handlers):
+            signal.signal(sig, handler)
+
+
+def solutions(lines):
+    """
+    Returns the lines of the solutions, without the comments.
+    """
+    return [line for line in lines if not line.startswith('%')]
+
+
+class TestCheckSolvers(unittest.TestCase):
+
+    def run_checked(self, model, all_opt, **env):
+        args = ['-P', 'chuffed', '-p', '1']
+        args += ['--check-solvers', 'chuffed,gecode']
+        if all_opt:
+            args.append('-a')
+        env['FAKE_SPEED_chuffed'] = '0.1'
+        return solutions(sunny_cp(args + [EXAMPLES + model], **env))
+
+    def test_cop_completed(self):
+        for all_opt in [True, False]:
+            lines = self.run_checked('golomb.mzn', all_opt)
+            self.assertEqual(lines[-4:], [
+                'x = 2;', 'q = array1d(1..2, [1, 2]);', '----------',
+                '=========='
+            ])
+            self.assertEqual(lines.count('=========='), 1)
+
+    def test_csp_completed(self):
+        lines = self.run_checked('zebra.mzn', True)
+        self.assertEqual(lines[-4:], [
+            'x = 4;', 'q = array1d(1..2, [4, 6]);', '----------', '=========='
+        ])
+
+    def test_inconsistent_solution(self):
+        for all_opt in [True, False]:
+            lines = self.run_checked('golomb.mzn', all_opt, FAKE_BAD='2')
+            self.assertNotIn('==========', lines)
+            self.assertNotIn('q = array1d(1..2, [1, 2]);', lines)
+
+    def test_check_unavailable(self):
+        # The solutions are accepted unchecked, but not silently.
+        args = ['-P', 'chuffed', '-p', '1', '-a']
+        args += ['--check-solvers', 'chuffed,gecode']
+        lines = sunny_cp(
+            args + [EXAMPLES + 'golomb.mzn'], FAKE_SPEED_chuffed='0.1',
+            FAKE_FAIL_gecode='1'
+        )
+        self.assertIn(
+            '% Warning! Check of Chuffed solution unavailable: gecode failed',
+            lines
+        )
+        lines = solutions(lines)
+        self.assertEqual(lines.count('----------'), 15)
+        self.assertEqual(lines[-1], '==========')
+
+
+class TestCompileAhead(unittest.TestCase):
+
+    def setUp(self):
+        self.sunny_cp = load_sunny_cp()
+        self.pfolio = self.sunny_cp.DEF_PFOLIO
+        self.background = {}
+        for s in ['chuffed', 'gecode', 'highs']:
+            signature = self.sunny_cp.flattening_signature(self.pfolio[s])
+            self.background[s] = (
+                self.pfolio[s], self.sunny_cp.psutil.Popen(['sleep', '60'])
+            )
+            self.sunny_cp.BACKGROUND[signature] = self.background[s]
+
+    def tearDown(self):
+        for _, proc in self.background.values():
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        self.sunny_cp.BACKGROUND.clear()
+
+    def test_no_idle_core(self):
+        # The conversions no longer fitting in the idle cores are killed,
+        # starting from the solvers not expected to run.
+        upcoming = [self.pfolio['gecode'], self.pfolio['chuffed']]
+        self.sunny_cp.compile_ahead(upcoming, None, 1)
+        running = [
+            s for s, (_, proc) in self.background.items()
+            if proc.poll() is None
+        ]
+        self.assertEqual(running, ['gecode'])
+        self.assertEqual(list(self.sunny_cp.BACKGROUND.values()), [
+            self.background['gecode']
+        ])
+        self.sunny_cp.compile_ahead(upcoming, None, 0)
+        self.assertEqual(self.sunny_cp.BACKGROUND, {})
+        self.assertIsNotNone(self.background['gecode'][1].poll())
+
+
+class TestCheckCopies(unittest.TestCase):
+
+    def setUp(self):
+        self.sunny_cp = load_sunny_cp()
+        self.tmp_dir = tempfile.mkdtemp()
+        path = self.tmp_dir + '/model.fzn'
+        with open(path, 'w') as outfile:
+            outfile.write('var 0..100: obj :: output_var;\n')
+            outfile.write('solve minimize obj;\n')
+        self.model = self.sunny_cp.FlatZincFile(path)
+
+    def tearDown(self):
+        self.sunny_cp.CHECK_COPIES.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_copies_reused(self):
+        # Each check running in parallel takes its own copy of the model,
+        # which is reused by the next checks.
+        copy1 = self.sunny_cp.check_copy('gecode', self.model)
+        copy2 = self.sunny_cp.check_copy('gecode', self.model)
+        self.assertNotEqual(copy1.path, copy2.path)
+        copy1.set_bound('constraint int_eq(obj,3);\n')
+        self.sunny_cp.CHECK_COPIES['gecode'].append(copy1)
+        copy3 = self.sunny_cp.check_copy('gecode', self.model)
+        self.assertIs(copy3, copy1)
+        copy3.set_bound('constraint int_eq(obj,4);\n')
+        with open(copy3.path) as infile:
+            self.assertEqual(infile.read().splitlines(), [
+                'var 0..100: obj :: output_var;', 'constraint int_eq(obj,4);',
+                'solve minimize obj;'
+            ])
+        with open(self.model.path) as infile:
+            self.assertNotIn('int_eq', infile.read())
+
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.sunny_cp = load_sunny_cp()
+        self.sunny_cp.init_events()
+
+    def tearDown(self):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        selector = self.sunny_cp.SELECTOR
+        for key in list(selector.get_map().values()):
+            selector.unregister(key.fileobj)
+            os.close(key.fd)
+        selector.close()
+        os.close(self.sunny_cp.WAKEUP_FD)
+
+    def wait(self, timeout):
+        """
+        Returns the time waited by wait_event, within the given timeout.
+        """
+        start = time.time()
+        self.sunny_cp.wait_event(None, 100, start + timeout)
+        return time.time() - start
+
+    def test_child_exit(self):
+        # The termination of a child process wakes up the main loop.
+        proc = subprocess.Popen(['sleep', '0.2'])
+        try:
+            self.assertLess(self.wait(10), 5)
+        finally:
+            proc.wait()
+        self.assertEqual(proc.returncode, 0)
+
+    def test_wake_up(self):
+        timer = threading.Timer(0.2, self.sunny_cp.wake_up)
+        timer.start()
+        try:
+            self.assertLess(self.wait(10), 5)
+        finally:
+            timer.join()
+
+    def test_deadline(self):
+        # Pending wake-ups are drained, so the next wait lasts until the
+        # deadline.
+        for _ in range(3):
+            self.sunny_cp.wake_up()
+        self.assertLess(self.wait(10), 5)
+        self.assertGreaterEqual(self.wait(0.3), 0.25)
+
+
+class TestExtractionTime(unittest.TestCase):
+
+    def setUp(self):
+        # A fake mzn2feat, whose extraction never ends.
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(self.tmp_dir + '/mzn2feat', 'w') as outfile:
+            outfile.write('#! /bin/sh\n')
+            outfile.write('sleep 60 &\necho $! > %s/pid\nwait\n' % (
+                self.tmp_dir
+            ))
+            outfile.write('echo 1,2,3\n')
+        os.chmod(self.tmp_dir + '/mzn2feat', 0o755)
+        self.path = self.tmp_dir + os.pathsep + os.environ.get('PATH', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_extraction_killed(self):
+        mzn_path = EXAMPLES + 'golomb.mzn'
+        problem = Problem(
+            mzn_path, '', self.tmp_dir + '/model.ozn', get_solve(mzn_path)
+        )
+        with mock.patch.dict(os.environ, {'PATH': self.path}):
+            start = time.time()
+            self.assertEqual(mzn2feat.extract(problem, 1), [])
+        self.assertLess(time.time() - start, 10)
+        # The process tree of the extractor is killed.
+        with open(self.tmp_dir + '/pid') as infile:
+            pid = int(infile.read())
+        try:
+            status = psutil.Process(pid).status()
+        except psutil.NoSuchProcess:
+            status = psutil.STATUS_DEAD
+        self.assertIn(status, [psutil.STATUS_DEAD, psutil.STATUS_ZOMBIE])
+
+    def test_backup_solvers(self):
+        # When the extraction budget expires, the backup solvers are run.
+        start = time.time()
+        lines = sunny_cp([
+            '-x', '1', '-P', 'chuffed,gecode', '-p', '1',
+            EXAMPLES + 'golomb.mzn'
+        ], PATH=self.path, FAKE_SPEED_chuffed='0.1')
+        self.assertLess(time.time() - start, 30)
+        self.assertIn('% Features extraction timed out!', lines)
+        lines = solutions(lines)
+        self.assertEqual(lines[-2:], ['----------', '=========='])
+
+    def test_bad_budget(self):
+        lines = sunny_cp(['-x', '0', EXAMPLES + 'golomb.mzn'])
+        self.assertEqual(lines, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
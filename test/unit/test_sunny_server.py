@@ -0,0 +1,134 @@
+'''
+Tests of the /process requests of the sunny-cp server (see
+src/sunny_server.py), solved by a Portfolio with the fake solvers in the fakes
+folder.
+'''
+
+import os
+import sys
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+FAKES = SUNNY_HOME + '/test/unit/fakes'
+# The fake portfolio is found before the one of the installation.
+sys.path.insert(0, FAKES)
+sys.path.append(SUNNY_HOME + '/src')
+import sunny_server
+from test_sunny_cp import EXAMPLES
+
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        sunny_server.start_loop()
+        cls.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), sunny_server.MyServer
+        )
+        cls.url = 'http://127.0.0.1:%d/process' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        sunny_server.LOOP.call_soon_threadsafe(sunny_server.LOOP.stop)
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {
+            'PATH': FAKES + os.pathsep + os.environ.get('PATH', ''),
+            'FAKE_SPEED_chuffed': '0.1'
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def process(self, model, fields):
+        """
+        Posts the (name, value) pairs of fields and the model to /process,
+        and returns the pair (status, lines) of the response.
+        """
+        boundary = 'sunny-cp-boundary'
+        with open(EXAMPLES + model, 'rb') as infile:
+            fields = fields + [('mzn', infile.read())]
+        body = b''
+        for name, value in fields:
+            if isinstance(value, str):
+                value = value.encode()
+            body += (
+                '--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n'
+                % (boundary, name)
+            ).encode() + value + b'\r\n'
+        body += ('--%s--\r\n' % boundary).encode()
+        request = urllib.request.Request(self.url, body, {
+            'Content-Type': 'multipart/form-data; boundary=' + boundary
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read().decode().splitlines()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode().splitlines()
+
+    def test_process(self):
+        status, lines = self.process('golomb.mzn', [
+            ('-P', 'chuffed,gecode'), ('-p', '2'), ('-a', '')
+        ])
+        self.assertEqual(status, 200)
+        self.assertIn('% SUNNY parallel schedule: ' + str([
+            ('chuffed', float('+inf')), ('gecode', float('+inf'))
+        ]), lines)
+        self.assertEqual(lines.count('----------'), 15)
+        self.assertEqual(lines[-3:], [
+            'q = array1d(1..2, [1, 2]);', '----------', '=========='
+        ])
+
+    def test_concurrent_requests(self):
+        # The requests are solved at the same time by the same event loop.
+        outcomes = []
+
+        def process():
+            outcomes.append(self.process('zebra.mzn', [
+                ('-P', 'gecode'), ('-p', '1')
+            ]))
+
+        threads = [threading.Thread(target=process) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for status, lines in outcomes:
+            self.assertEqual(status, 200)
+            self.assertEqual(lines[-2:], ['q = array1d(1..2, [4, 5]);',
+                                          '----------'])
+
+    def test_check_solvers(self):
+        status, lines = self.process('golomb.mzn', [
+            ('-P', 'chuffed'), ('-p', '1'),
+            ('--check-solvers', 'chuffed,gecode')
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(lines[-2:], ['----------', '=========='])
+
+    def test_timeout(self):
+        # The output so far is sent when the timeout expires.
+        with mock.patch.dict(os.environ, {'FAKE_SPEED_chuffed': '10'}):
+            status, lines = self.process('golomb.mzn', [
+                ('-P', 'chuffed'), ('-p', '1'), ('-T', '3')
+            ])
+        self.assertEqual(status, 200)
+        self.assertIn('----------', lines)
+        self.assertNotIn('==========', lines)
+
+    def test_bad_arguments(self):
+        status, lines = self.process('golomb.mzn', [('-p', 'x')])
+        self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
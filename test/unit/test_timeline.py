@@ -0,0 +1,148 @@
+'''
+Tests of the traces of the sunny-cp runs (see src/timeline.py and the --trace
+option of sunny-cp).
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+import timeline
+from timeline import Timeline, read_events, span_times, summary
+from test_sunny_cp import EXAMPLES, solutions, sunny_cp
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def record(self, path, close=True):
+        """
+        Records at path the trace of a run where chuffed is compiled and finds
+        two solutions, while the features are extracted. Returns the events
+        read from the trace.
+        """
+        clock = [100.0]
+        tl = Timeline()
+        with mock.patch.object(timeline.time, 'time', lambda: clock[0]):
+            tl.open(path)
+            tl.event('presolve', span='presolve')
+            tl.event('compile', 'chuffed', span='compile')
+            clock[0] += 1
+            tl.event('extraction', 'features', span='features')
+            clock[0] += 1
+            tl.event('search', 'chuffed', span='search')
+            tl.event('neighbours', 'features', span='', found=True)
+            clock[0] += 0.5
+            tl.event('solution', 'chuffed', objective=10)
+            clock[0] += 1.5
+            tl.event('solution', 'chuffed', objective=7)
+            tl.event('exit', 'chuffed', span='', status='completed')
+            tl.waited = 2.5
+            if close:
+                tl.close()
+            else:
+                tl.file.flush()
+        return read_events(path)
+
+    def test_formats(self):
+        # JSON lines and Chrome traces have the same events.
+        events = self.record(self.tmp_dir + '/trace.jsonl')
+        self.assertEqual(self.record(self.tmp_dir + '/trace.json'), events)
+        self.assertEqual([
+            (e['event'], e['track'], e['time']) for e in events
+        ], [
+            ('presolve', 'sunny-cp', 0), ('compile', 'chuffed', 0),
+            ('extraction', 'features', 1), ('search', 'chuffed', 2),
+            ('neighbours', 'features', 2), ('solution', 'chuffed', 2.5),
+            ('solution', 'chuffed', 4), ('exit', 'chuffed', 4),
+            ('end', 'sunny-cp', 4)
+        ])
+        self.assertEqual(events[-1]['waited'], 2.5)
+        self.assertEqual(events[5]['objective'], 10)
+        self.assertNotIn('span', events[5])
+
+    def test_interrupted(self):
+        # The trace of an interrupted run is read up to its last event.
+        events = self.record(self.tmp_dir + '/trace.json', close=False)
+        self.assertEqual(events[-1]['event'], 'exit')
+        self.assertEqual(len(events), 8)
+
+    def test_span_times(self):
+        events = self.record(self.tmp_dir + '/trace.jsonl')
+        self.assertEqual(span_times(events), {
+            'sunny-cp': {'presolve': 4},
+            'chuffed': {'compile': 2, 'search': 2},
+            'features': {'features': 1}
+        })
+
+    def test_summary(self):
+        events = self.record(self.tmp_dir + '/trace.jsonl')
+        self.assertEqual(summary(events), [
+            'Total time: 4.000 s',
+            'First solution: 2.500 s by chuffed (objective 10)',
+            'Last solution: 4.000 s by chuffed (objective 7)',
+            'Solutions: 2',
+            'Waiting for events: 2.500 s',
+            'Time by span:',
+            '  presolve          4.000 s',
+            '  compile           2.000 s',
+            '  search            2.000 s',
+            '  features          1.000 s',
+            'Time by track:',
+            '  chuffed: compile 2.000 s, search 2.000 s',
+            '  features: features 1.000 s',
+            '  sunny-cp: presolve 4.000 s'
+        ])
+        self.assertEqual(summary([]), ['Empty trace'])
+
+    def test_disabled(self):
+        tl = Timeline()
+        tl.event('solution', 'chuffed')
+        tl.close()
+        self.assertIsNone(tl.file)
+
+    def test_sunny_cp(self):
+        # The solutions of the run are in its trace, which is summarized by
+        # the command python src/timeline.py.
+        for name in ['trace.jsonl', 'trace.json']:
+            path = self.tmp_dir + '/' + name
+            lines = sunny_cp([
+                '-a', '-P', 'chuffed,gecode', '-p', '2', '--trace', path,
+                EXAMPLES + 'golomb.mzn'
+            ], FAKE_SPEED_chuffed='0.1')
+            self.assertEqual(solutions(lines).count('----------'), 15)
+            events = read_events(path)
+            found = [e for e in events if e['event'] == 'solution']
+            self.assertEqual(len(found), 15)
+            self.assertEqual(found[-1]['objective'], 2)
+            self.assertEqual(events[-1]['event'], 'end')
+            self.assertIn('search', span_times(events)['Chuffed'])
+            out = subprocess.run(
+                [sys.executable, SUNNY_HOME + '/src/timeline.py', path],
+                stdout=subprocess.PIPE, check=True, timeout=30
+            ).stdout.decode().splitlines()
+            self.assertEqual(out, summary(events))
+            self.assertIn('Solutions: 15', out)
+
+    def test_usage(self):
+        proc = subprocess.run(
+            [sys.executable, SUNNY_HOME + '/src/timeline.py'],
+            stdout=subprocess.PIPE, timeout=30
+        )
+        self.assertEqual(proc.returncode, 2)
+        self.assertIn(b'Usage: python timeline.py <TRACE>', proc.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+'''
+Tests of the coalescing of the solutions printed by sunny-cp (see
+src/writer.py and the --coalesce-time option).
+'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+SUNNY_HOME = os.path.realpath(__file__).split('/')[:-3]
+SUNNY_HOME = '/'.join(SUNNY_HOME)
+sys.path.append(SUNNY_HOME + '/src')
+import writer
+from writer import SolutionWriter
+from test_sunny_cp import EXAMPLES, sunny_cp, solutions
+
+
+class TestSolutionWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.set_blocking(self.rfd, False)
+        self.now = 100.0
+        self.time = mock.patch.object(
+            writer.time, 'time', lambda: self.now
+        )
+        self.time.start()
+
+    def tearDown(self):
+        self.time.stop()
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def written(self):
+        try:
+            return os.read(self.rfd, 1 << 16).decode()
+        except BlockingIOError:
+            return ''
+
+    def test_window(self):
+        out = SolutionWriter(self.wfd, 1)
+        out.write([('obj', '10')], coalesce=True)
+        self.assertEqual(out.deadline(), float('+inf'))
+        # The solutions found within the window are coalesced.
+        self.now += 0.5
+        out.write([('obj', '9')], coalesce=True)
+        out.write([('obj', '8')], coalesce=True)
+        self.assertEqual(out.deadline(), 101)
+        out.flush()
+        self.assertEqual(self.written(), 'obj = 10;\n----------\n')
+        # The latest one is written when the window expires.
+        self.now += 0.5
+        out.flush()
+        self.assertEqual(self.written(), 'obj = 8;\n----------\n')
+        self.assertEqual(out.deadline(), float('+inf'))
+
+    def test_forced_flush(self):
+        out = SolutionWriter(self.wfd, 1)
+        out.write([('obj', '10')], coalesce=True)
+        out.write([('obj', '9')], coalesce=True)
+        out.flush(force=True)
+        out.write([], ['=========='])
+        self.assertEqual(
+            self.written(),
+            'obj = 10;\n----------\nobj = 9;\n----------\n==========\n'
+        )
+
+    def test_no_window(self):
+        # Without window, or without coalesce, each solution is written.
+        out = SolutionWriter(self.wfd, 0)
+        out.write([('obj', '10')], coalesce=True)
+        out.write([('obj', '9')], coalesce=True)
+        out = SolutionWriter(self.wfd, 1)
+        out.write([('x', '3')])
+        out.write([('x', '4')])
+        self.assertEqual(
+            self.written(),
+            'obj = 10;\n----------\nobj = 9;\n----------\n'
+            'x = 3;\n----------\nx = 4;\n----------\n'
+        )
+
+    def test_sunny_cp(self):
+        # The optimal solution is printed before ==========.
+        lines = solutions(sunny_cp([
+            '-P', 'chuffed', '-p', '1', '-a', '--coalesce-time', '10',
+            EXAMPLES + 'golomb.mzn'
+        ], FAKE_SPEED_chuffed='0.1'))
+        self.assertEqual(lines[:2], ['x = 0;', 'q = array1d(1..2, [1, 100]);'])
+        self.assertEqual(lines[-4:], [
+            'x = 2;', 'q = array1d(1..2, [1, 2]);', '----------', '=========='
+        ])
+        self.assertLess(lines.count('----------'), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()